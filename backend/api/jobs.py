@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Final, Optional
+import os
+import shutil
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Calculations run at the same time, the rest wait in the queue
+JOB_WORKERS: Final = int(os.environ.get('CG_JOB_WORKERS', 2))
+# Jobs queued or running before new submissions are turned away (429)
+MAX_QUEUED_JOBS: Final = int(os.environ.get('CG_MAX_QUEUED_JOBS', 16))
+# Seconds a finished job and its result are kept for retrieval
+JOB_RETENTION_SECONDS: Final = int(
+    os.environ.get('CG_JOB_RETENTION_SECONDS', 15 * 60))
+
+JOB_QUEUED: Final = 'queued'
+JOB_RUNNING: Final = 'running'
+JOB_DONE: Final = 'done'
+JOB_FAILED: Final = 'failed'
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its limit"""
+
+
+class Job:
+    """A submitted calculation and what a client may poll for"""
+
+    def __init__(self, job_id: str, work_dir: str):
+        self.job_id = job_id
+        # Uploads, intermediate files and the result zip live here
+        self.work_dir = work_dir
+        self.status = JOB_QUEUED
+        self.progress = 0.0
+        self.step = 'Queued'
+        self.error: Optional[str] = None
+        self.result_path: Optional[str] = None
+        self.finished_at: Optional[float] = None
+
+    def update(self, progress: float, step: Optional[str] = None) -> None:
+        """Report progress, as a fraction of the whole job"""
+        self.progress = min(max(progress, 0.0), 1.0)
+        if step is not None:
+            self.step = step
+
+    def to_dict(self) -> dict:
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'progress': round(self.progress * 100, 1),
+            'step': self.step,
+            'error': self.error
+        }
+
+
+class JobQueue:
+    """Bounded pool running calculations in the background.
+
+    Jobs get a working directory that is removed, result included, once
+    the job has been finished for JOB_RETENTION_SECONDS.
+    """
+
+    def __init__(
+        self, workers: int = JOB_WORKERS, max_queued: int = MAX_QUEUED_JOBS,
+        retention_seconds: int = JOB_RETENTION_SECONDS
+    ):
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix='cg_job')
+        self._max_queued = max_queued
+        self._retention_seconds = retention_seconds
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(
+        self, work_dir: str, run: Callable[[Job], str]
+    ) -> Job:
+        """Queue `run(job)`, which returns the path of the result zip.
+
+        Raises QueueFullError (and removes `work_dir`) when too many jobs
+        are already queued or running.
+        """
+        self._expire()
+        with self._lock:
+            active = sum(
+                job.status in (JOB_QUEUED, JOB_RUNNING)
+                for job in self._jobs.values())
+            if active >= self._max_queued:
+                shutil.rmtree(work_dir, ignore_errors=True)
+                raise QueueFullError(
+                    f"Too many jobs in progress ({active}), retry later")
+            job = Job(uuid.uuid4().hex, work_dir)
+            self._jobs[job.job_id] = job
+
+        self._executor.submit(self._run, job, run)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._expire()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job, run: Callable[[Job], str]) -> None:
+        job.status = JOB_RUNNING
+        job.update(0.0, 'Starting')
+        try:
+            job.result_path = run(job)
+            job.update(1.0, 'Complete')
+            job.status = JOB_DONE
+        except Exception as e:
+            logger.error(f"Job {job.job_id} failed: {e}")
+            job.error = str(e)
+            job.step = 'Failed'
+            job.status = JOB_FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self._retention_seconds
+        with self._lock:
+            expired = [
+                job for job in self._jobs.values()
+                if job.finished_at is not None and job.finished_at < cutoff
+            ]
+            for job in expired:
+                del self._jobs[job.job_id]
+        for job in expired:
+            shutil.rmtree(job.work_dir, ignore_errors=True)
@@ -0,0 +1,149 @@
+from typing import BinaryIO, Final, Iterable, Union
+from contextlib import nullcontext
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_DIR: Final = os.environ.get(
+    'CG_RESULT_CACHE_DIR',
+    os.path.join(tempfile.gettempdir(), 'cg_result_cache'))
+# Total size of cached results, least recently used go first, 0 disables
+RESULT_CACHE_MAX_BYTES: Final = int(
+    os.environ.get('CG_RESULT_CACHE_MAX_BYTES', 512 << 20))
+# Bump when the calculation output changes, so older results are not served
+RESULT_FORMAT_VERSION: Final = 2
+
+HASH_BLOCK_SIZE: Final = 1 << 20
+
+
+class ResultCache:
+    """Result zips on local disk, addressed by a hash of the inputs.
+
+    Recency is tracked through the files' modification times, which a hit
+    refreshes, so the cache survives restarts and can be shared by
+    processes using the same directory.
+    """
+
+    def __init__(
+        self, directory: str = RESULT_CACHE_DIR,
+        max_bytes: int = RESULT_CACHE_MAX_BYTES
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(
+        input_files: Iterable[Union[str, BinaryIO, None]], settings: dict
+    ) -> str:
+        """Hash of the input files' contents (paths or binary streams,
+        None for an absent file) and the settings affecting the result.
+        Streams are rewound after reading"""
+        digest = hashlib.sha256()
+        digest.update(f"v{RESULT_FORMAT_VERSION}\0".encode())
+        for input_file in input_files:
+            if input_file is None:
+                digest.update(b'-\0')
+                continue
+            file_digest = hashlib.sha256()
+            with nullcontext(input_file) if hasattr(input_file, 'read') \
+                    else open(input_file, 'rb') as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                    file_digest.update(block)
+            if hasattr(input_file, 'seek'):
+                input_file.seek(0)
+            digest.update(file_digest.digest())
+        digest.update(json.dumps(settings, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def get(self, key: str, dest: BinaryIO) -> bool:
+        """Copy the cached result for `key` into `dest` if there is one"""
+        if not self.enabled:
+            return False
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                shutil.copyfileobj(f, dest)
+            # Mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return False
+
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def put(self, key: str, result: BinaryIO) -> None:
+        """Store a result (read from the start of `result`, which is left
+        at its end), then evict the least recently used results until the
+        cache fits its size bound"""
+        if not self.enabled:
+            return
+        temp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Copied under a temporary name so readers never see a partial file
+            fd, temp_path = tempfile.mkstemp(
+                dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                result.seek(0)
+                shutil.copyfileobj(result, f)
+            os.replace(temp_path, self._path(key))
+            temp_path = None
+            self._evict()
+        except OSError as e:
+            logger.warning(f"Could not cache result {key}: {e}")
+            if temp_path is not None:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'max_bytes': self.max_bytes
+            }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.zip")
+
+    def _evict(self) -> None:
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.zip'):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            with self._lock:
+                self.evictions += 1
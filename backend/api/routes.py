@@ -1,13 +1,23 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, url_for
+from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 import tempfile
 import os
+import io
+import json
 import shutil
-from processors.capital_gains import CGProcessor
-from processors.dividends import DividendProcessor
+import time
 from processors.base import TransactionProcessor
+from processors.pipeline import ReportPipeline, CapitalGainsReport, DividendsReport
+from processors.utils.fmv_index import FMVIndex
+from processors.utils.columnar_input import ColumnarInput, FORMAT_CSV
+from processors.utils.run_profile import RunProfile
 import zipfile
-from .utils import validate_file_type, sanitize_config_input, cleanup_after_delay
+from contextlib import nullcontext
+from typing import BinaryIO, Callable, Optional, Union
+from .utils import validate_file_type, sanitize_config_input
+from .jobs import Job, JobQueue, QueueFullError, JOB_DONE
+from .result_cache import ResultCache
 import logging
 
 logger = logging.getLogger(__name__)
@@ -15,142 +25,316 @@ logger = logging.getLogger(__name__)
 api_bp = Blueprint('api', __name__)
 
 
-@api_bp.route('/calculate', methods=['POST'])
-def calculate_capital_gains_and_dividends():
-    try:
-        # Handle file uploads
-        transactions_file = request.files.get('transactions_file')
-        fmv_file = request.files.get('fmv_file')
-        tax_rates_file = request.files.get('tax_rates_file')
+CSV_MIME_TYPES = {'text/csv', 'application/csv', 'text/plain'}
+JSON_MIME_TYPES = {'application/json', 'text/json'}
 
-        # Validate file types using magic numbers
-        csv_mime_types = {'text/csv', 'application/csv', 'text/plain'}
-        json_mime_types = {'application/json', 'text/json'}
+# Fractions of a job's progress reached at each stage
+PROGRESS_LOADED = 0.1
+PROGRESS_MATCHED = 0.85
+PROGRESS_DIVIDENDS = 0.9
 
-        if not transactions_file:
-            raise ValueError("Transactions file not provided")
+# Settings that change the result, part of the result cache key
+RESULT_SETTINGS = (
+    'same_source_only', 'simple_fifo_mode', 'ltcg_threshold_days',
+    'include_dividends'
+)
 
-        if not validate_file_type(transactions_file, csv_mime_types):
-            raise ValueError("Invalid file type for transactions file")
+# Results up to this size are built in memory, larger ones spill to disk
+RESULT_SPOOL_BYTES = 32 << 20
 
-        if fmv_file and not validate_file_type(fmv_file, csv_mime_types):
-            raise ValueError("Invalid file type for FMV file")
+job_queue = JobQueue()
+result_cache = ResultCache()
 
-        if tax_rates_file and not validate_file_type(tax_rates_file, json_mime_types):
-            raise ValueError("Invalid file type for tax rates file")
 
-        # Extract configuration parameters
-        verbose_setting = sanitize_config_input(
-            request.form.get('verbose', 'false'), 'bool'
-        )
+def _read_settings(form) -> dict:
+    """Extract and validate the configuration parameters of a request"""
+    settings = dict(
+        verbose=sanitize_config_input(form.get('verbose', 'false'), 'bool'),
+        same_source_only=sanitize_config_input(
+            form.get('sameSourceOnly', 'false'), 'bool'),
+        simple_fifo_mode=sanitize_config_input(
+            form.get('simpleFifoMode', 'true'), 'bool'),
+        include_dividends=sanitize_config_input(
+            form.get('includeDividends', 'false'), 'bool'),
+        ltcg_threshold_days=sanitize_config_input(
+            value=form.get('ltcgThresholdDays', 365),
+            param_type='int',
+            min_val=1,
+            max_val=3650
+        ),
+        workers=sanitize_config_input(
+            value=form.get('workers', 1),
+            param_type='int',
+            min_val=1,
+            max_val=os.cpu_count() or 1
+        ),
+        profile=sanitize_config_input(form.get('profile', 'false'), 'bool')
+    )
 
-        same_source_only_setting = sanitize_config_input(
-            request.form.get('sameSourceOnly', 'false'), 'bool'
-        )
+    print(
+        f"Settings: verbose_setting:{settings['verbose']}, \nsame_source_only_setting: {settings['same_source_only']}, \nsimple_fifo_mode_setting:{settings['simple_fifo_mode']} \nltcg_threshold_days:{settings['ltcg_threshold_days']} \nworkers:{settings['workers']}")
+    return settings
 
-        simple_fifo_mode_setting = sanitize_config_input(
-            request.form.get('simpleFifoMode', 'true'), 'bool'
-        )
 
-        include_dividends = sanitize_config_input(
-            request.form.get('includeDividends', 'false'), 'bool'
-        )
+def _upload_inputs(files) -> dict:
+    """Validate the uploaded files, returning their streams"""
+    transactions_file = files.get('transactions_file')
+    fmv_file = files.get('fmv_file')
+    tax_rates_file = files.get('tax_rates_file')
 
-        ltcg_threshold_days = sanitize_config_input(
-            value=request.form.get('ltcgThresholdDays', 365),
-            param_type='int',
-            min_val=1,
-            max_val=3650
-        )
+    if not transactions_file:
+        raise ValueError("Transactions file not provided")
+
+    # Validate file types using magic numbers
+    if not validate_file_type(transactions_file, CSV_MIME_TYPES) and \
+            ColumnarInput.detect_format(transactions_file.stream) == FORMAT_CSV:
+        raise ValueError("Invalid file type for transactions file")
 
-        print(
-            f"Settings: verbose_setting:{verbose_setting}, \nsame_source_only_setting: {same_source_only_setting}, \nsimple_fifo_mode_setting:{simple_fifo_mode_setting} \nltcg_threshold_days:{ltcg_threshold_days}")
+    if fmv_file and not validate_file_type(fmv_file, CSV_MIME_TYPES):
+        raise ValueError("Invalid file type for FMV file")
 
-        # Copy ZIP outside temp directory
-        result_fd, result_path = tempfile.mkstemp(
-            suffix='.zip', prefix='capital_gains_')
-        os.close(result_fd)
+    if tax_rates_file and not validate_file_type(tax_rates_file, JSON_MIME_TYPES):
+        raise ValueError("Invalid file type for tax rates file")
 
-        # Save uploaded files temporarily
-        with tempfile.TemporaryDirectory() as temp_dir:
+    return dict(
+        transactions=transactions_file,
+        fmv=fmv_file or None,
+        tax_rates=tax_rates_file or None
+    )
+
+
+def _save_uploads(files, dest_dir: str) -> dict:
+    """Validate the uploaded files and save them into `dest_dir`, for
+    calculations outliving the request"""
+    inputs = _upload_inputs(files)
+    for name, upload in inputs.items():
+        if upload is not None:
             # Use secure_filename for all uploads
-            transactions_filename = secure_filename(transactions_file.filename)
-
-            transactions_path = os.path.join(
-                temp_dir, transactions_filename)
-            transactions_file.save(transactions_path)
-
-            fmv_path = 'Grandfathered_ISIN_Prices.csv'  # Default
-            if fmv_file:
-                fmv_filename = secure_filename(fmv_file.filename)
-                fmv_path = os.path.join(temp_dir, fmv_filename)
-                fmv_file.save(fmv_path)
-
-            tax_rates_file_path = ''  # Default
-            if tax_rates_file:
-                tax_rates_filename = secure_filename(
-                    tax_rates_file.filename)
-                tax_rates_file_path = os.path.join(
-                    temp_dir, tax_rates_filename)
-                tax_rates_file.save(tax_rates_file_path)
-
-            cg_output_path = os.path.join(temp_dir, 'capital_gains.csv')
-            dividend_output_path = os.path.join(temp_dir, 'dividends.csv')
-
-            TransactionProcessor.check_files(
-                transactions_data_file=transactions_path,
-                output_file=cg_output_path,
-                overwrite=True
-            )
-
-            transactions_df = TransactionProcessor.initialize_data(
-                transactions_data_file=transactions_path,
-                fmv_data_file=fmv_path
-            )
-
-            # Process using existing CGCalculator
-            CGProcessor.process_all_transactions(
-                transactions_df=transactions_df,
-                output_file=cg_output_path,
-                overwrite=True,
-                fmv_data_file=fmv_path,
-                tax_rates_file=tax_rates_file_path,
-                verbose=verbose_setting,
-                same_source_only_matching=same_source_only_setting,
-                simple_fifo_mode=simple_fifo_mode_setting,
-                ltcg_threshold_days=ltcg_threshold_days
-            )
-            files_to_zip = [('capital_gains.csv', cg_output_path)]
+            inputs[name] = os.path.join(
+                dest_dir, f"{name}_{secure_filename(upload.filename)}")
+            upload.save(inputs[name])
+    return inputs
+
+
+def _stream(input_file: Union[str, FileStorage]):
+    """Binary stream of an input, a saved path or an upload"""
+    return input_file if isinstance(input_file, str) else input_file.stream
+
+
+def _zip_entry(filename: str) -> zipfile.ZipInfo:
+    return zipfile.ZipInfo(filename, date_time=time.localtime()[:6])
+
+
+def _calculate(
+    inputs: dict, settings: dict, result: BinaryIO,
+    progress: Optional[Callable[[float, str], None]] = None
+) -> Optional[RunProfile]:
+    """Run the calculation, writing the results zip into `result`.
+
+    `inputs` holds the transactions, FMV and tax rates files, as uploads or
+    saved paths (None when not given). `progress(fraction, step)` is called
+    as the calculation advances.
+
+    With the `profile` setting, the run's stage timings and counters are
+    added to the zip as profile.json and returned. Such runs always
+    calculate, bypassing the result cache.
+    """
+    def report(fraction: float, step: str = None) -> None:
+        if progress is not None:
+            progress(fraction, step)
+
+    transactions = _stream(inputs['transactions'])
+    fmv = inputs['fmv'] and _stream(inputs['fmv'])
+    tax_rates = inputs['tax_rates'] and _stream(inputs['tax_rates'])
+    default_fmv_path = 'Grandfathered_ISIN_Prices.csv'
+
+    profile = RunProfile() if settings.get('profile') else None
+
+    # Identical inputs and settings give an identical result
+    cache_key = None
+    if result_cache.enabled and profile is None:
+        cache_key = ResultCache.key(
+            [
+                transactions,
+                fmv or (default_fmv_path if os.path.isfile(
+                    default_fmv_path) else None),
+                tax_rates
+            ],
+            {name: settings[name] for name in RESULT_SETTINGS}
+        )
+        if result_cache.get(cache_key, result):
+            logger.info(f"Serving cached result {cache_key}")
+            return None
+
+    report(0.0, 'Loading transaction data...')
+    with profile.stage('load_fmv') if profile is not None else nullcontext():
+        if fmv is not None:
+            fmv_mapping = FMVIndex.for_upload(fmv)
+        else:
+            # Parsed once per server process (and kept in a sidecar
+            # file for the next start)
+            fmv_mapping = TransactionProcessor.load_fmv_mapping(
+                default_fmv_path, sidecar=True)
+
+    transactions_df = TransactionProcessor.initialize_data(
+        transactions_data_file=transactions,
+        fmv_data_file=default_fmv_path,
+        fmv_mapping=fmv_mapping,
+        profile=profile
+    )
+
+    report(PROGRESS_LOADED, 'Processing company transactions...')
 
+    def companies_progress(companies_done: int, company_count: int) -> None:
+        report(PROGRESS_LOADED + (PROGRESS_MATCHED - PROGRESS_LOADED)
+               * companies_done / max(company_count, 1),
+               f"Processed {companies_done} of {company_count} companies...")
+
+    def consumer_started(consumer) -> None:
+        if isinstance(consumer, DividendsReport):
+            report(PROGRESS_MATCHED, 'Processing dividends...')
+
+    # The capital gains report is written straight into its zip entry
+    with zipfile.ZipFile(result, 'w') as zip_file:
+        with io.TextIOWrapper(
+            zip_file.open(_zip_entry('capital_gains.csv'), 'w'),
+            encoding='utf-8'
+        ) as cg_output:
+            pipeline = ReportPipeline(profile)
+            pipeline.register(CapitalGainsReport(
+                output_file=cg_output,
+                tax_rates_file=tax_rates or '',
+                verbose=settings['verbose'],
+                same_source_only_matching=settings['same_source_only'],
+                simple_fifo_mode=settings['simple_fifo_mode'],
+                ltcg_threshold_days=settings['ltcg_threshold_days'],
+                workers=settings['workers'],
+                progress=companies_progress
+            ))
             # Process dividends if requested
-            if include_dividends:
-                DividendProcessor.process_all_transactions(
-                    transactions_df=transactions_df,
-                    output_file=dividend_output_path,
-                    overwrite=True
-                )
-                files_to_zip.append(
-                    ('dividends.csv', dividend_output_path))
-
-            # Create ZIP file
-            zip_path = os.path.join(temp_dir, 'results.zip')
-            with zipfile.ZipFile(zip_path, 'w') as zip_file:
-                for filename, filepath in files_to_zip:
-                    if os.path.exists(filepath):
-                        zip_file.write(filepath, filename)
-
-            shutil.copy2(zip_path, result_path)
-
-            # Return results file
-            response = send_file(
-                result_path,
-                as_attachment=True,
-                download_name='capital_gains_results.zip',
-                mimetype='application/zip'
-            )
-            cleanup_after_delay(result_path)
-            return response
+            if settings['include_dividends']:
+                dividend_output = io.StringIO()
+                summary_output = io.StringIO()
+                pipeline.register(DividendsReport(
+                    output_file=dividend_output,
+                    summary_file=summary_output
+                ))
+            pipeline.run(transactions_df, consumer_started)
+
+        # Nothing is written without dividends, leave the entries out
+        if settings['include_dividends'] and dividend_output.tell():
+            zip_file.writestr(
+                _zip_entry('dividends.csv'), dividend_output.getvalue())
+            zip_file.writestr(
+                _zip_entry('dividends_summary.csv'), summary_output.getvalue())
+
+        report(PROGRESS_DIVIDENDS, 'Generating results...')
+
+        if profile is not None:
+            zip_file.writestr(
+                _zip_entry('profile.json'),
+                json.dumps(profile.to_dict(), indent=2))
+
+    if cache_key is not None:
+        result_cache.put(cache_key, result)
+    return profile
+
+
+@api_bp.route('/calculate', methods=['POST'])
+def calculate_capital_gains_and_dividends():
+    result = None
+    try:
+        settings = _read_settings(request.form)
+        inputs = _upload_inputs(request.files)
+
+        # Held in memory unless large, and removed once sent
+        result = tempfile.SpooledTemporaryFile(max_size=RESULT_SPOOL_BYTES)
+        profile = _calculate(inputs, settings, result)
+        result.seek(0)
+
+        # Return results file
+        response = send_file(
+            result,
+            as_attachment=True,
+            download_name='capital_gains_results.zip',
+            mimetype='application/zip'
+        )
+        if profile is not None:
+            response.headers['Server-Timing'] = profile.server_timing()
+        return response
 
     except Exception as e:
         print(f"Caught Exception: {e}")
+        if result is not None:
+            result.close()
         return jsonify({'error': str(e)}), 400
+
+
+@api_bp.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a calculation, poll /jobs/<job_id> for its progress"""
+    work_dir = None
+    try:
+        settings = _read_settings(request.form)
+        work_dir = tempfile.mkdtemp(prefix='cg_job_')
+        inputs = _save_uploads(request.files, work_dir)
+    except Exception as e:
+        print(f"Caught Exception: {e}")
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        job = job_queue.submit(
+            work_dir,
+            lambda job: _run_job(job, inputs, settings)
+        )
+    except QueueFullError as e:
+        response = jsonify({'error': str(e)})
+        response.status_code = 429
+        response.headers['Retry-After'] = '5'
+        return response
+
+    response = jsonify(job.to_dict())
+    response.status_code = 202
+    response.headers['Location'] = url_for(
+        'api.get_job', job_id=job.job_id)
+    return response
+
+
+def _run_job(job: Job, inputs: dict, settings: dict) -> str:
+    result_path = os.path.join(job.work_dir, 'results.zip')
+    # Read back when the result is cached
+    with open(result_path, 'w+b') as result:
+        _calculate(inputs, settings, result, job.update)
+    return result_path
+
+
+@api_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown job '{job_id}'"}), 404
+    return jsonify(job.to_dict())
+
+
+@api_bp.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': f"Unknown job '{job_id}'"}), 404
+    if job.status != JOB_DONE:
+        return jsonify(job.to_dict()), 409
+
+    return send_file(
+        job.result_path,
+        as_attachment=True,
+        download_name='capital_gains_results.zip',
+        mimetype='application/zip'
+    )
+
+
+@api_bp.route('/cache', methods=['GET'])
+def get_cache_stats():
+    """Result cache hit/miss counters"""
+    return jsonify(result_cache.stats())
@@ -1,6 +1,4 @@
 import magic
-from werkzeug.utils import secure_filename
-import time, os, threading
 # Add file size limit (10MB)
 MAX_FILE_SIZE = 10 * 1024 * 1024
 
@@ -41,17 +39,3 @@ def sanitize_config_input(value, param_type, min_val=None, max_val=None) -> bool
         except (ValueError, TypeError):
             raise ValueError(f"Invalid integer value: {value}")
     return str(value)
-
-
-def cleanup_after_delay(file_path, delay=1.0):
-    def delayed_cleanup():
-        time.sleep(delay)
-        try:
-            if os.path.exists(file_path):
-                os.unlink(file_path)
-        except OSError:
-            pass
-
-    thread = threading.Thread(target=delayed_cleanup)
-    thread.daemon = True
-    thread.start()
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""Compare the row-wise and columnar lot matching engines.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_engine --companies 200 --transactions 500
+"""
+import argparse
+import filecmp
+import os
+import tempfile
+import time
+
+from processors.base import TransactionProcessor
+from processors.capital_gains import CGProcessor, ENGINES
+from .synthetic import write_transactions_csv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--companies", type=int, default=100)
+    parser.add_argument("--transactions", type=int, default=300,
+                        help="Transactions per company")
+    parser.add_argument("--sources", type=int, default=2)
+    parser.add_argument("--fmv_data_file", type=str,
+                        default='Grandfathered_ISIN_Prices.csv')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_path = os.path.join(temp_dir, 'transactions.csv')
+        rows = write_transactions_csv(
+            input_path,
+            companies=args.companies,
+            transactions_per_company=args.transactions,
+            sources=args.sources,
+            fmv_data_file=args.fmv_data_file
+        )
+        print(f"Synthetic ledger: {rows} rows, {args.companies} companies")
+
+        outputs = {}
+        for engine in ENGINES:
+            transactions_df = TransactionProcessor.initialize_data(
+                input_path, args.fmv_data_file)
+            outputs[engine] = os.path.join(temp_dir, f'cg_{engine}.csv')
+
+            start = time.perf_counter()
+            CGProcessor.process_all_transactions(
+                transactions_df=transactions_df,
+                output_file=outputs[engine],
+                overwrite=True,
+                engine=engine
+            )
+            elapsed = time.perf_counter() - start
+            print(f"{engine:>10}: {elapsed:8.3f}s  {rows / elapsed:12,.0f} rows/s")
+
+        identical = filecmp.cmp(*outputs.values(), shallow=False)
+        print(f"Outputs identical: {identical}")
+
+
+if __name__ == "__main__":
+    main()
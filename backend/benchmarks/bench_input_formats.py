@@ -0,0 +1,95 @@
+"""Transactions load time from CSV against Parquet and Arrow IPC (Feather).
+
+Times TransactionProcessor.initialize_data on the same synthetic ledger
+written in each format. The columnar files use the declared transaction
+schema, with '--' placeholders stored as 0.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_input_formats --companies 1000 --transactions 1000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from processors.base import TransactionProcessor
+from processors.utils.columnar_input import TRANSACTION_SCHEMA
+from benchmarks.synthetic import write_transactions_csv
+
+FMV_DATA_FILE = 'Grandfathered_ISIN_Prices.csv'
+
+
+def to_arrow_table(csv_path: str) -> pa.Table:
+    """A transactions CSV as an Arrow table with the declared schema"""
+    df = pd.read_csv(csv_path, dtype=str)
+    for name, type_alias in TRANSACTION_SCHEMA.items():
+        if type_alias == 'float64':
+            df[name] = pd.to_numeric(df[name].replace('--', '0'))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    return table.cast(pa.schema([
+        (name, pa.type_for_alias(TRANSACTION_SCHEMA[name]))
+        for name in table.column_names
+    ]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--companies", type=int, default=1000)
+    parser.add_argument("--transactions", type=int, default=1000,
+                        help="Transactions per company")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Loads per format, the fastest is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fmv_mapping = TransactionProcessor.load_fmv_mapping(FMV_DATA_FILE)
+
+    with tempfile.TemporaryDirectory(prefix='cg_bench_') as tmp:
+        csv_path = os.path.join(tmp, 'transactions.csv')
+        rows = write_transactions_csv(
+            csv_path, companies=args.companies,
+            transactions_per_company=args.transactions,
+            fmv_data_file=FMV_DATA_FILE, seed=args.seed)
+
+        table = to_arrow_table(csv_path)
+        paths = {'csv': csv_path}
+        paths['parquet'] = os.path.join(tmp, 'transactions.parquet')
+        pq.write_table(table, paths['parquet'])
+        paths['feather-lz4'] = os.path.join(tmp, 'transactions.feather')
+        feather.write_feather(table, paths['feather-lz4'])
+        paths['arrow'] = os.path.join(tmp, 'transactions.arrow')
+        feather.write_feather(table, paths['arrow'], compression='uncompressed')
+        del table
+
+        print(f"{rows:,} transactions")
+        timings = {}
+        frames = {}
+        for name, path in paths.items():
+            best = float('inf')
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                frames[name] = TransactionProcessor.initialize_data(
+                    path, FMV_DATA_FILE, fmv_mapping)
+                best = min(best, time.perf_counter() - start)
+            timings[name] = best
+            print(f"{name:>12}: {best:8.3f}s  {rows / best:14,.0f} rows/s  "
+                  f"{os.path.getsize(path) / 2**20:8.1f} MiB")
+
+        # Same rows in the same order, whatever the format
+        keys = ['Transaction Date', 'Company Name', 'Transaction Type', 'Source']
+        identical = all(
+            frames[name][keys].reset_index(drop=True).equals(
+                frames['csv'][keys].reset_index(drop=True))
+            for name in paths)
+        fastest = min(timings, key=timings.get)
+        print(f"Fastest: {fastest}, {timings['csv'] / timings[fastest]:.1f}x "
+              f"CSV, identical order: {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Memory per open lot: plain dict lots vs the slotted Lot.
+
+Lots used to be dicts carrying the buy type and FMV as well; those are now
+looked up from the buy transaction when the report is built. The dates,
+sources and index labels already exist in the ledger columns, so only
+what a lot adds on top of them is measured.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_lot_memory --lots 1000000
+"""
+import argparse
+import tracemalloc
+
+import pandas as pd
+
+from processors.utils.lot import Lot
+
+
+def dict_lot(ctype, source, shares, price, date, fmv, index):
+    # The lot layout before Lot
+    return {
+        'source': source,
+        'Type': ctype.upper(),
+        'shares': shares,
+        'price': price,
+        'date': date,
+        'FMV': fmv,
+        'index': index
+    }
+
+
+def slotted_lot(ctype, source, shares, price, date, fmv, index):
+    return Lot(source, shares, price, date, index)
+
+
+def bytes_per_lot(make_lot, columns: tuple, lot_count: int) -> float:
+    sources, shares, prices, dates, fmvs = columns
+    tracemalloc.start()
+    # The lot book's containers cost the same for either layout
+    lots = []
+    for i in range(lot_count):
+        lots.append(make_lot(
+            'sip investment', sources[i], shares[i], prices[i], dates[i],
+            fmvs[i], i))
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current / lot_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lots", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    # Ledger columns as the columnar engine extracts them (tolist)
+    dates = pd.date_range('2010-01-01', periods=args.lots, freq='h')
+    columns = (
+        [f"DEMAT-{i % 3}" for i in range(args.lots)],
+        [float(i % 100 + 1) for i in range(args.lots)],
+        [float(i % 500) + 0.25 for i in range(args.lots)],
+        dates.tolist(),
+        [0.0] * args.lots
+    )
+
+    before = bytes_per_lot(dict_lot, columns, args.lots)
+    after = bytes_per_lot(slotted_lot, columns, args.lots)
+    print(f"{args.lots:,} open lots")
+    print(f"dict lot:    {before:7.1f} bytes/lot")
+    print(f"slotted Lot: {after:7.1f} bytes/lot  ({before / after:.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    main()
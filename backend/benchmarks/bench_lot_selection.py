@@ -0,0 +1,92 @@
+"""Scaling of tax-optimal (non-FIFO) lot selection with lots per company.
+
+Compares the heap-backed LotBook selection against rescanning and sorting
+every open lot on each match (the previous selection, kept here only).
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_lot_selection --lots 1000 5000 20000
+"""
+import argparse
+import datetime
+import random
+import time
+
+from processors.utils.lot import Lot
+from processors.utils.lot_book import LotBook
+from processors.utils.lot_matcher import LotMatcher
+from processors.utils.sell_transaction_processor import SellTransactionProcessor
+
+
+class ScanLotMatcher(LotMatcher):
+    """Selects lots by filtering and sorting all open lots on every match,
+    as lot matching did before LotBook's heaps"""
+
+    def next_lot(self, lots, sell_price, source=None):
+        source = self._source_filter(source)
+        available_lots = [
+            lot for lot in lots if source is None or lot.source == source]
+        if not available_lots:
+            return None
+
+        # Prefer loss; else, profit minimization
+        loss_lots = [l for l in available_lots if l.price > sell_price]
+        if loss_lots:
+            return max(loss_lots, key=lambda b: b.price - sell_price)
+
+        # Default: highest price first, oldest if tie
+        return sorted(available_lots, key=lambda b: (-b.price, b.date))[0]
+
+
+def build_book(lot_count: int, seed: int) -> LotBook:
+    rng = random.Random(seed)
+    start = datetime.date(2015, 1, 1)
+    lots = LotBook()
+    for i in range(lot_count):
+        lots.append(Lot(
+            source=f"DEMAT-{rng.randint(1, 3)}",
+            shares=float(rng.randint(1, 100)),
+            price=round(rng.uniform(50, 500), 2),
+            date=start + datetime.timedelta(days=i),
+            index=i
+        ))
+    return lots
+
+
+def run(matcher: LotMatcher, lot_count: int, sells: int, seed: int) -> float:
+    lots = build_book(lot_count, seed)
+    sell_processor = SellTransactionProcessor(matcher)
+    # Each sell consumes about three lots, never exhausting the book
+    sell_qty = 150.0
+    sells = min(sells, lot_count // 20)
+
+    start = time.perf_counter()
+    for i in range(sells):
+        sell_processor.process_sell_transaction(
+            'sell/redemption', lots, sell_qty, 275.0, None,
+            'BENCH', 'DEMAT-1', 0
+        )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lots", type=int, nargs='+',
+                        default=[100, 1000, 5000, 20000])
+    parser.add_argument("--sells", type=int, default=200)
+    parser.add_argument("--same-source-only-matching", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'lots':>8} {'scan (s)':>10} {'heap (s)':>10} {'speedup':>8}")
+    for lot_count in args.lots:
+        timings = [
+            run(matcher_cls(False, args.same_source_only_matching),
+                lot_count, args.sells, args.seed)
+            for matcher_cls in (ScanLotMatcher, LotMatcher)
+        ]
+        print(f"{lot_count:>8} {timings[0]:>10.4f} {timings[1]:>10.4f} "
+              f"{timings[0] / timings[1]:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
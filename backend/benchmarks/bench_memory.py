@@ -0,0 +1,71 @@
+"""Peak memory of CGProcessor.process_all_transactions (tracemalloc).
+
+The capital gains report is streamed to disk as each company finishes, so
+the peak traced while matching should track the largest company rather
+than the size of the whole report.
+
+Usage (from the backend directory), the default is a 10M row ledger:
+    python -m benchmarks.bench_memory
+    python -m benchmarks.bench_memory --companies 1000 --transactions 1000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from processors.base import TransactionProcessor
+from processors.capital_gains import CGProcessor
+from .synthetic import write_transactions_csv
+
+
+def mib(size: int) -> str:
+    return f"{size / (1 << 20):,.1f} MiB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--companies", type=int, default=10000)
+    parser.add_argument("--transactions", type=int, default=1000,
+                        help="Transactions per company")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--fmv_data_file", type=str,
+                        default='Grandfathered_ISIN_Prices.csv')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_path = os.path.join(temp_dir, 'transactions.csv')
+        output_path = os.path.join(temp_dir, 'capital_gains.csv')
+        rows = write_transactions_csv(
+            input_path,
+            companies=args.companies,
+            transactions_per_company=args.transactions,
+            fmv_data_file=args.fmv_data_file
+        )
+        print(f"Synthetic ledger: {rows:,} rows, {args.companies} companies")
+
+        tracemalloc.start()
+        transactions_df = TransactionProcessor.initialize_data(
+            input_path, args.fmv_data_file)
+        loaded, load_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        start = time.perf_counter()
+        CGProcessor.process_all_transactions(
+            transactions_df=transactions_df,
+            output_file=output_path,
+            overwrite=True,
+            workers=args.workers
+        )
+        elapsed = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f"Ingestion:   peak {mib(load_peak)}, frame {mib(loaded)}")
+        print(f"Matching:    peak {mib(peak)} above the loaded frame: "
+              f"{mib(peak - loaded)}  ({elapsed:.1f}s)")
+        print(f"Report size: {mib(os.path.getsize(output_path))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Company partitioning: per-company groupby and sort against one lexsort.
+
+Times splitting a ledger into its companies' transactions in processing
+order, the way lot matching consumes them: a groupby with a sort_values
+per company (a copy each), against TransactionProcessor.
+partition_companies, one lexsort over interned company codes followed by
+contiguous slices. Both must give the same rows in the same order.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_partition --companies 10000 --transactions 20
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from processors.base import TransactionProcessor
+from benchmarks.synthetic import write_transactions_csv
+
+FMV_DATA_FILE = 'Grandfathered_ISIN_Prices.csv'
+
+
+def groupby_partition(transactions_df) -> list:
+    """Index labels of each company, as groupby and a sort per company"""
+    transactions_df = transactions_df.assign(
+        type_priority=TransactionProcessor.type_priorities(transactions_df))
+    return [
+        group.sort_values(['Transaction Date', 'type_priority']).index.to_numpy()
+        for _, group in transactions_df.groupby('Company Name', sort=False)
+    ]
+
+
+def lexsort_partition(transactions_df) -> list:
+    """Index labels of each company, as slices of one lexsort"""
+    ordered_df, company_ranges = TransactionProcessor.partition_companies(
+        transactions_df)
+    return [
+        ordered_df.iloc[start:stop].index.to_numpy()
+        for start, stop in company_ranges
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--companies", type=int, default=10000)
+    parser.add_argument("--transactions", type=int, default=20,
+                        help="Transactions per company")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs per method, the fastest is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='cg_bench_') as tmp:
+        csv_path = os.path.join(tmp, 'transactions.csv')
+        rows = write_transactions_csv(
+            csv_path, companies=args.companies,
+            transactions_per_company=args.transactions,
+            fmv_data_file=FMV_DATA_FILE, seed=args.seed)
+        transactions_df = TransactionProcessor.initialize_data(csv_path, FMV_DATA_FILE)
+
+    print(f"{rows:,} transactions, {args.companies:,} companies")
+    timings = {}
+    partitions = {}
+    for name, partition in (('groupby', groupby_partition), ('lexsort', lexsort_partition)):
+        best = float('inf')
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            partitions[name] = partition(transactions_df)
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best
+        print(f"{name:>8}: {best:8.3f}s  {args.companies / best:12,.0f} companies/s")
+
+    identical = len(partitions['groupby']) == len(partitions['lexsort']) and all(
+        np.array_equal(a, b) for a, b in zip(partitions['groupby'], partitions['lexsort']))
+    print(f"lexsort is {timings['groupby'] / timings['lexsort']:.1f}x faster, "
+          f"identical order: {identical}")
+
+
+if __name__ == "__main__":
+    main()
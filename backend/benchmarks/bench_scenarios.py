@@ -0,0 +1,223 @@
+"""Timed end-to-end scenarios over a synthetic ledger, with peak memory.
+
+Runs capital gains with FIFO and non-FIFO lot selection, each with
+same-source-only matching off and on, dividends, every report (capital
+gains, dividends and holdings) from one ReportPipeline, and the API's
+/calculate endpoint, each in a fresh process so their peak resident
+memory can be told apart. Throughput is ledger rows per second, loading
+included. Results can be saved as JSON and later runs compared against
+them, to catch regressions.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_scenarios --companies 200 --transactions 200
+    python -m benchmarks.bench_scenarios --json baseline.json
+    python -m benchmarks.bench_scenarios --baseline baseline.json
+"""
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+import zipfile
+
+from processors.base import TransactionProcessor
+from processors.capital_gains import CGProcessor
+from processors.dividends import DividendProcessor
+from processors.pipeline import (
+    ReportPipeline, CapitalGainsReport, DividendsReport, HoldingsReport
+)
+from .synthetic import write_transactions_csv
+
+# Scenario -> capital gains matching settings
+CG_SCENARIOS = {
+    'cg-fifo': dict(simple_fifo_mode=True, same_source_only_matching=False),
+    'cg-fifo-same-source': dict(simple_fifo_mode=True, same_source_only_matching=True),
+    'cg-tax-optimal': dict(simple_fifo_mode=False, same_source_only_matching=False),
+    'cg-tax-optimal-same-source': dict(simple_fifo_mode=False, same_source_only_matching=True),
+}
+SCENARIOS = list(CG_SCENARIOS) + ['dividends', 'all-reports', 'api']
+
+
+def peak_rss() -> int:
+    """Peak resident memory of this process, in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in KiB on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def run_cg(input_path: str, fmv_data_file: str, output_path: str, settings: dict):
+    transactions_df = TransactionProcessor.initialize_data(
+        input_path, fmv_data_file)
+    CGProcessor.process_all_transactions(
+        transactions_df=transactions_df,
+        output_file=output_path,
+        overwrite=True,
+        fmv_data_file=fmv_data_file,
+        **settings
+    )
+
+
+def run_dividends(input_path: str, fmv_data_file: str, output_path: str):
+    transactions_df = TransactionProcessor.initialize_data(
+        input_path, fmv_data_file)
+    DividendProcessor.process_all_transactions(
+        transactions_df=transactions_df,
+        output_file=output_path,
+        overwrite=True
+    )
+
+
+def run_all_reports(input_path: str, fmv_data_file: str, output_path: str):
+    transactions_df = TransactionProcessor.initialize_data(
+        input_path, fmv_data_file)
+    base = os.path.splitext(output_path)[0]
+    ReportPipeline().register(CapitalGainsReport(
+        output_file=output_path,
+        fmv_data_file=fmv_data_file
+    )).register(DividendsReport(
+        output_file=f'{base}_dividends.csv',
+        summary_file=f'{base}_dividends_summary.csv'
+    )).register(HoldingsReport(
+        output_file=f'{base}_holdings.csv'
+    )).run(transactions_df)
+
+
+def run_api(input_path: str):
+    """POST the ledger to /api/calculate, with the result cache off"""
+    from app import app
+    import api.routes
+    from api.result_cache import ResultCache
+
+    api.routes.result_cache = ResultCache(max_bytes=0)
+    with open(input_path, 'rb') as f:
+        response = app.test_client().post(
+            '/api/calculate',
+            data={
+                'transactions_file': (f, 'transactions.csv'),
+                'includeDividends': 'true'
+            },
+            content_type='multipart/form-data'
+        )
+    if response.status_code != 200:
+        raise RuntimeError(
+            f"/api/calculate returned {response.status_code}: {response.get_data(as_text=True)}")
+    zipfile.ZipFile(io.BytesIO(response.data)).testzip()
+
+
+def run_scenario(
+    name: str, input_path: str, fmv_data_file: str, temp_dir: str, results
+) -> None:
+    """Child process entry point, puts (elapsed seconds, peak RSS before
+    and after) on `results`"""
+    rss_before = peak_rss()
+    output_path = os.path.join(temp_dir, f'{name}.csv')
+
+    start = time.perf_counter()
+    if name in CG_SCENARIOS:
+        run_cg(input_path, fmv_data_file, output_path, CG_SCENARIOS[name])
+    elif name == 'dividends':
+        run_dividends(input_path, fmv_data_file, output_path)
+    elif name == 'all-reports':
+        run_all_reports(input_path, fmv_data_file, output_path)
+    else:
+        run_api(input_path)
+    elapsed = time.perf_counter() - start
+
+    results.put((elapsed, rss_before, peak_rss()))
+
+
+def mib(size: int) -> str:
+    return f"{size / (1 << 20):,.1f} MiB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--companies", type=int, default=200)
+    parser.add_argument("--transactions", type=int, default=200,
+                        help="Transactions per company")
+    parser.add_argument("--sources", type=int, default=2)
+    parser.add_argument("--split-ratio", type=float, default=0.0025)
+    parser.add_argument("--bonus-ratio", type=float, default=0.0025)
+    parser.add_argument("--merger-ratio", type=float, default=0.0005)
+    parser.add_argument("--dividend-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenarios", nargs='+', choices=SCENARIOS,
+                        default=SCENARIOS)
+    parser.add_argument("--json", type=str, default="",
+                        help="Also save the results to this JSON file")
+    parser.add_argument("--baseline", type=str, default="",
+                        help="Compare against results saved with --json")
+    parser.add_argument("--fmv_data_file", type=str,
+                        default='Grandfathered_ISIN_Prices.csv')
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    context = multiprocessing.get_context()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_path = os.path.join(temp_dir, 'transactions.csv')
+        rows = write_transactions_csv(
+            input_path,
+            companies=args.companies,
+            transactions_per_company=args.transactions,
+            sources=args.sources,
+            split_ratio=args.split_ratio,
+            bonus_ratio=args.bonus_ratio,
+            merger_ratio=args.merger_ratio,
+            dividend_ratio=args.dividend_ratio,
+            fmv_data_file=args.fmv_data_file,
+            seed=args.seed
+        )
+        print(f"Synthetic ledger: {rows:,} rows, {args.companies} companies, "
+              f"{mib(os.path.getsize(input_path))}")
+
+        results = {}
+        for name in args.scenarios:
+            queue = context.Queue()
+            process = context.Process(
+                target=run_scenario,
+                args=(name, input_path, args.fmv_data_file, temp_dir, queue))
+            process.start()
+            process.join()
+            if process.exitcode != 0:
+                print(f"{name:>28}: failed (exit code {process.exitcode})")
+                continue
+            elapsed, rss_before, rss_peak = queue.get()
+
+            results[name] = dict(
+                seconds=round(elapsed, 4),
+                rows_per_second=round(rows / elapsed),
+                peak_rss_bytes=rss_peak,
+                peak_rss_growth_bytes=rss_peak - rss_before
+            )
+            line = (f"{name:>28}: {elapsed:8.3f}s  {rows / elapsed:12,.0f} rows/s  "
+                    f"peak {mib(rss_peak):>12} (+{mib(rss_peak - rss_before)})")
+            if name in baseline:
+                previous = baseline[name]
+                line += (f"  vs baseline: "
+                         f"{results[name]['rows_per_second'] / previous['rows_per_second']:.2f}x "
+                         f"rows/s, {rss_peak / previous['peak_rss_bytes']:.2f}x peak")
+            print(line)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(dict(
+                rows=rows,
+                settings={
+                    k: v for k, v in vars(args).items()
+                    if k not in ('json', 'baseline')
+                },
+                results=results
+            ), f, indent=2)
+        print(f"Results saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""CLI wall time, start-up included, with and without pandas.
+
+Runs capital_gains_calc_cli.py as a fresh process on a small synthetic
+ledger with each engine, reporting the fastest of N runs, then lists the
+slowest imports of the stdlib engine's start-up (from `-X importtime`)
+and whether pandas was loaded at all.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_startup --companies 20 --transactions 50
+"""
+import argparse
+import filecmp
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.synthetic import write_transactions_csv
+
+FMV_DATA_FILE = 'Grandfathered_ISIN_Prices.csv'
+CLI = os.path.abspath('capital_gains_calc_cli.py')
+ENGINES = ('stdlib', 'columnar')
+
+
+def run_cli(input_path: str, output_path: str, engine: str, *python_options: str) -> str:
+    """Run the CLI once, from the output's directory (where it writes its
+    FMV cross check), returning its stderr"""
+    completed = subprocess.run(
+        [sys.executable, *python_options, CLI, '-i', input_path, '-o', output_path,
+         '-f', '--engine', engine, '--fmv_data_file', os.path.abspath(FMV_DATA_FILE)],
+        cwd=os.path.dirname(output_path), capture_output=True, text=True, check=True
+    )
+    return completed.stderr
+
+
+def slowest_imports(importtime_log: str, top: int) -> list:
+    """(cumulative microseconds, module) of the slowest top-level imports"""
+    imports = []
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented, their time is in their parent's
+        if not name.startswith('  '):
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--companies", type=int, default=20)
+    parser.add_argument("--transactions", type=int, default=50,
+                        help="Transactions per company")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="Runs per engine, the fastest is reported")
+    parser.add_argument("--top", type=int, default=10,
+                        help="Slowest imports listed")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='cg_bench_') as tmp:
+        input_path = os.path.join(tmp, 'transactions.csv')
+        rows = write_transactions_csv(
+            input_path, companies=args.companies,
+            transactions_per_company=args.transactions,
+            fmv_data_file=FMV_DATA_FILE, seed=args.seed)
+        print(f"{rows:,} transactions")
+
+        timings = {}
+        outputs = {}
+        for engine in ENGINES:
+            outputs[engine] = os.path.join(tmp, f'{engine}.csv')
+            best = float('inf')
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                run_cli(input_path, outputs[engine], engine)
+                best = min(best, time.perf_counter() - start)
+            timings[engine] = best
+            print(f"{engine:>10}: {best:8.3f}s")
+        print(f"stdlib is {timings['columnar'] / timings['stdlib']:.1f}x faster end to end, "
+              f"identical report: {filecmp.cmp(*outputs.values(), shallow=False)}")
+
+        log = run_cli(input_path, outputs['stdlib'], 'stdlib', '-X', 'importtime')
+        print("Slowest imports (stdlib engine), cumulative:")
+        for cumulative, name in slowest_imports(log, args.top):
+            print(f"  {cumulative / 1000:8.1f}ms  {name}")
+        loaded = any(line.rstrip().endswith('| pandas') for line in log.splitlines())
+        print(f"pandas imported: {loaded}")
+
+
+if __name__ == "__main__":
+    main()
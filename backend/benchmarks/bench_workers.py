@@ -0,0 +1,71 @@
+"""Scaling of CGProcessor.process_all_transactions with worker processes.
+
+Worker processes come from a pool kept for the whole process, so with
+--repeat the best of several runs shows the cost once the pool is up.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_workers --companies 2000 --workers 1 2 4 8 --repeat 3
+"""
+import argparse
+import filecmp
+import os
+import tempfile
+import time
+
+from processors.base import TransactionProcessor
+from processors.capital_gains import CGProcessor
+from .synthetic import write_transactions_csv
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--companies", type=int, default=1000)
+    parser.add_argument("--transactions", type=int, default=100,
+                        help="Transactions per company")
+    parser.add_argument("--workers", type=int, nargs='+',
+                        default=[1, 2, os.cpu_count() or 1])
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="Runs per worker count, the fastest is reported")
+    parser.add_argument("--fmv_data_file", type=str,
+                        default='Grandfathered_ISIN_Prices.csv')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        input_path = os.path.join(temp_dir, 'transactions.csv')
+        rows = write_transactions_csv(
+            input_path,
+            companies=args.companies,
+            transactions_per_company=args.transactions,
+            fmv_data_file=args.fmv_data_file
+        )
+        print(f"Synthetic ledger: {rows} rows, {args.companies} companies")
+
+        outputs = []
+        baseline = None
+        for workers in args.workers:
+            outputs.append(os.path.join(temp_dir, f'cg_{workers}.csv'))
+            timings = []
+            for _ in range(max(args.repeat, 1)):
+                transactions_df = TransactionProcessor.initialize_data(
+                    input_path, args.fmv_data_file)
+                start = time.perf_counter()
+                CGProcessor.process_all_transactions(
+                    transactions_df=transactions_df,
+                    output_file=outputs[-1],
+                    overwrite=True,
+                    workers=workers
+                )
+                timings.append(time.perf_counter() - start)
+            elapsed = min(timings)
+            baseline = baseline or elapsed
+            print(f"{workers:>3} workers: {elapsed:8.3f}s  "
+                  f"{rows / elapsed:12,.0f} rows/s  "
+                  f"speedup {baseline / elapsed:5.2f}x")
+
+        identical = all(filecmp.cmp(outputs[0], o, shallow=False)
+                        for o in outputs[1:])
+        print(f"Outputs identical: {identical}")
+
+
+if __name__ == "__main__":
+    main()
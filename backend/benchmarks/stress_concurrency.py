@@ -0,0 +1,140 @@
+"""Concurrent /api/calculate requests in one process, checked for isolation.
+
+Posts a different synthetic portfolio (and settings) per request from N
+threads at once, as waitress's thread pool would serve them, and checks
+every result against the same request made on its own: identical
+capital gains and dividends reports, identical profile counters (rows,
+matches, warnings logged...), and no file written to the working
+directory (other than the FMV sidecar cache). Exits with status 1 on
+any difference.
+
+Usage (from the backend directory):
+    python -m benchmarks.stress_concurrency --requests 8 --rounds 3
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from processors.utils.fmv_index import SIDECAR_SUFFIX
+from .synthetic import write_transactions_csv
+
+# Results zip entries compared byte for byte
+REPORT_ENTRIES = ('capital_gains.csv', 'dividends.csv')
+
+
+def calculate(app, input_path: str, form: dict) -> dict:
+    """POST a ledger to /api/calculate, returning the zip's entries"""
+    with open(input_path, 'rb') as f:
+        response = app.test_client().post(
+            '/api/calculate',
+            data=dict(form, transactions_file=(f, 'transactions.csv')),
+            content_type='multipart/form-data'
+        )
+    if response.status_code != 200:
+        raise RuntimeError(
+            f"/api/calculate returned {response.status_code}: {response.get_data(as_text=True)}")
+    with zipfile.ZipFile(io.BytesIO(response.data)) as zip_file:
+        return {name: zip_file.read(name) for name in zip_file.namelist()}
+
+
+def differences(expected: dict, actual: dict) -> list:
+    """What differs between two results, timings aside"""
+    found = [
+        name for name in REPORT_ENTRIES
+        if expected.get(name) != actual.get(name)
+    ]
+    expected_counters = json.loads(expected['profile.json'])['counters']
+    actual_counters = json.loads(actual['profile.json'])['counters']
+    if expected_counters != actual_counters:
+        found.append(f"counters {expected_counters} != {actual_counters}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=8,
+                        help="Simultaneous requests, each with its own portfolio")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--companies", type=int, default=50)
+    parser.add_argument("--transactions", type=int, default=100,
+                        help="Transactions per company")
+    parser.add_argument("--fmv_data_file", type=str,
+                        default='Grandfathered_ISIN_Prices.csv')
+    args = parser.parse_args()
+
+    from app import app
+    import api.routes
+    from api.result_cache import ResultCache
+
+    # Every request has to calculate
+    api.routes.result_cache = ResultCache(max_bytes=0)
+    files_before = set(os.listdir('.'))
+
+    with tempfile.TemporaryDirectory(prefix='cg_stress_') as temp_dir:
+        portfolios = []
+        for i in range(args.requests):
+            input_path = os.path.join(temp_dir, f'portfolio_{i}.csv')
+            write_transactions_csv(
+                input_path,
+                companies=args.companies + i,
+                transactions_per_company=args.transactions,
+                fmv_data_file=args.fmv_data_file,
+                seed=i
+            )
+            form = dict(
+                includeDividends='true',
+                profile='true',
+                sameSourceOnly='true' if i % 2 else 'false',
+                simpleFifoMode='false' if i % 3 == 2 else 'true'
+            )
+            portfolios.append((input_path, form))
+
+        start = time.perf_counter()
+        expected = [calculate(app, path, form) for path, form in portfolios]
+        sequential = time.perf_counter() - start
+        print(f"{args.requests} requests one at a time: {sequential:.2f}s")
+
+        failures = 0
+        for round_number in range(1, args.rounds + 1):
+            barrier = threading.Barrier(args.requests)
+
+            def request(i: int) -> dict:
+                barrier.wait()
+                return calculate(app, *portfolios[i])
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=args.requests) as executor:
+                results = list(executor.map(request, range(args.requests)))
+            elapsed = time.perf_counter() - start
+
+            mismatched = 0
+            for i, result in enumerate(results):
+                found = differences(expected[i], result)
+                if found:
+                    mismatched += 1
+                    print(f"  request {i}: {', '.join(found)}")
+            failures += mismatched
+            print(f"Round {round_number}: {args.requests} concurrent requests in "
+                  f"{elapsed:.2f}s, {mismatched} differ from their sequential result")
+
+    # The FMV sidecar is a cache shared on purpose
+    stray = sorted(
+        name for name in set(os.listdir('.')) - files_before
+        if not name.endswith(SIDECAR_SUFFIX))
+    if stray:
+        failures += 1
+        print(f"Files written to the working directory: {', '.join(stray)}")
+
+    print("Outputs isolated" if not failures else f"{failures} isolation failures")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import csv
+import datetime
+import os
+import random
+from typing import List, Dict, Any, Iterator
+
+# Columns expected by TransactionProcessor.initialize_data
+TRANSACTION_COLUMNS = [
+    'Transaction Date', 'Transaction Type', 'Company Name',
+    'Shares(Credits/Debits)', 'Price', 'Amount(Credits/Debits)',
+    'ISIN', 'Source'
+]
+
+BUY_TYPES = ['Investment in stock', 'SIP Investment', 'Dividend Reinvestment']
+
+
+def _load_isins(fmv_data_file: str) -> List[str]:
+    """Read the ISIN column of the grandfathered price file, if present"""
+    if not os.path.isfile(fmv_data_file):
+        return []
+    with open(fmv_data_file, newline='') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        return [r[0].strip() for r in reader if r]
+
+
+def generate_transactions(
+    companies: int = 50,
+    transactions_per_company: int = 200,
+    sources: int = 2,
+    split_ratio: float = 0.0025,
+    bonus_ratio: float = 0.0025,
+    merger_ratio: float = 0.0005,
+    dividend_ratio: float = 0.1,
+    start_date: str = '2015-01-01',
+    days: int = 3650,
+    fmv_data_file: str = 'Grandfathered_ISIN_Prices.csv',
+    seed: int = 0
+) -> Iterator[Dict[str, Any]]:
+    """Generate a synthetic transaction ledger, one row at a time.
+
+    Each company gets a random walk of buys and sells so that running
+    balances never go (far) negative, with occasional splits, bonuses
+    and dividends mixed in. The ratios are the chance of a transaction
+    being each of those corporate actions while shares are held.
+
+    A merger redeems the whole holding and continues the company's
+    history as a new company (name and ISIN) holding the shares issued
+    for it.
+    """
+    rng = random.Random(seed)
+    isins = _load_isins(fmv_data_file)
+    start = datetime.date.fromisoformat(start_date)
+    source_names = [f"DEMAT-{i + 1}" for i in range(sources)]
+
+    for c in range(companies):
+        company = f"COMPANY {c:05d} LTD"
+        isin = isins[c % len(isins)] if isins else f"INE{c:06d}X01"
+        mergers = 0
+        price = rng.uniform(10, 2000)
+        holding = 0.0
+        rows = []
+        offsets = sorted(rng.randrange(days)
+                         for _ in range(transactions_per_company))
+
+        for offset in offsets:
+            tdate = (start + datetime.timedelta(days=offset)).isoformat()
+            source = rng.choice(source_names)
+            price = max(1.0, price * rng.uniform(0.9, 1.12))
+            roll = rng.random()
+
+            if holding > 0 and roll < dividend_ratio:
+                amount = round(holding * rng.uniform(0.5, 10), 2)
+                rows.append([tdate, 'Dividend', company, '--', '--',
+                             -amount, isin, source])
+            elif holding > 0 and roll < dividend_ratio + split_ratio:
+                qty = holding * rng.choice([1, 4, 9])
+                rows.append([tdate, 'Stock Split', company, qty, '--',
+                             '--', isin, source])
+                price /= 1 + qty / holding
+                holding += qty
+            elif holding > 0 and roll < dividend_ratio + split_ratio + bonus_ratio:
+                qty = float(int(holding * rng.choice([0.5, 1])) or 1)
+                rows.append([tdate, 'Bonus', company, qty, '--',
+                             '--', isin, source])
+                holding += qty
+            elif holding > 0 and roll < (dividend_ratio + split_ratio
+                                         + bonus_ratio + merger_ratio):
+                price_r = round(price, 2)
+                rows.append([tdate, 'Merger Redemption', company, -holding,
+                             price_r, round(holding * price_r, 2), isin, source])
+                # Shares of the merged company issued per share held
+                swap_ratio = rng.choice([0.5, 1, 2])
+                mergers += 1
+                company = f"COMPANY {c:05d}-M{mergers} LTD"
+                isin = isins[(c + mergers * companies) % len(isins)] \
+                    if isins else f"INE{c:06d}M{mergers:02d}"
+                holding = float(max(1, int(holding * swap_ratio)))
+                price /= swap_ratio
+                price_r = round(price, 2)
+                rows.append([tdate, 'Merger Investment', company, holding,
+                             price_r, -round(holding * price_r, 2), isin, source])
+            elif holding > 0 and rng.random() < 0.4:
+                qty = float(max(1, int(holding * rng.uniform(0.1, 1.0))))
+                holding -= qty
+                price_r = round(price, 2)
+                rows.append([tdate, 'Sell/Redemption', company, -qty,
+                             price_r, round(qty * price_r, 2), isin, source])
+            else:
+                qty = float(rng.randint(1, 200))
+                holding += qty
+                price_r = round(price, 2)
+                rows.append([tdate, rng.choice(BUY_TYPES), company, qty,
+                             price_r, -round(qty * price_r, 2), isin, source])
+
+        for r in rows:
+            yield dict(zip(TRANSACTION_COLUMNS, r))
+
+
+def write_transactions_csv(path: str, **kwargs) -> int:
+    """Write a synthetic ledger to `path`, returning the number of rows"""
+    count = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=TRANSACTION_COLUMNS)
+        writer.writeheader()
+        for row in generate_transactions(**kwargs):
+            writer.writerow(row)
+            count += 1
+    return count
@@ -1,11 +1,25 @@
 import argparse
-from typing import Final
-from processors.capital_gains import CGProcessor
-from processors.dividends import DividendProcessor
-from processors.base import TransactionProcessor
-from processors.dividends import DividendProcessor
+import os
+import sys
+import tempfile
+from contextlib import nullcontext
+from typing import Final, Optional
+from processors.base import TransactionProcessor, DEFAULT_PARTITION_ROWS
+from processors.utils.lot_engine import ENGINES, ENGINE_COLUMNAR, ENGINE_STDLIB
+from processors.utils.columnar_input import ColumnarInput, FORMAT_CSV
+from processors.utils.report_writer import OUTPUT_FORMATS, OUTPUT_CSV
+from processors.utils.run_profile import RunProfile, PROFILERS
+# The processors built on pandas are imported once the arguments say they
+# are needed, so `--help` and --engine stdlib runs never load pandas
 
 GRANDFATHERED_ISIN_PRICES: Final = 'Grandfathered_ISIN_Prices.csv'
+# FMV cross check of a run, saved to the working directory
+FMV_CROSSMATCH_FILE: Final = 'fmv_crossmatch_output.csv'
+# Written with -p, to the working directory
+DIVIDENDS_FILE: Final = 'dividends.csv'
+DIVIDENDS_SUMMARY_FILE: Final = 'dividends_summary.csv'
+# Written with --holdings, to the working directory
+HOLDINGS_FILE: Final = 'holdings.csv'
 
 
 def create_args_parser() -> argparse.ArgumentParser:
@@ -21,15 +35,27 @@ def create_args_parser() -> argparse.ArgumentParser:
     # Input and output file arguments
     parser.add_argument(
         "-i", "--transactions_data_file",
-        required=True,
         type=str,
-        help="Path to the source transactions.csv file. (Required)"
+        default="",
+        help="Path to the source transactions file, CSV, Parquet or Arrow IPC/Feather. (Required, "
+             "unless --batch)"
     )
     parser.add_argument(
         "-o", "--output_file",
         required=True,
         type=str,
-        help="Path to save the calculated CG in csv format. (Required)"
+        help="Path to save the calculated CG report, in the --output-format, or the output "
+             "directory with --batch. (Required)"
+    )
+    parser.add_argument(
+        "--batch",
+        type=str,
+        default="",
+        help="Process many portfolios in one run: a directory of transaction files, a glob pattern "
+             "(quoted) or a manifest file listing one path per line. Each gets <name>.<format> "
+             "(and <name>_dividends.csv, <name>_dividends_summary.csv with -p, <name>_holdings.csv with "
+             "--holdings) in the -o directory, plus batch_summary.csv; "
+             "-w sets the portfolios processed in parallel, default=[none]"
     )
 
     # Optional arguments
@@ -72,7 +98,16 @@ def create_args_parser() -> argparse.ArgumentParser:
         "-p", "--process-dividends",
         action="store_true",
         default=False,
-        help=f"Process Dividend Transactions also, default=[False]"
+        help=f"Process Dividend Transactions also, written to {DIVIDENDS_FILE} with their totals by "
+             f"financial year, quarter, company and source in {DIVIDENDS_SUMMARY_FILE}, default=[False]"
+    )
+
+    parser.add_argument(
+        "--holdings",
+        action="store_true",
+        default=False,
+        help=f"Also write the lots still open after the last transaction to {HOLDINGS_FILE}, "
+             f"from the same lot matching (in a single process), default=[False]"
     )
 
     parser.add_argument(
@@ -89,45 +124,296 @@ def create_args_parser() -> argparse.ArgumentParser:
         help=f"Use Simple FIFO mode for matching Transactions, default=[True]"
     )
 
+    parser.add_argument(
+        "--engine",
+        type=str,
+        choices=ENGINES + (ENGINE_STDLIB,),
+        default=ENGINE_COLUMNAR,
+        help=f"Lot matching engine: columnar arrays or legacy per-row Series, or {ENGINE_STDLIB} to "
+             f"run without pandas on the csv module (fastest start-up; CSV in and out, one "
+             f"process), default=[{ENGINE_COLUMNAR}]"
+    )
+
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        choices=OUTPUT_FORMATS,
+        default=OUTPUT_CSV,
+        help=f"Format of the capital gains report, Parquet and Feather need pyarrow, default=[{OUTPUT_CSV}]"
+    )
+
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=1,
+        help=f"Number of worker processes to match company lots in parallel, default=[1]"
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=0,
+        help=f"Read the transactions file in chunks of this many rows and process it out of core "
+             f"in per-company partitions (for files larger than memory), default=[0, load whole file]"
+    )
+
+    parser.add_argument(
+        "--partition-rows",
+        type=int,
+        default=DEFAULT_PARTITION_ROWS,
+        help=f"Approximate rows per on-disk partition with --chunk-size, default=[{DEFAULT_PARTITION_ROWS}]"
+    )
+
+    parser.add_argument(
+        "--snapshot",
+        type=str,
+        default="",
+        help=f"Save the open lots and running balances at the end of the run to this file, default=[none]"
+    )
+
+    parser.add_argument(
+        "--resume",
+        type=str,
+        default="",
+        help=f"Resume from a --snapshot file, processing (and reporting) only transactions after its "
+             f"last date; the full history is replayed if it changed up to that date, default=[none]"
+    )
+
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=False,
+        help=f"Print the time spent per stage and counters (rows, companies, lots, matches, warnings) "
+             f"at the end of the run, default=[False]"
+    )
+
+    parser.add_argument(
+        "--profiler-output",
+        type=str,
+        default="",
+        help=f"Run under --profiler and save its report to this file, default=[none]"
+    )
+
+    parser.add_argument(
+        "--profiler",
+        type=str,
+        choices=PROFILERS,
+        default=PROFILERS[0],
+        help=f"Profiler for --profiler-output: cprofile (pstats data) or pyinstrument (HTML, "
+             f"needs pyinstrument), default=[{PROFILERS[0]}]"
+    )
+
     return parser
 
 
-def main():
+def main() -> int:
+    """Run the command line, returning the exit status"""
     parser: argparse.ArgumentParser = create_args_parser()
 
     # Parse arguments
     args = parser.parse_args()
 
+    if args.batch:
+        if args.engine == ENGINE_STDLIB:
+            parser.error(f"--engine {ENGINE_STDLIB} processes a single transactions file")
+        if args.transactions_data_file:
+            parser.error("-i and --batch cannot be used together")
+        if args.chunk_size > 0 or args.snapshot or args.resume:
+            parser.error("--chunk-size, --snapshot and --resume process a single transactions file")
+        return process_batch(args)
+    if not args.transactions_data_file:
+        parser.error("one of -i or --batch is required")
+
     TransactionProcessor.check_files(
         transactions_data_file=args.transactions_data_file,
         output_file=args.output_file,
         overwrite=args.overwrite
     )
 
+    if args.engine == ENGINE_STDLIB:
+        if ColumnarInput.detect_format(args.transactions_data_file) != FORMAT_CSV:
+            parser.error(f"--engine {ENGINE_STDLIB} needs a CSV transactions file")
+        if args.output_format != OUTPUT_CSV:
+            parser.error(f"--engine {ENGINE_STDLIB} writes CSV reports only")
+        if args.workers > 1 or args.chunk_size > 0 or args.snapshot or args.resume \
+                or args.holdings:
+            parser.error(f"--engine {ENGINE_STDLIB} supports neither --workers, --chunk-size, "
+                         f"--snapshot, --resume nor --holdings")
+
+    if args.chunk_size > 0:
+        if ColumnarInput.detect_format(args.transactions_data_file) != FORMAT_CSV:
+            parser.error("--chunk-size needs a CSV transactions file")
+        if args.snapshot or args.resume or args.holdings:
+            parser.error("--snapshot, --resume and --holdings need the whole file in memory, "
+                         "not --chunk-size")
+
+    profile = RunProfile() if args.profile else None
+    with RunProfile.profiler(args.profiler_output, args.profiler) \
+            if args.profiler_output else nullcontext():
+        if args.engine == ENGINE_STDLIB:
+            process_stdlib(args, profile)
+        elif args.chunk_size > 0:
+            process_out_of_core(args, profile)
+        else:
+            process_in_memory(args, profile)
+
+    if profile is not None:
+        print(profile.format())
+    if args.profiler_output:
+        print(f"Profiler report saved to {args.profiler_output}")
+    return 0
+
+
+def process_batch(args) -> int:
+    """Process every portfolio of --batch, returning the exit status: 1
+    if there were none or any failed"""
+    from processors.batch import BatchProcessor, SUMMARY_FILE, PROFILE_FILE
+
+    inputs = BatchProcessor.discover(args.batch)
+    if not inputs:
+        print(f"No transaction files found for '{args.batch}'")
+        return 1
+
+    with RunProfile.profiler(args.profiler_output, args.profiler) \
+            if args.profiler_output else nullcontext():
+        results = BatchProcessor.process_portfolios(
+            inputs=inputs,
+            output_dir=args.output_file,
+            overwrite=args.overwrite,
+            fmv_data_file=args.fmv_data_file,
+            tax_rates_file=args.tax_rates_file,
+            workers=args.workers,
+            process_dividends=args.process_dividends,
+            holdings=args.holdings,
+            profile=args.profile,
+            verbose=args.verbose,
+            same_source_only_matching=args.same_source_only_matching,
+            simple_fifo_mode=args.simple_fifo_mode,
+            ltcg_threshold_days=args.ltcg_threshold_days,
+            engine=args.engine,
+            output_format=args.output_format
+        )
+
+    print(f"{'portfolio':<32}{'status':>8}{'seconds':>10}{'rows':>12}{'matches':>12}")
+    for result in results:
+        print(f"{result['portfolio']:<32}{result['status']:>8}{result['seconds']:>10.2f}"
+              f"{result['rows']:>12,}{result['matches']:>12,}")
+    failed = [result for result in results if result['status'] != 'ok']
+    for result in failed:
+        print(f"{result['portfolio']}: {result['error']}")
+    print(f"Processed {len(results)} portfolios, {len(failed)} failed. "
+          f"Summary saved to {os.path.join(args.output_file, SUMMARY_FILE)}")
+    if args.profile:
+        print(f"Stage timings saved to {os.path.join(args.output_file, PROFILE_FILE)}")
+    if args.profiler_output:
+        print(f"Profiler report saved to {args.profiler_output}")
+    return 1 if failed else 0
+
+
+def process_stdlib(args, profile: Optional[RunProfile] = None) -> None:
+    """Process the transactions file without pandas"""
+    from processors.stdlib_processor import StdlibProcessor
+
+    with profile.stage('load_fmv') if profile is not None else nullcontext():
+        fmv_mapping = StdlibProcessor.load_fmv_mapping(args.fmv_data_file, stdlib=True)
+    transactions = StdlibProcessor.read_transactions(
+        args.transactions_data_file, fmv_mapping, profile)
+
+    StdlibProcessor.process_all_transactions(
+        transactions=transactions,
+        output_file=args.output_file,
+        verbose=args.verbose,
+        same_source_only_matching=args.same_source_only_matching,
+        simple_fifo_mode=args.simple_fifo_mode,
+        ltcg_threshold_days=args.ltcg_threshold_days,
+        profile=profile,
+        fmv_audit_file=FMV_CROSSMATCH_FILE
+    )
+
+    if args.process_dividends:
+        StdlibProcessor.process_dividends(
+            transactions=transactions,
+            output_file=DIVIDENDS_FILE,
+            profile=profile,
+            summary_file=DIVIDENDS_SUMMARY_FILE
+        )
+
+
+def process_in_memory(args, profile: Optional[RunProfile] = None) -> None:
+    """Load the whole transactions file, then run every report asked
+    for over it in one pipeline"""
+    from processors.pipeline import (
+        ReportPipeline, CapitalGainsReport, DividendsReport, HoldingsReport
+    )
+
     transactions_df = TransactionProcessor.initialize_data(
         transactions_data_file=args.transactions_data_file,
-        fmv_data_file=args.fmv_data_file
+        fmv_data_file=args.fmv_data_file,
+        profile=profile
     )
 
-    CGProcessor.process_all_transactions(
-        transactions_df=transactions_df,
+    pipeline = ReportPipeline(profile)
+    pipeline.register(CapitalGainsReport(
         output_file=args.output_file,
-        overwrite=args.overwrite,
         fmv_data_file=args.fmv_data_file,
         verbose=args.verbose,
         tax_rates_file=args.tax_rates_file,
         same_source_only_matching=args.same_source_only_matching,
         simple_fifo_mode=args.simple_fifo_mode,
-        ltcg_threshold_days=args.ltcg_threshold_days
-    )
-
+        ltcg_threshold_days=args.ltcg_threshold_days,
+        engine=args.engine,
+        workers=args.workers,
+        output_format=args.output_format,
+        snapshot_file=args.snapshot,
+        resume_from=args.resume,
+        fmv_audit_file=FMV_CROSSMATCH_FILE
+    ))
     if args.process_dividends:
-        DividendProcessor.process_all_transactions(
-            transactions_df=transactions_df,
-            output_file="dividends.csv",
-            overwrite=True
-        )
+        pipeline.register(DividendsReport(
+            output_file=DIVIDENDS_FILE,
+            summary_file=DIVIDENDS_SUMMARY_FILE
+        ))
+    if args.holdings:
+        pipeline.register(HoldingsReport(output_file=HOLDINGS_FILE))
+    pipeline.run(transactions_df)
+
+
+def process_out_of_core(args, profile: Optional[RunProfile] = None) -> None:
+    """Partition the transactions file by company on disk, then feed the
+    partitions, one at a time, to every report asked for in one pipeline"""
+    from processors.pipeline import ReportPipeline, CapitalGainsReport, DividendsReport
+
+    with tempfile.TemporaryDirectory(prefix='cg_partitions_') as spill_dir:
+        with profile.stage('partition') if profile is not None else nullcontext():
+            partition_files = TransactionProcessor.partition_transactions(
+                transactions_data_file=args.transactions_data_file,
+                spill_dir=spill_dir,
+                chunk_size=args.chunk_size,
+                partition_rows=args.partition_rows
+            )
+
+        pipeline = ReportPipeline(profile)
+        pipeline.register(CapitalGainsReport(
+            output_file=args.output_file,
+            fmv_data_file=args.fmv_data_file,
+            verbose=args.verbose,
+            tax_rates_file=args.tax_rates_file,
+            same_source_only_matching=args.same_source_only_matching,
+            simple_fifo_mode=args.simple_fifo_mode,
+            ltcg_threshold_days=args.ltcg_threshold_days,
+            engine=args.engine,
+            workers=args.workers,
+            output_format=args.output_format,
+            fmv_audit_file=FMV_CROSSMATCH_FILE
+        ))
+        if args.process_dividends:
+            pipeline.register(DividendsReport(
+                output_file=DIVIDENDS_FILE,
+                summary_file=DIVIDENDS_SUMMARY_FILE
+            ))
+        pipeline.run_partitions(TransactionProcessor.iter_partitions(
+            partition_files, args.fmv_data_file, profile))
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
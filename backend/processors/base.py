@@ -1,6 +1,25 @@
-import pandas as pd
 import os
 import json
+from typing import TYPE_CHECKING, BinaryIO, Final, Iterator, List, Optional, Sequence, Tuple, Union
+from .utils.fiscal_calendar import FiscalCalendar
+from .utils.fmv_index import FMVIndex
+from .utils.lot_engine import TRANSACTION_TYPE_PRIORITY
+from .utils.columnar_input import ColumnarInput, FORMAT_CSV
+from .utils.run_profile import RunProfile
+
+# pandas is imported by the methods needing it, so that the pandas-free
+# paths (StdlibProcessor, the CLI's start-up) never load it
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Out-of-core ingestion defaults, in rows
+DEFAULT_CHUNK_SIZE: Final = 100_000
+DEFAULT_PARTITION_ROWS: Final = 1_000_000
+
+# Lower-case transaction types and their processing priority, added once
+# by normalize_types for every report reading them
+TYPE_KEY_COLUMN: Final = 'type_key'
+TYPE_PRIORITY_COLUMN: Final = 'type_priority'
 
 
 class TransactionProcessor:
@@ -24,63 +43,248 @@ class TransactionProcessor:
                 f"Output file '{output_file}' already exists")
 
     @staticmethod
-    def initialize_data(
-		transactions_data_file: str,
-		fmv_data_file: str
-    ) -> pd.DataFrame:
+    def load_fmv_mapping(
+        fmv_data_file: str, sidecar: bool = False, stdlib: bool = False
+    ) -> dict:
+        """Load the Grandfathered ISIN -> Fair market value mapping, parsed
+        without pandas with `stdlib`.
 
+        Parsed mappings are cached for the process, see FMVIndex.
+        """
         if os.path.isfile(fmv_data_file):
-            # Load Grandfathered price data
-            grandfathered_prices_df = pd.read_csv(fmv_data_file)
+            return FMVIndex.for_file(fmv_data_file, sidecar=sidecar, stdlib=stdlib)
 
-            grandfathered_prices_df = grandfathered_prices_df.rename(
-                columns=lambda x: x.strip())
+        print(
+            f"Warning: FMV Data File '{fmv_data_file}' not found. Ignoring and continuing")
+        return {}
 
-            # Create a mapping of ISIN to FMV from df2
-            fmv_mapping = grandfathered_prices_df.set_index(
-                "ISIN")["Fair market value"].to_dict()
-        else:
-            print(
-                f"Warning: FMV Data File '{fmv_data_file}' not found. Ignoring and continuing")
-            fmv_mapping = {}
+    @staticmethod
+    def initialize_data(
+		transactions_data_file: Union[str, BinaryIO],
+		fmv_data_file: str,
+		fmv_mapping: Optional[dict] = None,
+		profile: Optional[RunProfile] = None
+    ) -> 'pd.DataFrame':
+        """Load a transactions file (CSV, Parquet or Arrow IPC/Feather, a
+        path or binary stream), sorted and with FMV, Quarter and FY added.
+        The stages are timed into `profile` when given"""
+        import pandas as pd
+        profile = profile if profile is not None else RunProfile()
+
+        if fmv_mapping is None:
+            with profile.stage('load_fmv'):
+                fmv_mapping = TransactionProcessor.load_fmv_mapping(fmv_data_file)
 
         # 1. Load and clean data, skip index column if present
-        transactions_df = pd.read_csv(transactions_data_file)
+        with profile.stage('read_transactions'):
+            file_format = ColumnarInput.detect_format(transactions_data_file)
+            if file_format == FORMAT_CSV:
+                transactions_df = pd.read_csv(transactions_data_file)
 
-        transactions_df['Transaction Date'] = pd.to_datetime(
-            transactions_df['Transaction Date'],
-            format='%Y-%m-%d',
-            errors='raise'
-        )
-        transactions_df = transactions_df.rename(
-            columns=lambda x: x.strip())
+                transactions_df['Transaction Date'] = pd.to_datetime(
+                    transactions_df['Transaction Date'],
+                    format='%Y-%m-%d',
+                    errors='raise'
+                )
+            else:
+                transactions_df = ColumnarInput.read(
+                    transactions_data_file, file_format)
+            transactions_df = transactions_df.rename(
+                columns=lambda x: x.strip())
+        profile.count('rows_ingested', len(transactions_df))
 
         # 2. Sort globally by date BEFORE anything else!
-        transactions_df = transactions_df.sort_values(
-            ['Transaction Date', 'Company Name', 'Transaction Type']
-        )
-
-        transactions_df["FMV"] = transactions_df["ISIN"].map(
-            fmv_mapping).fillna(0.0)
-
-        bins = [1, 3, 6, 9, 12]  # Start bins with 1 (January) instead of 0
-        labels = ["Q4", "Q1", "Q2", "Q3"]
-        transactions_df["Quarter"] = pd.cut(
-            transactions_df["Transaction Date"].dt.month,
-            bins=bins, labels=labels,
-            right=True, include_lowest=True
-        )
-        # Apply the function to the 'Date' column
-        transactions_df['FY'] = transactions_df['Transaction Date'].apply(
-            lambda x: f"FY{x.year - (x.month < 4)}-{x.year + (x.month >= 4)}"
-        )
+        with profile.stage('global_sort'):
+            transactions_df = transactions_df.sort_values(
+                ['Transaction Date', 'Company Name', 'Transaction Type']
+            )
+
+        with profile.stage('enrich'):
+            transactions_df["FMV"] = transactions_df["ISIN"].map(
+                fmv_mapping).fillna(0.0)
+
+            transactions_df["Quarter"] = FiscalCalendar.fiscal_quarters(
+                transactions_df["Transaction Date"])
+            transactions_df['FY'] = FiscalCalendar.fiscal_years(
+                transactions_df['Transaction Date'])
 
         return transactions_df
 
     @staticmethod
-    def load_tax_rates(tax_rates_file: str = "") -> dict:
-        """Load FY-specific tax rates from JSON file"""
+    def partition_transactions(
+        transactions_data_file: str,
+        spill_dir: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        partition_rows: int = DEFAULT_PARTITION_ROWS
+    ) -> List[str]:
+        """Split a transactions file into per-company spill files on disk.
+
+        The file is read twice in chunks of `chunk_size` rows, as raw text
+        so spilled values round-trip unchanged. The first pass finds each
+        company's first transaction date and row count, the second appends
+        rows to spill files holding contiguous runs of companies in that
+        order, of about `partition_rows` rows each. Processing the
+        partitions in order therefore yields companies in the same order
+        as the in-memory path. Rows without a company name go last.
+        """
+        import pandas as pd
+        header = pd.read_csv(transactions_data_file, nrows=0).columns
+        raw_columns = {c.strip(): c for c in header}
+        date_col = raw_columns['Transaction Date']
+        company_col = raw_columns['Company Name']
+
+        # Pass 1: first date and row count per company
+        company_stats = None
+        for chunk in pd.read_csv(
+            transactions_data_file, dtype=str, chunksize=chunk_size,
+            usecols=[date_col, company_col]
+        ):
+            dates = pd.to_datetime(
+                chunk[date_col], format='%Y-%m-%d', errors='raise')
+            stats = dates.groupby(chunk[company_col]).agg(['min', 'size'])
+            company_stats = stats if company_stats is None else pd.concat(
+                [company_stats, stats]).groupby(level=0).agg(
+                    {'min': 'min', 'size': 'sum'})
+
+        partition_of = {}
+        if company_stats is not None:
+            company_stats = company_stats.rename_axis('company').reset_index(
+            ).sort_values(['min', 'company'])
+            partition, rows = 0, 0
+            for company, size in zip(company_stats['company'], company_stats['size']):
+                if rows and rows + size > partition_rows:
+                    partition, rows = partition + 1, 0
+                partition_of[company] = partition
+                rows += size
+        unnamed_partition = len(set(partition_of.values()))
+
+        # Pass 2: spill raw rows to their company's partition
+        partition_files = {}
+        for chunk in pd.read_csv(
+            transactions_data_file, dtype=str, chunksize=chunk_size
+        ):
+            partitions = chunk[company_col].map(partition_of).fillna(
+                unnamed_partition).astype(int)
+            for partition, rows in chunk.groupby(partitions, sort=False):
+                path = partition_files.get(partition)
+                if path is None:
+                    path = os.path.join(
+                        spill_dir, f"partition_{partition:05d}.csv")
+                    partition_files[partition] = path
+                    rows.to_csv(path, index=False)
+                else:
+                    rows.to_csv(path, mode='a', header=False, index=False)
+
+        return [partition_files[p] for p in sorted(partition_files)]
+
+    @staticmethod
+    def iter_partitions(
+        partition_files: List[str],
+        fmv_data_file: str,
+        profile: Optional[RunProfile] = None
+    ) -> Iterator['pd.DataFrame']:
+        """Load and initialize spilled partitions one at a time"""
+        fmv_mapping = TransactionProcessor.load_fmv_mapping(fmv_data_file)
+        for partition_file in partition_files:
+            yield TransactionProcessor.initialize_data(
+                partition_file, fmv_data_file, fmv_mapping, profile)
+
+    @staticmethod
+    def normalize_types(transactions_df: 'pd.DataFrame') -> None:
+        """Add the lower-case transaction types and their priority (see
+        TRANSACTION_TYPE_PRIORITY) to the frame, in place"""
+        type_keys = transactions_df['Transaction Type'].str.lower()
+        transactions_df[TYPE_KEY_COLUMN] = type_keys
+        transactions_df[TYPE_PRIORITY_COLUMN] = type_keys.map(TRANSACTION_TYPE_PRIORITY)
+
+    @staticmethod
+    def type_keys(transactions_df: 'pd.DataFrame') -> 'pd.Series':
+        """Lower-case transaction types, those of normalize_types when it
+        ran on the frame"""
+        if TYPE_KEY_COLUMN in transactions_df.columns:
+            return transactions_df[TYPE_KEY_COLUMN]
+        return transactions_df['Transaction Type'].str.lower()
+
+    @staticmethod
+    def type_priorities(transactions_df: 'pd.DataFrame') -> 'pd.Series':
+        """Processing priority of the transaction types (NaN for types
+        without one), those of normalize_types when it ran on the frame"""
+        if TYPE_PRIORITY_COLUMN in transactions_df.columns:
+            return transactions_df[TYPE_PRIORITY_COLUMN]
+        return TransactionProcessor.type_keys(transactions_df).map(
+            TRANSACTION_TYPE_PRIORITY)
+
+    @staticmethod
+    def partition_companies(
+        transactions_df: 'pd.DataFrame', first_companies: Sequence = ()
+    ) -> Tuple['pd.DataFrame', List[Tuple[int, int]]]:
+        """Order the transactions by company, then date and type priority
+        (missing priorities last), with a single stable lexsort over
+        interned company codes.
+
+        Companies are numbered in order of first appearance, those of
+        `first_companies` going first in their order, and rows without a
+        company are left out. Returns the ordered frame, its rows keeping
+        their labels, and each company's (start, stop) row range in it, so
+        a company is the slice `ordered_df.iloc[start:stop]` rather than a
+        copy of its own.
+        """
+        import numpy as np
+        import pandas as pd
+
+        codes, names = pd.factorize(transactions_df['Company Name'], sort=False)
+        if len(first_companies):
+            rank = {company: i for i, company in enumerate(first_companies)}
+            name_ranks = np.array([
+                rank.get(name, len(rank) + code) for code, name in enumerate(names)
+            ], dtype=np.int64)
+            codes = np.where(codes >= 0, name_ranks[np.maximum(codes, 0)], -1)
+
+        order = np.lexsort((
+            TransactionProcessor.type_priorities(transactions_df).to_numpy(dtype='float64'),
+            transactions_df['Transaction Date'].to_numpy(),
+            codes
+        ))
+        # Rows without a company (code -1) sort first
+        order = order[np.searchsorted(codes[order], 0):]
+
+        ordered_codes = codes[order]
+        starts = np.flatnonzero(np.diff(ordered_codes, prepend=-1))
+        stops = np.append(starts[1:], len(order))
+        return transactions_df.take(order), list(zip(starts.tolist(), stops.tolist()))
+
+    @staticmethod
+    def numeric_column_values(column: 'pd.Series') -> list:
+        """Parse a numeric column once into a list of floats.
+
+        Mirrors the per-row `float(x) if str(x) != '--' else 0` parsing:
+        '--' placeholders become 0 and unparseable values become None.
+        """
+        import pandas as pd
+        if pd.api.types.is_numeric_dtype(column):
+            return column.astype('float64').tolist()
+
+        dash = (column.astype(str) == '--').to_numpy()
+        parsed = pd.to_numeric(column.where(~dash), errors='coerce')
+        invalid = (parsed.isna() & column.notna()).to_numpy() & ~dash
+
+        values = parsed.astype('float64').tolist()
+        for i in dash.nonzero()[0]:
+            values[i] = 0
+        for i in invalid.nonzero()[0]:
+            values[i] = None
+        return values
+
+    @staticmethod
+    def load_tax_rates(tax_rates_file: Union[str, BinaryIO, dict] = "") -> dict:
+        """Load FY-specific tax rates from JSON file (rates already loaded
+        are returned as they are)"""
+        if isinstance(tax_rates_file, dict):
+            return tax_rates_file
         try:
+            # An uploaded file's stream can be read directly
+            if hasattr(tax_rates_file, 'read'):
+                return json.load(tax_rates_file)
             if tax_rates_file and os.path.isfile(tax_rates_file):
                 with open(tax_rates_file, 'r') as f:
                     return json.load(f)
@@ -0,0 +1,244 @@
+import csv
+import glob
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Final, Iterator, List
+
+from processors.base import TransactionProcessor
+from processors.pipeline import (
+    ReportPipeline, CapitalGainsReport, DividendsReport, HoldingsReport
+)
+from processors.utils.report_writer import OUTPUT_CSV
+from processors.utils.run_profile import RunProfile
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Extensions of the transaction files picked up from a batch directory
+TRANSACTION_EXTENSIONS: Final = ('.csv', '.parquet', '.feather', '.arrow')
+
+# Written to the output directory, one row per portfolio
+SUMMARY_FILE: Final = 'batch_summary.csv'
+SUMMARY_COLUMNS: Final = [
+    'Portfolio', 'Input', 'Output', 'Status', 'Seconds', 'Rows', 'Matches',
+    'Dividends', 'Warnings', 'Error'
+]
+# Stage timings and counters per portfolio, with profiling on
+PROFILE_FILE: Final = 'batch_profile.json'
+
+# FMV mapping and tax rates of the batch, set once per worker process
+_shared: Dict[str, dict] = {}
+
+
+def _init_worker(fmv_mapping: dict, fy_tax_rates: dict) -> None:
+    _shared['fmv_mapping'] = fmv_mapping
+    _shared['fy_tax_rates'] = fy_tax_rates
+
+
+class BatchProcessor:
+    """Capital gains (and dividends) reports for many portfolios in one
+    launch.
+
+    The FMV mapping and tax rates are loaded once and handed to a pool of
+    worker processes, which stay up for the whole batch, so start-up and
+    loading are paid once per worker rather than once per portfolio. A
+    failing portfolio is reported in the summary and does not stop the
+    others.
+    """
+
+    @staticmethod
+    def discover(source: str) -> List[str]:
+        """Transaction files of a batch, from a directory (its transaction
+        files, not recursive), a glob pattern, or a manifest file listing
+        one path per line (relative to the manifest, '#' for comments)"""
+        if os.path.isdir(source):
+            return sorted(
+                os.path.join(source, name) for name in os.listdir(source)
+                if name.lower().endswith(TRANSACTION_EXTENSIONS)
+                and os.path.isfile(os.path.join(source, name))
+            )
+        if glob.has_magic(source):
+            return sorted(
+                path for path in glob.glob(source, recursive=True)
+                if os.path.isfile(path)
+            )
+        if os.path.isfile(source):
+            base_dir = os.path.dirname(source)
+            with open(source, 'r') as f:
+                return [
+                    os.path.join(base_dir, line.strip()) for line in f
+                    if line.strip() and not line.lstrip().startswith('#')
+                ]
+        raise FileNotFoundError(
+            f"Batch source '{source}' is not a directory, glob pattern or manifest file")
+
+    @staticmethod
+    def output_names(inputs: List[str]) -> List[str]:
+        """Output base name of each portfolio: its file name without the
+        extension, numbered when several inputs share one"""
+        names = []
+        seen: Dict[str, int] = {}
+        for path in inputs:
+            name = os.path.splitext(os.path.basename(path))[0]
+            seen[name] = seen.get(name, 0) + 1
+            names.append(name if seen[name] == 1 else f"{name}_{seen[name]}")
+        return names
+
+    @staticmethod
+    def process_portfolios(
+        inputs: List[str],
+        output_dir: str,
+        overwrite: bool,
+        fmv_data_file: str = "",
+        tax_rates_file: str = "",
+        workers: int = 1,
+        process_dividends: bool = False,
+        holdings: bool = False,
+        profile: bool = False,
+        **settings
+    ) -> List[dict]:
+        """Process each transactions file into `output_dir`/<name>.<format>
+        with its FMV cross check in <name>_fmv_crossmatch.csv (and
+        <name>_dividends.csv and <name>_dividends_summary.csv with
+        `process_dividends`, <name>_holdings.csv with `holdings`), with
+        `workers` portfolios at a time. `settings` are passed on to
+        CGProcessor.process_all_transactions.
+
+        Returns a result per portfolio, in input order, which is also
+        written to `output_dir`/batch_summary.csv. With `profile`, each
+        result carries its portfolio's stage timings and counters, also
+        saved to `output_dir`/batch_profile.json.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        output_format = settings.get('output_format', OUTPUT_CSV)
+
+        fmv_mapping = TransactionProcessor.load_fmv_mapping(fmv_data_file)
+        fy_tax_rates = TransactionProcessor.load_tax_rates(tax_rates_file)
+
+        jobs = [
+            dict(
+                portfolio=name,
+                input_file=os.path.abspath(path),
+                output_file=os.path.abspath(
+                    os.path.join(output_dir, f"{name}.{output_format}")),
+                dividends_file=os.path.abspath(
+                    os.path.join(output_dir, f"{name}_dividends.csv"))
+                if process_dividends else "",
+                dividends_summary_file=os.path.abspath(
+                    os.path.join(output_dir, f"{name}_dividends_summary.csv"))
+                if process_dividends else "",
+                holdings_file=os.path.abspath(
+                    os.path.join(output_dir, f"{name}_holdings.csv"))
+                if holdings else "",
+                fmv_audit_file=os.path.abspath(
+                    os.path.join(output_dir, f"{name}_fmv_crossmatch.csv")),
+                overwrite=overwrite,
+                fmv_data_file=fmv_data_file,
+                profile=profile,
+                settings=settings
+            )
+            for name, path in zip(BatchProcessor.output_names(inputs), inputs)
+        ]
+
+        if workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(
+                max_workers=min(workers, len(jobs)),
+                initializer=_init_worker,
+                initargs=(fmv_mapping, fy_tax_rates)
+            ) as executor:
+                results = list(BatchProcessor._collect(
+                    executor.map(BatchProcessor._process_portfolio, jobs)))
+        else:
+            _init_worker(fmv_mapping, fy_tax_rates)
+            results = list(BatchProcessor._collect(
+                map(BatchProcessor._process_portfolio, jobs)))
+
+        BatchProcessor.write_summary(
+            results, os.path.join(output_dir, SUMMARY_FILE))
+        if profile:
+            with open(os.path.join(output_dir, PROFILE_FILE), 'w') as f:
+                json.dump({
+                    result['portfolio']: result['profile'] for result in results
+                }, f, indent=2)
+        return results
+
+    @staticmethod
+    def _collect(results: Iterator[dict]) -> Iterator[dict]:
+        for result in results:
+            if result['status'] == 'ok':
+                logger.info(
+                    f"{result['portfolio']}: {result['matches']} matches in {result['seconds']:.2f}s")
+            else:
+                logger.error(f"{result['portfolio']}: failed, {result['error']}")
+            yield result
+
+    @staticmethod
+    def _process_portfolio(job: dict) -> dict:
+        """Worker entry point, one portfolio. Errors are returned in the
+        result rather than raised"""
+        result = dict(
+            portfolio=job['portfolio'],
+            input=job['input_file'],
+            output=job['output_file'],
+            status='ok',
+            error=''
+        )
+        profile = RunProfile()
+        try:
+            TransactionProcessor.check_files(
+                transactions_data_file=job['input_file'],
+                output_file=job['output_file'],
+                overwrite=job['overwrite']
+            )
+            transactions_df = TransactionProcessor.initialize_data(
+                transactions_data_file=job['input_file'],
+                fmv_data_file=job['fmv_data_file'],
+                fmv_mapping=_shared['fmv_mapping'],
+                profile=profile
+            )
+            pipeline = ReportPipeline(profile)
+            pipeline.register(CapitalGainsReport(
+                output_file=job['output_file'],
+                fmv_data_file=job['fmv_data_file'],
+                tax_rates_file=_shared['fy_tax_rates'],
+                fmv_audit_file=job['fmv_audit_file'],
+                **job['settings']
+            ))
+            if job['dividends_file']:
+                pipeline.register(DividendsReport(
+                    output_file=job['dividends_file'],
+                    summary_file=job['dividends_summary_file']
+                ))
+            if job['holdings_file']:
+                pipeline.register(HoldingsReport(output_file=job['holdings_file']))
+            pipeline.run(transactions_df)
+        except Exception as e:
+            result['status'] = 'failed'
+            result['error'] = f"{type(e).__name__}: {e}"
+
+        run = profile.to_dict()
+        counters = run['counters']
+        result.update(
+            seconds=run['wall_seconds'],
+            rows=counters.get('rows_ingested', 0),
+            matches=counters.get('matches', 0),
+            dividends=counters.get('dividends', 0),
+            warnings=counters.get('warnings', 0) + counters.get('errors', 0)
+        )
+        if job['profile']:
+            result['profile'] = run
+        return result
+
+    @staticmethod
+    def write_summary(results: List[dict], summary_file: str) -> None:
+        with open(summary_file, 'w', newline='') as f:
+            writer = csv.writer(f, lineterminator='\n')
+            writer.writerow(SUMMARY_COLUMNS)
+            for result in results:
+                writer.writerow([
+                    result['portfolio'], result['input'], result['output'],
+                    result['status'], f"{result['seconds']:.3f}",
+                    result['rows'], result['matches'], result['dividends'],
+                    result['warnings'], result['error']
+                ])
@@ -1,10 +1,25 @@
 from processors.base import TransactionProcessor
 import pandas as pd
-import os
-from typing import Final, Union, Dict, Any
+import numpy as np
+import math
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from typing import Final, Union, Dict, Any, Optional, Tuple, Iterator, Iterable, Callable, TextIO, BinaryIO
 from enum import Enum
 from .utils.lot_matcher import LotMatcher
+from .utils.lot_engine import (
+    LotEngine, BUY_TRANSACTION_TYPES, SELL_TRANSACTION_TYPES,
+    ENGINE_COLUMNAR, ENGINES,
+    MATCH_FIELDS, GRANDFATHERING_CUTOFF
+)
 from .utils.sell_transaction_processor import SellTransactionProcessor
+from .utils.lot_book import LotBook
+from .utils.lot import Lot
+from .utils.lot_snapshot import LotSnapshot
+from .utils.report_writer import ReportWriter, OUTPUT_CSV
+from .utils.run_profile import RunProfile
+from .utils.engine_context import EngineContext
+from .utils.worker_pool import WorkerPool
 
 import logging
 logger = logging.getLogger(__name__)
@@ -12,6 +27,7 @@ logger = logging.getLogger(__name__)
 # CONFIGURATION
 FALLBACK_LTCG_RATE: Final = 0.125
 FALLBACK_STCG_RATE: Final = 0.2
+GRANDFATHERING_CUTOFF_DATE: Final = pd.Timestamp(GRANDFATHERING_CUTOFF)
 
 
 class CG_Tye(Enum):
@@ -19,150 +35,192 @@ class CG_Tye(Enum):
     STCG = 2
 
 
+# Chunks submitted per worker process, so uneven companies still balance
+CHUNKS_PER_WORKER: Final = 4
+# Chunks in flight per worker. The shared pool (see WorkerPool) may have
+# more processes than a run's workers, this keeps the run to its own
+# share of them and bounds the results held by the parent
+MAX_PENDING_CHUNKS_PER_WORKER: Final = 1
+# Below this many rows (or with a single company) companies are matched
+# in-process, handing them to workers costs more than it saves
+MIN_PARALLEL_ROWS: Final = 20_000
+
+# Matches buffered before a report batch is built and written
+REPORT_BATCH_MATCHES: Final = 200_000
+
+# Rows of consecutive companies whose columns the columnar engine reads
+# at once, amortising the per-call cost of pandas over small companies
+COLUMN_BLOCK_ROWS: Final = 100_000
+
+# Columns the company processors read, the only ones shipped to workers
+COMPANY_COLUMNS: Final = [
+    'Transaction Date', 'Transaction Type', 'Company Name',
+    'Shares(Credits/Debits)', 'Price', 'Source', 'FMV', 'ISIN',
+    'FY', 'Quarter'
+]
+
+
 class CGProcessor(TransactionProcessor):
     """Handles capital gains calculations with lot tracking"""
 
     @staticmethod
-    def _create_csv_result(
-        lot_match_result, row, fy_tax_rates, ltcg_threshold_days, fmv_chosen_companies
-    ):
-        """Create CSV result from lot matching result"""
-        chosen_lot = lot_match_result['chosen_lot']
-        use_qty = lot_match_result['use_qty']
-
-        # Extract transaction details
-        sell_price = float(row['Price']) if str(row['Price']) != '--' else 0
-        sell_date = row['Transaction Date']
-        company = row['Company Name']
-        source = row['Source']
-        fy = row['FY']
-        fy_qtr = row['Quarter']
+    def _round_cents(values: np.ndarray) -> np.ndarray:
+        """Round to 2 decimals exactly like the builtin round().
+
+        np.round scales by 100 and can round the other way when the scaled
+        value lands on a half, so those few values go through round().
+        """
+        rounded = np.round(values, 2)
+        scaled = values * 100
+        near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+        for i in np.flatnonzero(near_half):
+            rounded[i] = round(float(values[i]), 2)
+        return rounded
+
+    @staticmethod
+    def _build_report(
+        transactions_df: pd.DataFrame, matches: list, ltcg_threshold_days: int
+    ) -> pd.DataFrame:
+        """Classify and price raw lot matches over whole columns, into
+        report rows typed as in REPORT_SCHEMA (plus the sell's ISIN, for
+        the FMV cross check).
+
+        `matches` holds the MATCH_FIELDS tuples recorded by lot matching.
+        The remaining sell and buy row fields are gathered from
+        `transactions_df` by index label.
+        """
+        raw = pd.DataFrame.from_records(matches, columns=MATCH_FIELDS)
+        sells = transactions_df[
+            ['Transaction Date', 'Company Name', 'Source', 'FY', 'Quarter', 'ISIN']
+        ].take(transactions_df.index.get_indexer(raw['sell_index']))
+        buys = transactions_df[
+            ['Transaction Date', 'Transaction Type', 'Source', 'FMV']
+        ].take(transactions_df.index.get_indexer(raw['buy_index']))
+
+        use_qty = raw['use_qty'].to_numpy(dtype=np.float64)
+        sell_price = raw['sell_price'].to_numpy(dtype=np.float64)
+        buy_price = raw['buy_price'].to_numpy(dtype=np.float64)
+        fmv = buys['FMV'].to_numpy(dtype=np.float64)
+        sell_date = sells['Transaction Date'].to_numpy()
+        buy_date = buys['Transaction Date'].to_numpy()
 
         # Calculate holding period and tax classification
-        holding_days = (sell_date - chosen_lot['date']).days
-        cg_type = CG_Tye.LTCG if holding_days >= ltcg_threshold_days else CG_Tye.STCG
-
-        # Get FY-specific tax rates if available
-        if fy in fy_tax_rates:
-            rates = fy_tax_rates.get(fy, {})
-            if cg_type == CG_Tye.LTCG:
-                tax_rate = rates.get('ltcg_rate', FALLBACK_LTCG_RATE)
-            else:
-                tax_rate = rates.get('stcg_rate', FALLBACK_STCG_RATE)
-        else:
-            # Use default rates
-            tax_rate = FALLBACK_LTCG_RATE if cg_type == CG_Tye.LTCG else FALLBACK_STCG_RATE
+        holding_days = (
+            (sell_date - buy_date) // np.timedelta64(1, 'D')).astype(np.int64)
+        is_ltcg = holding_days >= ltcg_threshold_days
 
         # Apply grandfathering logic
-        buying_price = chosen_lot['price']
-        fmv_chosen = False
-        grandfathering_cutoff_date = pd.to_datetime(
-            '31-10-2018', format='%d-%m-%Y')
-
-        if (cg_type == CG_Tye.LTCG and
-            chosen_lot['date'] < grandfathering_cutoff_date and
-                sell_date > grandfathering_cutoff_date):
-            buying_price = max(buying_price, chosen_lot['FMV'])
-            fmv_chosen = True
-
-            # Track FMV usage
-            if company not in fmv_chosen_companies:
-                fmv_chosen_companies[company] = {}
-
-            fmv_chosen_companies[company]['ISIN'] = row['ISIN']
-            fmv_chosen_companies[company]['orig_buy_price'] = chosen_lot['price']
-            fmv_chosen_companies[company]['FMV'] = chosen_lot['FMV']
-            fmv_chosen_companies[company]['buying_price'] = buying_price
-
-        # Calculate financial values
-        buy_value = buying_price * use_qty
-        sell_value = sell_price * use_qty
-        profit = (sell_price - buying_price) * use_qty
-
-        # Create fields dictionary matching the current format
-        fields = {
-            'sell_source': source,
-            'company_name': company,
-            'sell_date': sell_date.strftime('%d-%b-%Y'),
-            'transaction_type': 'SELL',
-            'sell_quantity': use_qty,
-            'sell_price': sell_price,
-            'buy_source': chosen_lot['source'],
-            'buy_transaction_type': chosen_lot['Type'],
-            'buy_date': chosen_lot['date'].strftime('%d-%b-%Y'),
+        cutoff = GRANDFATHERING_CUTOFF_DATE.to_datetime64()
+        fmv_used = is_ltcg & (buy_date < cutoff) & (sell_date > cutoff)
+        adj_buy_price = np.where(fmv_used & (fmv > buy_price), fmv, buy_price)
+
+        # '--' prices are an int 0 in the matches (see numeric_column_values),
+        # which the report prints as 0, not 0.0
+        sell_price_column = CGProcessor._placeholder_prices(
+            sell_price, matches, MATCH_FIELDS.index('sell_price'))
+        buy_price_column = CGProcessor._placeholder_prices(
+            buy_price, matches, MATCH_FIELDS.index('buy_price'))
+        adj_buy_price_column = np.where(
+            adj_buy_price == buy_price, buy_price_column, adj_buy_price)
+
+        round_cents = CGProcessor._round_cents
+        return pd.DataFrame({
+            'Sell Source': sells['Source'].to_numpy(),
+            'Company Name': sells['Company Name'].to_numpy(),
+            'Sell Date': sell_date,
+            'Transaction Type': 'SELL',
+            'Sell Quantity': use_qty,
+            'Sell Price': sell_price_column,
+            'Buy Source': buys['Source'].to_numpy(),
+            'Buy Transaction Type': buys['Transaction Type'].str.strip().str.upper(
+            ).to_numpy(),
+            'Buy Date': buy_date,
             # Before deduction
-            'buy_shares_available': chosen_lot['shares'] + use_qty,
-            'buy_price': chosen_lot['price'],
-            'sell_value': round(sell_value, 2),
-            'buy_value': round(buy_value, 2),
-            'profit': round(profit, 2),
-            'holding_days': holding_days,
-            'ltcg_stcg': cg_type.name,
-            'quarter': fy_qtr,
-            'financial_year': fy,
-            'remaining_balance': lot_match_result['new_running_balance'],
-            'fmv_used': fmv_chosen,
-            'fmv_value': chosen_lot['FMV'],
-            'original_buy_price': chosen_lot['price'],
-            'adj_buy_price': buying_price
-        }
+            'Buy Quantity': raw['buy_shares_available'].to_numpy(dtype=np.float64),
+            'Buy Price': buy_price_column,
+            'Sell Value': round_cents(sell_price * use_qty),
+            'Buy Value': round_cents(adj_buy_price * use_qty),
+            'Profit': round_cents((sell_price - adj_buy_price) * use_qty),
+            'Holding Days': holding_days,
+            'LTCG/STCG': np.where(is_ltcg, CG_Tye.LTCG.name, CG_Tye.STCG.name),
+            'Quarter': sells['Quarter'].to_numpy(),
+            'Financial Year': sells['FY'].to_numpy(),
+            'Remaining Balance': raw['remaining_balance'].to_numpy(dtype=np.float64),
+            'FMV Used?': fmv_used,
+            'FMV Value': fmv,
+            'Original Buy Price': buy_price_column,
+            ' Adj Buy Price': adj_buy_price_column,
+            'ISIN': sells['ISIN'].to_numpy()
+        })
+
+    @staticmethod
+    def _placeholder_prices(prices: np.ndarray, matches: list, field: int) -> np.ndarray:
+        """`prices` (a MATCH_FIELDS `field` of `matches`, as floats) with
+        the placeholder int 0 of '--' prices put back, as an object column
+        when there are any"""
+        placeholders = np.fromiter(
+            (type(match[field]) is int for match in matches),
+            dtype=bool, count=len(matches))
+        if not placeholders.any():
+            return prices
+        column = prices.astype(object)
+        column[placeholders] = 0
+        return column
 
-        # Convert to CSV line maintaining field order
-        csv_line = ','.join(str(fields[key]) for key in fields.keys())
+    @staticmethod
+    def _fmv_usage(report: pd.DataFrame) -> dict:
+        """Last grandfathered (FMV) match per company, for the FMV cross check"""
+        used = report[report['FMV Used?']].drop_duplicates(
+            'Company Name', keep='last')
+        return {
+            company: {
+                'ISIN': isin,
+                'orig_buy_price': orig_buy_price,
+                'FMV': fmv,
+                'buying_price': buying_price
+            }
+            for company, isin, orig_buy_price, fmv, buying_price in zip(
+                used['Company Name'].tolist(), used['ISIN'].tolist(),
+                used['Original Buy Price'].tolist(), used['FMV Value'].tolist(),
+                used[' Adj Buy Price'].tolist()
+            )
+        }
 
-        return csv_line
+    @staticmethod
+    def _encode_report(
+        transactions_df: pd.DataFrame, matches: list, context: EngineContext
+    ) -> Any:
+        """Build the report for a batch of matches, encoded for the
+        output format's ReportWriter"""
+        with context.profile.stage('report_build'):
+            report = CGProcessor._build_report(
+                transactions_df, matches, **context.report_kwargs())
+            context.fmv_chosen_companies.update(CGProcessor._fmv_usage(report))
+        with context.profile.stage('report_encode'):
+            return ReportWriter.writer_class(context.output_format).encode(report)
 
     @staticmethod
     def _handle_sell_transaction(
         ctype,
         row, lots, running_balance, sell_processor: SellTransactionProcessor,
-        fy_tax_rates, ltcg_threshold_days, fmv_chosen_companies
+        matches: list
     ) -> Union[Dict[Any, Any], None]:
         """Handle sell transactions with comprehensive error recovery"""
         try:
             qty = float(row['Shares(Credits/Debits)']
                         ) if str(row['Shares(Credits/Debits)']) != '--' else 0
             price = float(row['Price']) if str(row['Price']) != '--' else 0
-            sell_qty = abs(qty)
-            sell_price = price
-            sell_date = row['Transaction Date']
-            company = row['Company Name']
-            source = row['Source']
-
-            # Validate inputs
-            if sell_qty <= 0:
-                logger.warning(
-                    f"{ctype}: Invalid sell quantity {sell_qty} for {company}")
-                return None
 
-            if sell_price <= 0:
-                logger.warning(
-                    f"{ctype}: Invalid sell price {sell_price} for {company}")
+            new_running_balance = LotEngine.apply_sell(
+                ctype, qty, price, row['Transaction Date'],
+                row['Company Name'], row['Source'], row.name, lots,
+                running_balance, sell_processor, matches
+            )
+            if new_running_balance is None:
                 return None
 
-            # Process the sell transaction
-            sell_results, new_running_balance = \
-                sell_processor.process_sell_transaction(
-                    ctype, lots, sell_qty, sell_price, sell_date, company, source, running_balance
-                )
-
-            # Convert to CSV format
-            csv_results = []
-            for result in sell_results:
-                try:
-                    csv_line = CGProcessor._create_csv_result(
-                        result, row, fy_tax_rates,
-                        ltcg_threshold_days, fmv_chosen_companies
-                    )
-                    csv_results.append(csv_line)
-                except Exception as e:
-                    logger.error(
-                        f"{ctype}: Error creating CSV result for {company}: {e}")
-                    continue
-
             return {
                 'type': 'sell',
-                'results': csv_results,
                 'running_balance': new_running_balance
             }
 
@@ -172,7 +230,7 @@ class CGProcessor(TransactionProcessor):
             return None
 
     @staticmethod
-    def _handle_buy_transaction(ctype, row, lots: list, running_balance, company):
+    def _handle_buy_transaction(ctype, row, lots: LotBook, running_balance, company):
         try:
             tdate = row['Transaction Date']
             ctype = row['Transaction Type'].strip().lower()
@@ -180,76 +238,35 @@ class CGProcessor(TransactionProcessor):
                         ) if str(row['Shares(Credits/Debits)']) != '--' else 0
             price = float(row['Price']) if str(row['Price']) != '--' else 0
             source = row['Source']
-            fmv = row['FMV']
-
-            # Validate inputs
-            if qty <= 0:
-                logger.warning(
-                    f"{ctype}: Invalid quantity {qty} for {company} buy transaction")
-                return {'type': 'buy', 'running_balance': running_balance}
-
-            if price < 0:
-                logger.warning(
-                    f"{ctype}: Invalid price {price} for {company} buy transaction")
-                return {'type': 'buy', 'running_balance': running_balance}
-
-            # Create new lot
-            lots.append({
-                'source': source,
-                'Type': ctype.upper(),
-                'shares': qty,
-                'price': price,
-                'date': tdate,
-                'FMV': fmv
-            })
-
-            running_balance += qty
-            logger.debug(
-                f"{ctype}: Added buy lot for {company}: {qty} shares at {price}")
-
-            return {
-                'type': 'buy',
-                'running_balance': running_balance
-            }
+            index = row.name
         except Exception as e:
             logger.error(f"{ctype}: Error handling buy transaction: {e}")
             return {'type': 'buy', 'running_balance': running_balance}
 
+        return {
+            'type': 'buy',
+            'running_balance': LotEngine.apply_buy(
+                ctype, tdate, qty, price, source, index,
+                lots, running_balance, company
+            )
+        }
+
     @staticmethod
-    def _handle_stock_split(ctype, row, lots: list, running_balance, company):
+    def _handle_stock_split(ctype, row, lots: LotBook, running_balance, company):
         tdate = row['Transaction Date']
         qty = float(
             row['Shares(Credits/Debits)']
         ) if str(row['Shares(Credits/Debits)']) != '--' else 0
 
-        pre_split_balance = running_balance
-        if pre_split_balance > 0 and qty > 0:
-            split_ratio = (pre_split_balance + qty) / pre_split_balance
-            # Apply split ratio to existing lots
-            for lot in lots:
-                lot['shares'] *= split_ratio
-                lot['price'] /= split_ratio
-            running_balance += qty
-            logger.info(
-                f"{ctype}: Applied stock split for {company} on {tdate}:"
-                f" ratio={split_ratio:.4f}")
-        else:
-            logger.warning(
-                f"{ctype}: Could not infer split ratio for {company} on {tdate} "
-                f"(pre_split_balance={pre_split_balance}, qty={qty})"
-            )
-            # Don't apply any changes if we can't calculate ratio
-            if pre_split_balance == 0:
-                logger.error(
-                    f"{ctype}: Error: No existing shares for stock split of {company}")
-
         return {
             'type': 'stock_split',
-            'running_balance': running_balance
+            'running_balance': LotEngine.apply_stock_split(
+                ctype, tdate, qty, lots, running_balance, company
+            )
         }
 
     @staticmethod
-    def _handle_other_transaction(ctype, row, lots: list, running_balance, company: str):
+    def _handle_other_transaction(ctype, row, lots: LotBook, running_balance, company: str):
         """Handle other transaction types (dividends, etc.) that don't affect capital gains"""
         import logging
         logger = logging.getLogger(__name__)
@@ -270,23 +287,13 @@ class CGProcessor(TransactionProcessor):
 
     @staticmethod
     def _process_single_transaction(
-        row, lots, running_balance, sell_processor,
-        fy_tax_rates, ltcg_threshold_days, fmv_chosen_companies,
+        row, lots, running_balance, sell_processor, matches: list,
         company: str
     ):
         """Process a single transaction with proper error handling"""
         ctype = row['Transaction Type'].strip().lower()
 
-        if ctype in [
-            'investment in stock',
-            'investment in fund',
-            'sip investment',
-            'bonus',
-            'demerger investment',
-            'merger investment',
-            'switch investment',
-            'dividend reinvestment'
-        ]:
+        if ctype in BUY_TRANSACTION_TYPES:
             return CGProcessor._handle_buy_transaction(
                 ctype=ctype, 
                 row=row,
@@ -294,16 +301,10 @@ class CGProcessor(TransactionProcessor):
                 running_balance=running_balance,
                 company=company
             )
-        elif ctype in [
-            'sell/redemption',
-            'merger redemption',
-            'demerger redemption',
-            'switch redemption'
-        ]:
+        elif ctype in SELL_TRANSACTION_TYPES:
             return CGProcessor._handle_sell_transaction(
                 ctype,
-                row, lots, running_balance, sell_processor,
-                fy_tax_rates, ltcg_threshold_days, fmv_chosen_companies
+                row, lots, running_balance, sell_processor, matches
             )
         elif ctype == 'stock split':
             return CGProcessor._handle_stock_split(ctype, row, lots, running_balance, company)
@@ -313,130 +314,553 @@ class CGProcessor(TransactionProcessor):
     @staticmethod
     def process_company(
             group,
-            fy_tax_rates: dict = {},
-            ltcg_rate: float = FALLBACK_LTCG_RATE,
-            stcg_rate: float = FALLBACK_STCG_RATE,
             simple_fifo_mode=True,
             same_source_only_matching=False,
-            results: list = [],
+            matches: Optional[list] = None,
             verbose: bool = False,
-            ltcg_threshold_days=365,
-            fmv_chosen_companies={}
+            company_states: Optional[dict] = None,
+            profile: Optional[RunProfile] = None
     ) -> None:
         """Refactored company processing with better structure"""
+        matches = [] if matches is None else matches
 
         # Initialize processors
         lot_matcher = LotMatcher(simple_fifo_mode, same_source_only_matching)
         sell_processor = SellTransactionProcessor(lot_matcher, verbose)
 
-        lots = []
-        running_balance = 0
         company = group.iloc[0]['Company Name']
+        lots, running_balance = LotEngine.initial_state(
+            company_states, company)
+        matches_before = len(matches)
+        appended_before, scanned_before = lots.appended_count, lots.scanned_count
 
         logger.info(f"Processing company: {company}")
 
         for idx, row in group.iterrows():
             try:
                 transaction_result = CGProcessor._process_single_transaction(
-                    row, lots, running_balance, sell_processor,
-                    fy_tax_rates, ltcg_threshold_days,
-                    fmv_chosen_companies, company
+                    row, lots, running_balance, sell_processor, matches,
+                    company
                 )
 
                 if transaction_result:
-                    if transaction_result['type'] == 'sell':
-                        results.extend(transaction_result['results'])
-                        running_balance = transaction_result['running_balance']
-                    else:
-                        running_balance = transaction_result['running_balance']
+                    running_balance = transaction_result['running_balance']
 
             except Exception as e:
                 logger.error(
                     f"Error processing transaction for {company} on {row['Transaction Date']}: {e}")
                 continue
 
+        if company_states is not None:
+            company_states[company] = (lots, running_balance)
+        if profile is not None:
+            LotEngine.count_company(
+                profile, lots, appended_before, scanned_before,
+                matches[matches_before:])
         logger.info(
-            f"Completed processing {company}: {len([r for r in results if company in str(r)])} transactions")
+            f"Completed processing {company}: {len(matches) - matches_before} transactions")
+
+    @staticmethod
+    def _matching_columns(frame: pd.DataFrame) -> dict:
+        """The columns LotEngine.match_company reads, as lists"""
+        return dict(
+            ctypes=frame['Transaction Type'].str.strip().str.lower().tolist(),
+            dates=frame['Transaction Date'].tolist(),
+            qtys=CGProcessor.numeric_column_values(
+                frame['Shares(Credits/Debits)']),
+            prices=CGProcessor.numeric_column_values(frame['Price']),
+            sources=frame['Source'].tolist(),
+            labels=frame.index.tolist()
+        )
+
+    @staticmethod
+    def _check_engine(engine: str) -> None:
+        if engine not in ENGINES:
+            raise ValueError(
+                f"Unknown engine '{engine}', expected one of {ENGINES}")
+
+    @staticmethod
+    def _process_company_chunk(
+        chunk: pd.DataFrame, company_ranges: list, context: EngineContext
+    ) -> Tuple[list, int, EngineContext]:
+        """Worker entry point: process a chunk of whole, ordered companies
+        (their row ranges in it) into its encoded report batches and
+        company count, with the worker's context holding its FMV usage,
+        record count and profile"""
+        batches = []
+        with context.profile.count_log_records() if context.profiled else nullcontext():
+            for batch in CGProcessor._match_batches(chunk, company_ranges, context):
+                batches.append(CGProcessor._encode_report(chunk, batch, context))
+                context.record_count += len(batch)
+        return batches, len(company_ranges), context
+
+    @staticmethod
+    def _match_batches(
+        ordered_df: pd.DataFrame, company_ranges: list, context: EngineContext,
+        on_company: Optional[Callable[[], None]] = None
+    ) -> Iterator[list]:
+        """Match companies (row ranges of a frame ordered by
+        partition_companies) in order, yielding their raw matches in
+        batches of whole companies.
+
+        The columnar engine reads the columns of blocks of consecutive
+        companies at once (their '--' placeholders parsed), each company
+        getting slices of their lists for LotEngine.match_company. The rows
+        engine runs process_company on each company's rows.
+        """
+        CGProcessor._check_engine(context.engine)
+        company_kwargs = context.company_kwargs()
+        profile = context.profile
+        matches = []
+        for block in CGProcessor._company_blocks(company_ranges):
+            offset = block[0][0]
+            if context.engine == ENGINE_COLUMNAR:
+                with profile.stage('lot_matching'):
+                    block_df = ordered_df.iloc[offset:block[-1][1]]
+                    companies = block_df['Company Name'].to_numpy()
+                    columns = CGProcessor._matching_columns(block_df)
+
+            for start, stop in block:
+                with profile.stage('lot_matching'):
+                    if context.engine == ENGINE_COLUMNAR:
+                        start, stop = start - offset, stop - offset
+                        LotEngine.match_company(
+                            company=companies[start],
+                            **{name: values[start:stop] for name, values in columns.items()},
+                            matches=matches,
+                            **company_kwargs
+                        )
+                    else:
+                        CGProcessor.process_company(
+                            group=ordered_df.iloc[start:stop], matches=matches,
+                            **company_kwargs)
+                if on_company is not None:
+                    on_company()
+                if len(matches) >= REPORT_BATCH_MATCHES:
+                    yield matches
+                    matches = []
+        if matches:
+            yield matches
+
+    @staticmethod
+    def _company_blocks(company_ranges: list) -> Iterator[list]:
+        """Consecutive company ranges, in blocks of COLUMN_BLOCK_ROWS rows
+        or more (but the last)"""
+        block = []
+        for start, stop in company_ranges:
+            block.append((start, stop))
+            if stop - block[0][0] >= COLUMN_BLOCK_ROWS:
+                yield block
+                block = []
+        if block:
+            yield block
+
+    @staticmethod
+    def _process_companies_parallel(
+        ordered_df: pd.DataFrame, company_ranges: list, context: EngineContext
+    ) -> Iterator[Tuple[list, int, int]]:
+        """Fan companies (row ranges of a frame ordered by
+        partition_companies) out to the shared WorkerPool in chunks.
+
+        Each company's lot state is independent, so workers return their
+        encoded report batches and FMV usage, which are yielded / merged
+        back here in submission order. Only a few chunks are in flight at a
+        time.
+        """
+        workers = context.workers
+        chunk_size = max(
+            1, math.ceil(len(company_ranges) / (workers * CHUNKS_PER_WORKER)))
+        max_pending = workers * MAX_PENDING_CHUNKS_PER_WORKER
+        # Workers fill a context of their own, merged back here
+        worker_context = context.for_worker()
+
+        def chunks():
+            # Consecutive companies are one slice, their ranges made
+            # relative to it
+            for i in range(0, len(company_ranges), chunk_size):
+                ranges = company_ranges[i:i + chunk_size]
+                offset = ranges[0][0]
+                yield ordered_df.iloc[offset:ranges[-1][1]][COMPANY_COLUMNS], [
+                    (start - offset, stop - offset) for start, stop in ranges]
+
+        def collect(future):
+            with context.profile.stage('worker_wait'):
+                chunk_batches, chunk_companies, chunk_context = future.result()
+            context.merge(chunk_context)
+            return chunk_batches, chunk_context.record_count, chunk_companies
+
+        with WorkerPool.acquire(workers) as executor:
+            pending = deque()
+            for chunk, ranges in chunks():
+                pending.append(executor.submit(
+                    CGProcessor._process_company_chunk, chunk, ranges, worker_context))
+                if len(pending) >= max_pending:
+                    yield collect(pending.popleft())
+            while pending:
+                yield collect(pending.popleft())
+
+    @staticmethod
+    def _write_company_results(
+        transactions_df: pd.DataFrame, writer: ReportWriter,
+        context: EngineContext,
+        progress: Optional[Callable[[int, int], None]] = None,
+        lot_origins: Optional[pd.DataFrame] = None
+    ) -> None:
+        """Match every company of a frame, streaming its report to `writer`
+        and counting its records into `context`.
+
+        `progress` is called with the companies done and the frame's
+        company count as companies finish. `lot_origins` holds the buy
+        transactions of lots resumed from a snapshot (see
+        process_all_transactions), looked up by label like the frame's.
+        """
+        profile = context.profile
+
+        # Matches refer back to their transactions by index label
+        if not transactions_df.index.is_unique:
+            transactions_df = transactions_df.reset_index(drop=True)
+
+        # Companies in global date order of first appearance, resumed ones
+        # first in the order of the run they were resumed from, as they
+        # would go in a full replay
+        with profile.stage('company_sort'):
+            ordered_df, company_ranges = CGProcessor.partition_companies(
+                transactions_df, list(context.company_states or ()))
+
+        report_df = transactions_df if lot_origins is None else pd.concat(
+            [transactions_df, lot_origins])
+
+        company_count = len(company_ranges)
+        companies_done = 0
+        profile.count('companies', company_count)
+
+        def companies_finished(count: int = 1) -> None:
+            nonlocal companies_done
+            companies_done += count
+            if progress is not None:
+                progress(companies_done, company_count)
+
+        # Stream each batch of companies (or chunk) out as it finishes
+        if context.workers > 1 and company_count > 1 \
+                and len(ordered_df) >= MIN_PARALLEL_ROWS:
+            for chunk_batches, chunk_count, chunk_companies in \
+                    CGProcessor._process_companies_parallel(
+                        ordered_df, company_ranges, context):
+                with profile.stage('report_write'):
+                    for encoded in chunk_batches:
+                        writer.write(encoded)
+                context.record_count += chunk_count
+                companies_finished(chunk_companies)
+        else:
+            for batch in CGProcessor._match_batches(
+                ordered_df, company_ranges, context, companies_finished
+            ):
+                encoded = CGProcessor._encode_report(report_df, batch, context)
+                with profile.stage('report_write'):
+                    writer.write(encoded)
+                context.record_count += len(batch)
 
     @staticmethod
     def process_all_transactions(
         transactions_df: pd.DataFrame,
-        output_file: str,
+        output_file: Union[str, TextIO, BinaryIO],
         overwrite: bool,
         fmv_data_file: str = "",
         tax_rates_file: str = "",
         verbose: bool = False,
         same_source_only_matching: bool = False,
         simple_fifo_mode: bool = True,
-        ltcg_threshold_days: int = 365
-    ):
-        # Load FY-specific tax rates
-        fy_tax_rates = CGProcessor.load_tax_rates(tax_rates_file)
-        results = []
-
-        transaction_type_priority = {
-            'investment in stock': 1,
-            'investment in fund': 2,
-            'sip investment': 3,
-            'dividend reinvestment': 4,
-            'bonus': 5,
-            'rights': 6,
-            'stock split': 7,
-            'merger investment': 8,
-            'demerger investment': 9,
-
-            'dividend': 10,
-
-            'sell/redemption': 90,
-            'merger redemption': 91,
-            'demerger redemption': 92,
-            'swp redemption': 93
-        }
+        ltcg_threshold_days: int = 365,
+        engine: str = ENGINE_COLUMNAR,
+        workers: int = 1,
+        progress: Optional[Callable[[int, int], None]] = None,
+        output_format: str = OUTPUT_CSV,
+        snapshot_file: str = "",
+        resume_from: str = "",
+        profile: Optional[RunProfile] = None,
+        fmv_audit_file: Union[str, TextIO] = "",
+        keep_lot_states: bool = False
+    ) -> EngineContext:
+        """Process a whole transaction history into the report.
+
+        With `snapshot_file`, the lot matching state at the end of the run
+        is saved there (see LotSnapshot). With `resume_from`, matching
+        resumes from such a snapshot, so only transactions after its
+        checkpoint are processed and only their matches are reported. The
+        full history is replayed instead if it no longer matches the
+        snapshot up to the checkpoint, e.g. after a back-dated transaction.
+
+        Stage timings and counters are added to `profile` when given. The
+        run's EngineContext is returned, see process_partitions. With
+        `keep_lot_states` (or a snapshot), its company_states hold every
+        company's open lots and running balance at the end.
+        """
+        company_states = None
+        lot_origins = None
+        matching_settings = dict(
+            same_source_only_matching=same_source_only_matching,
+            simple_fifo_mode=simple_fifo_mode
+        )
+
+        if snapshot_file or resume_from:
+            # Lots refer to their buy transactions by index label
+            transactions_df = transactions_df.reset_index(drop=True)
+        if snapshot_file or resume_from or keep_lot_states:
+            company_states = {}
+            if workers > 1:
+                logger.warning(
+                    "Snapshots and open lots need the lot state of every company, "
+                    "processing with 1 worker")
+                workers = 1
+
+        processed_df = transactions_df
+        if resume_from:
+            with profile.stage('resume') if profile is not None else nullcontext():
+                resumed = CGProcessor._resume(
+                    transactions_df, resume_from, matching_settings)
+            if resumed is not None:
+                processed_df, company_states, lot_origins = resumed
+
+        context = CGProcessor.process_partitions(
+            partitions=[processed_df],
+            output_file=output_file,
+            overwrite=overwrite,
+            fmv_data_file=fmv_data_file,
+            tax_rates_file=tax_rates_file,
+            verbose=verbose,
+            same_source_only_matching=same_source_only_matching,
+            simple_fifo_mode=simple_fifo_mode,
+            ltcg_threshold_days=ltcg_threshold_days,
+            engine=engine,
+            workers=workers,
+            progress=progress,
+            output_format=output_format,
+            company_states=company_states,
+            lot_origins=lot_origins,
+            profile=profile,
+            fmv_audit_file=fmv_audit_file
+        )
+
+        if snapshot_file:
+            if transactions_df.empty:
+                logger.warning(
+                    f"No transactions, snapshot {snapshot_file} not written")
+                return context
+            lookup_df = processed_df if lot_origins is None else pd.concat(
+                [processed_df, lot_origins])
+            with profile.stage('snapshot') if profile is not None else nullcontext():
+                CGProcessor._snapshot(
+                    company_states, lookup_df, transactions_df, matching_settings
+                ).save(snapshot_file)
+            logger.info(f"Lot snapshot saved to {snapshot_file}")
+        return context
 
-        transactions_df['type_priority'] = transactions_df['Transaction Type'].str.lower(
-        ).map(transaction_type_priority)
+    @staticmethod
+    def _resume(
+        transactions_df: pd.DataFrame, resume_from: str, matching_settings: dict
+    ) -> Optional[Tuple[pd.DataFrame, dict, Optional[pd.DataFrame]]]:
+        """Transactions after a snapshot's checkpoint, with the company
+        states and lot origins to process them from, or None when the
+        full history has to be replayed"""
+        snapshot = LotSnapshot.load(resume_from)
+        checkpoint = snapshot.checkpoint.strftime('%d-%b-%Y')
+
+        if snapshot.settings != matching_settings:
+            logger.warning(
+                f"Snapshot {resume_from} was taken with {snapshot.settings}, "
+                f"replaying the full history")
+            return None
 
-        fmv_chosen_companies = {
+        is_new = transactions_df['Transaction Date'] > snapshot.checkpoint
+        if LotSnapshot.history_digest(transactions_df[~is_new]) != snapshot.digest:
+            logger.warning(
+                f"Transactions up to {checkpoint} differ from snapshot "
+                f"{resume_from} (back-dated or edited), replaying the full history")
+            return None
 
+        new_df = transactions_df[is_new].reset_index(drop=True)
+        company_states, lot_origins = CGProcessor._restore_states(
+            snapshot, first_label=len(new_df))
+        logger.info(
+            f"Resuming from {resume_from}: {len(new_df)} transactions after {checkpoint}")
+        return new_df, company_states, lot_origins
+
+    @staticmethod
+    def _restore_states(
+        snapshot: LotSnapshot, first_label: int
+    ) -> Tuple[dict, Optional[pd.DataFrame]]:
+        """Rebuild lot books from a snapshot. The buy transactions of the
+        lots are returned as a frame labelled from `first_label` on"""
+        company_states = {}
+        origins = []
+        label = first_label
+        for company, (running_balance, lot_records) in snapshot.companies.items():
+            lots = LotBook()
+            for source, shares, price, tdate, ctype, fmv in lot_records:
+                tdate = pd.Timestamp(tdate)
+                lots.append(Lot(source, shares, price, tdate, label))
+                origins.append((tdate, ctype, source, fmv))
+                label += 1
+            company_states[company] = (lots, running_balance)
+
+        if not origins:
+            return company_states, None
+        lot_origins = pd.DataFrame(
+            origins,
+            columns=['Transaction Date', 'Transaction Type', 'Source', 'FMV'],
+            index=range(first_label, label)
+        )
+        return company_states, lot_origins
+
+    @staticmethod
+    def _snapshot(
+        company_states: dict, lookup_df: pd.DataFrame,
+        history_df: pd.DataFrame, matching_settings: dict
+    ) -> LotSnapshot:
+        """Snapshot of the company states after processing `history_df`.
+        The lots' buy transactions are looked up in `lookup_df`"""
+        open_lots = {
+            company: list(lots)
+            for company, (lots, running_balance) in company_states.items()
         }
-        # Ensure groupby gets stocks in global date order
-        transactions_df_grouped = transactions_df.groupby(
-            'Company Name', sort=False)
-        for cname, group in transactions_df_grouped:
-            group_sorted = group.sort_values(
-                ['Transaction Date', 'type_priority'])
-
-            CGProcessor.process_company(
-                group=group_sorted,
-                results=results,
-                verbose=verbose,
-                fy_tax_rates=fy_tax_rates,
-                same_source_only_matching=same_source_only_matching,
-                simple_fifo_mode=simple_fifo_mode,
-                ltcg_threshold_days=ltcg_threshold_days,
-                fmv_chosen_companies=fmv_chosen_companies
-            )
+        buys = lookup_df[['Transaction Type', 'FMV']].take(
+            lookup_df.index.get_indexer(
+                [lot.index for lots in open_lots.values() for lot in lots]))
+        buy_types = iter(buys['Transaction Type'].tolist())
+        buy_fmvs = iter(buys['FMV'].tolist())
+
+        companies = {
+            company: (company_states[company][1], [
+                [lot.source, lot.shares, lot.price, lot.date.isoformat(),
+                 next(buy_types), next(buy_fmvs)]
+                for lot in lots
+            ])
+            for company, lots in open_lots.items()
+        }
+        return LotSnapshot(
+            checkpoint=history_df['Transaction Date'].max(),
+            digest=LotSnapshot.history_digest(history_df),
+            settings=matching_settings,
+            companies=companies
+        )
+
+    @staticmethod
+    def process_partitions(
+        partitions: Iterable[pd.DataFrame],
+        output_file: Union[str, TextIO, BinaryIO],
+        overwrite: bool,
+        fmv_data_file: str = "",
+        tax_rates_file: str = "",
+        verbose: bool = False,
+        same_source_only_matching: bool = False,
+        simple_fifo_mode: bool = True,
+        ltcg_threshold_days: int = 365,
+        engine: str = ENGINE_COLUMNAR,
+        workers: int = 1,
+        progress: Optional[Callable[[int, int], None]] = None,
+        output_format: str = OUTPUT_CSV,
+        company_states: Optional[dict] = None,
+        lot_origins: Optional[pd.DataFrame] = None,
+        profile: Optional[RunProfile] = None,
+        fmv_audit_file: Union[str, TextIO] = ""
+    ) -> EngineContext:
+        """Process transaction frames one at a time into a single report.
+
+        Each frame must hold whole companies, e.g. the partitions from
+        TransactionProcessor.iter_partitions, and frames are processed in
+        the order given, so only one needs to be in memory at a time.
+
+        `progress(companies_done, company_count)` is called as companies
+        finish, counting within the current frame. Companies start from and
+        update their lots in `company_states` when it is given, which needs
+        a single worker.
+
+        The report is written as `output_format` (see ReportWriter), to a
+        path or an open stream: text for CSV, binary for Parquet/Feather.
+
+        With `profile`, the stage timings and counters of lot matching and
+        the report (the warnings and errors logged included) are added to it.
+
+        The run's state is kept in an EngineContext of its own, returned,
+        so runs can go on in parallel threads. Its FMV cross check is saved
+        to `fmv_audit_file` when given.
+        """
+        with CGProcessor.partition_writer(
+            output_file=output_file,
+            fmv_data_file=fmv_data_file,
+            tax_rates_file=tax_rates_file,
+            verbose=verbose,
+            same_source_only_matching=same_source_only_matching,
+            simple_fifo_mode=simple_fifo_mode,
+            ltcg_threshold_days=ltcg_threshold_days,
+            engine=engine,
+            workers=workers,
+            progress=progress,
+            output_format=output_format,
+            company_states=company_states,
+            lot_origins=lot_origins,
+            profile=profile,
+            fmv_audit_file=fmv_audit_file
+        ) as (context, write_partition):
+            for transactions_df in partitions:
+                write_partition(transactions_df)
+        return context
+
+    @staticmethod
+    @contextmanager
+    def partition_writer(
+        output_file: Union[str, TextIO, BinaryIO],
+        fmv_data_file: str = "",
+        tax_rates_file: str = "",
+        verbose: bool = False,
+        same_source_only_matching: bool = False,
+        simple_fifo_mode: bool = True,
+        ltcg_threshold_days: int = 365,
+        engine: str = ENGINE_COLUMNAR,
+        workers: int = 1,
+        progress: Optional[Callable[[int, int], None]] = None,
+        output_format: str = OUTPUT_CSV,
+        company_states: Optional[dict] = None,
+        lot_origins: Optional[pd.DataFrame] = None,
+        profile: Optional[RunProfile] = None,
+        fmv_audit_file: Union[str, TextIO] = ""
+    ) -> Iterator[Tuple[EngineContext, Callable[[pd.DataFrame], None]]]:
+        """The report of process_partitions, with the frames handed over
+        as they come rather than pulled from an iterable: yields the run's
+        EngineContext and a function adding one frame's matches to the
+        report. The report is finished (and the FMV cross check written)
+        when the block exits without an error"""
+        # Fail on an unknown engine or format before creating the output file
+        CGProcessor._check_engine(engine)
+        ReportWriter.writer_class(output_format)
+        if company_states is not None and workers > 1:
+            raise ValueError("Processing with company states needs 1 worker")
+
+        context = EngineContext(
+            engine=engine,
+            simple_fifo_mode=simple_fifo_mode,
+            same_source_only_matching=same_source_only_matching,
+            verbose=verbose,
+            # Load FY-specific tax rates
+            fy_tax_rates=CGProcessor.load_tax_rates(tax_rates_file),
+            ltcg_threshold_days=ltcg_threshold_days,
+            output_format=output_format,
+            workers=workers,
+            company_states=company_states,
+            profile=profile
+        )
+
+        # A stream (e.g. a zip entry) is written to and left open
+        with context.profile.count_log_records() if context.profiled else nullcontext(), \
+                ReportWriter.create(output_file, output_format) as writer:
+            yield context, lambda transactions_df: CGProcessor._write_company_results(
+                transactions_df, writer, context, progress, lot_origins)
+        context.profile.count('matches', context.record_count)
 
         # FMV cross check logs
-        df_fmv = pd.DataFrame.from_dict(fmv_chosen_companies, orient='index')
-
-        # Rename the index to 'Company' (optional)
-        df_fmv.index.name = 'Company'
-        # with pd.option_context(
-        #     'display.max_rows', None,
-        #     'display.max_columns', None,
-        #     'display.width', 1000,
-        #     'display.colheader_justify', 'left'
-        # ):
-        # print(df_fmv)
-        df_fmv.to_csv("fmv_crossmatch_output.csv")
-
-        # 4. Output
-        header = "Sell Source,Company Name,Sell Date,Transaction Type,Sell Quantity,Sell Price,Buy Source,Buy Transaction Type,Buy Date,Buy Quantity,Buy Price,Sell Value,Buy Value,Profit,Holding Days,LTCG/STCG,Quarter,Financial Year,Remaining Balance,FMV Used?,FMV Value,Original Buy Price, Adj Buy Price"
-
-        with open(output_file, 'w') as f:
-            f.write(header + '\n')
-            for line in results:
-                f.write(line + '\n')
-        logger.info('Done! Output saved to', output_file)
-        logger.info(f"Generated {len(results)} transaction records")
+        if fmv_audit_file:
+            context.write_fmv_audit(fmv_audit_file)
+
+        if isinstance(output_file, str):
+            logger.info(f"Done! Output saved to {output_file}")
+        logger.info(f"Generated {context.record_count} transaction records")
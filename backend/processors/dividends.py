@@ -1,36 +1,116 @@
 from processors.base import TransactionProcessor
 import pandas as pd
+from typing import Final, Iterable, Optional, TextIO, Union
+from contextlib import nullcontext
+from processors.utils.run_profile import RunProfile
+
+DIVIDEND_COLUMNS: Final = [
+    'Company Name', 'Date', 'Amount', 'Quarter', 'Financial Year', 'Source'
+]
+# Dividend totals are grouped by these, in this order
+SUMMARY_KEYS: Final = ['Financial Year', 'Quarter', 'Company Name', 'Source']
+SUMMARY_COLUMNS: Final = SUMMARY_KEYS + ['Dividends', 'Amount']
 
 
 class DividendProcessor(TransactionProcessor):
     @staticmethod
     def process_all_transactions(
         transactions_df: pd.DataFrame,
-        output_file: str,
-        overwrite: bool
+        output_file: Union[str, TextIO],
+        overwrite: bool,
+        profile: Optional[RunProfile] = None,
+        summary_file: Union[str, TextIO] = ""
     ):
+        """Write every dividend credit to `output_file`, and their totals
+        by financial year, quarter, company and source to `summary_file`
+        when given. Nothing is written without dividends"""
+        with profile.stage('dividends') if profile is not None else nullcontext():
+            dividend_df = DividendProcessor.dividends(transactions_df)
+            if len(dividend_df):
+                dividend_df.to_csv(output_file, index=False)
+                if summary_file:
+                    DividendProcessor.summarize(dividend_df).to_csv(
+                        summary_file, index=False)
+        dividend_count = len(dividend_df)
+        if profile is not None:
+            profile.count('dividends', dividend_count)
+
+        if isinstance(output_file, str):
+            print('Done! Output saved to', output_file)
+        print(f"Generated {dividend_count} dividend records")
+
+    @staticmethod
+    def dividends(transactions_df: pd.DataFrame) -> pd.DataFrame:
+        """The dividend transactions as report rows, credits positive.
+
+        Amounts are parsed once for the whole column: '--' is 0, and the
+        column stays integer when every amount is '--'.
+        """
+        dividend_transactions = DividendProcessor.dividend_transactions(transactions_df)
+        if dividend_transactions.empty:
+            return pd.DataFrame(columns=DIVIDEND_COLUMNS)
+
+        amounts = dividend_transactions['Amount(Credits/Debits)']
+        if pd.api.types.is_numeric_dtype(amounts):
+            amount = -amounts.astype('float64')
+        else:
+            dash = amounts.astype(str) == '--'
+            amount = (-amounts.where(~dash).astype('float64')).where(~dash, 0)
+            if dash.all():
+                amount = amount.astype('int64')
+
+        return pd.DataFrame({
+            'Company Name': dividend_transactions['Company Name'],
+            'Date': dividend_transactions['Transaction Date'],
+            'Amount': amount,
+            'Quarter': dividend_transactions['Quarter'],
+            'Financial Year': dividend_transactions['FY'],
+            'Source': dividend_transactions['Source']
+        }).reset_index(drop=True)
+
+    @staticmethod
+    def summarize(dividend_df: pd.DataFrame) -> pd.DataFrame:
+        """Number and total amount of dividends per financial year,
+        quarter, company and source, rounded to 2 places. Missing keys
+        (e.g. no source) form groups of their own, sorted last"""
+        return dividend_df.groupby(
+            SUMMARY_KEYS, dropna=False, sort=True, observed=True
+        ).agg(
+            Dividends=('Amount', 'size'),
+            Amount=('Amount', 'sum')
+        ).round({'Amount': 2}).reset_index()[SUMMARY_COLUMNS]
+
+    @staticmethod
+    def dividend_transactions(transactions_df: pd.DataFrame) -> pd.DataFrame:
+        """The dividend rows of the transactions"""
+        return transactions_df[DividendProcessor.type_keys(transactions_df) == 'dividend']
+
+    @staticmethod
+    def process_partitions(
+        dividend_frames: Iterable[pd.DataFrame],
+        output_file: Union[str, TextIO],
+        overwrite: bool,
+        profile: Optional[RunProfile] = None,
+        summary_file: Union[str, TextIO] = ""
+    ):
+        """Process dividends across transaction partitions, from the
+        dividend rows of each (see dividend_transactions).
+
+        They are restored to the global (date, company, type) order before
+        output.
+        """
+        dividend_frames = list(dividend_frames)
+        if dividend_frames:
+            dividend_transactions = pd.concat(dividend_frames).sort_values(
+                ['Transaction Date', 'Company Name', 'Transaction Type'])
+        else:
+            dividend_transactions = pd.DataFrame(
+                columns=['Transaction Type'])
 
-        dividend_results = []
-        dividend_transactions = transactions_df[
-            transactions_df['Transaction Type'].str.lower() == 'dividend'
-        ]
-
-        for idx, row in dividend_transactions.iterrows():
-            amount = -float(row['Amount(Credits/Debits)']
-                        ) if str(row['Amount(Credits/Debits)']) != '--' else 0
-            dividend_results.append({
-                'Company Name': row['Company Name'],
-                'Date': row['Transaction Date'],
-                'Amount': amount,
-                'Quarter': row['Quarter'],
-                'Financial Year': row['FY'],
-                'Source': row['Source']
-            })
-
-        # Output dividends to separate file
-        if dividend_results:
-            dividend_df = pd.DataFrame(dividend_results)
-            dividend_df.to_csv(output_file, index=False)
-
-        print('Done! Output saved to', output_file)
-        print(f"Generated {len(dividend_results)} dividend records")
+        DividendProcessor.process_all_transactions(
+            transactions_df=dividend_transactions,
+            output_file=output_file,
+            overwrite=overwrite,
+            profile=profile,
+            summary_file=summary_file
+        )
@@ -0,0 +1,43 @@
+from processors.base import TransactionProcessor
+import pandas as pd
+from typing import Final, Optional, TextIO, Union
+from contextlib import nullcontext
+from processors.utils.run_profile import RunProfile
+
+HOLDINGS_COLUMNS: Final = [
+    'Company Name', 'Source', 'Buy Date', 'Shares', 'Buy Price', 'Cost'
+]
+
+
+class HoldingsProcessor(TransactionProcessor):
+    """Open lots left at the end of a capital gains run"""
+
+    @staticmethod
+    def holdings(company_states: dict) -> pd.DataFrame:
+        """The open lots of every company, split adjusted, in processing
+        (then FIFO) order, from the company states a capital gains run
+        kept (see CGProcessor.process_all_transactions' keep_lot_states)"""
+        return pd.DataFrame([
+            [company, lot.source, lot.date.strftime('%d-%b-%Y'),
+             lot.shares, lot.price, round(lot.shares * lot.price, 2)]
+            for company, (lots, running_balance) in company_states.items()
+            for lot in lots
+        ], columns=HOLDINGS_COLUMNS)
+
+    @staticmethod
+    def write_holdings(
+        company_states: dict,
+        output_file: Union[str, TextIO],
+        profile: Optional[RunProfile] = None
+    ) -> None:
+        """Write the open lots report, its header alone when no lot is
+        left open"""
+        with profile.stage('holdings') if profile is not None else nullcontext():
+            holdings_df = HoldingsProcessor.holdings(company_states)
+            holdings_df.to_csv(output_file, index=False)
+        if profile is not None:
+            profile.count('open_lots', len(holdings_df))
+
+        if isinstance(output_file, str):
+            print('Done! Output saved to', output_file)
+        print(f"Generated {len(holdings_df)} open lot records")
@@ -0,0 +1,195 @@
+from abc import ABC, abstractmethod
+from contextlib import ExitStack, nullcontext
+from typing import Callable, Iterable, List, Optional, TextIO, Union
+
+import pandas as pd
+
+from processors.base import TransactionProcessor
+from processors.capital_gains import CGProcessor
+from processors.dividends import DividendProcessor
+from processors.holdings import HoldingsProcessor
+from processors.utils.engine_context import EngineContext
+from processors.utils.run_profile import RunProfile
+
+
+class ReportConsumer(ABC):
+    """A report fed by ReportPipeline"""
+    name = ''
+    # Whether the report reads the open lots of every company, which the
+    # capital gains report then keeps (in a single process)
+    needs_lot_states = False
+
+    @abstractmethod
+    def consume(self, transactions_df: pd.DataFrame, pipeline: 'ReportPipeline') -> None:
+        """Build the report from all the transactions"""
+
+    def start_partitions(self, pipeline: 'ReportPipeline', stack: ExitStack) -> None:
+        """Get ready for ReportPipeline.run_partitions, entering what is
+        to be closed after the last partition in `stack`"""
+        raise ValueError(f"The {self.name} report needs the whole transactions in memory")
+
+    def consume_partition(self, transactions_df: pd.DataFrame, pipeline: 'ReportPipeline') -> None:
+        pass
+
+    def finish_partitions(self, pipeline: 'ReportPipeline') -> None:
+        pass
+
+
+class CapitalGainsReport(ReportConsumer):
+    """The capital gains report, see CGProcessor.process_all_transactions
+    for `settings`. Its run's EngineContext is kept on the pipeline"""
+    name = 'capital gains'
+
+    def __init__(self, output_file, **settings):
+        self.output_file = output_file
+        self.settings = settings
+
+    def consume(self, transactions_df: pd.DataFrame, pipeline: 'ReportPipeline') -> None:
+        pipeline.context = CGProcessor.process_all_transactions(
+            transactions_df=transactions_df,
+            output_file=self.output_file,
+            overwrite=True,
+            profile=pipeline.profile,
+            keep_lot_states=pipeline.needs_lot_states,
+            **self.settings
+        )
+
+    def start_partitions(self, pipeline: 'ReportPipeline', stack: ExitStack) -> None:
+        pipeline.context, self.write_partition = stack.enter_context(
+            CGProcessor.partition_writer(
+                output_file=self.output_file,
+                profile=pipeline.profile,
+                **self.settings
+            ))
+
+    def consume_partition(self, transactions_df: pd.DataFrame, pipeline: 'ReportPipeline') -> None:
+        self.write_partition(transactions_df)
+
+
+class DividendsReport(ReportConsumer):
+    """Dividend credits and their totals, see DividendProcessor"""
+    name = 'dividends'
+
+    def __init__(self, output_file: Union[str, TextIO], summary_file: Union[str, TextIO] = ""):
+        self.output_file = output_file
+        self.summary_file = summary_file
+
+    def consume(self, transactions_df: pd.DataFrame, pipeline: 'ReportPipeline') -> None:
+        DividendProcessor.process_all_transactions(
+            transactions_df=transactions_df,
+            output_file=self.output_file,
+            overwrite=True,
+            profile=pipeline.profile,
+            summary_file=self.summary_file
+        )
+
+    def start_partitions(self, pipeline: 'ReportPipeline', stack: ExitStack) -> None:
+        self.dividend_frames = []
+
+    def consume_partition(self, transactions_df: pd.DataFrame, pipeline: 'ReportPipeline') -> None:
+        # Only the dividend rows are kept until the last partition is in
+        self.dividend_frames.append(
+            DividendProcessor.dividend_transactions(transactions_df))
+
+    def finish_partitions(self, pipeline: 'ReportPipeline') -> None:
+        DividendProcessor.process_partitions(
+            dividend_frames=self.dividend_frames,
+            output_file=self.output_file,
+            overwrite=True,
+            profile=pipeline.profile,
+            summary_file=self.summary_file
+        )
+
+
+class HoldingsReport(ReportConsumer):
+    """Open lots at the end of the transactions, from the capital gains
+    report's lot matching, see HoldingsProcessor"""
+    name = 'holdings'
+    needs_lot_states = True
+
+    def __init__(self, output_file: Union[str, TextIO]):
+        self.output_file = output_file
+
+    def consume(self, transactions_df: pd.DataFrame, pipeline: 'ReportPipeline') -> None:
+        HoldingsProcessor.write_holdings(
+            pipeline.context.company_states, self.output_file, pipeline.profile)
+
+
+class ReportPipeline:
+    """Several reports from a single pass over the ingested transactions.
+
+    Transaction types are normalised once for every registered report
+    (see TransactionProcessor.normalize_types), which then run in
+    registration order over the same frame. Reports built from lot
+    matching (holdings) reuse the capital gains report's, rather than
+    matching again, so they must be registered after it.
+
+    Files larger than memory are fed as partitions instead (see
+    run_partitions), in a single pass over them.
+    """
+
+    def __init__(self, profile: Optional[RunProfile] = None):
+        self.consumers: List[ReportConsumer] = []
+        self.profile = profile
+        # Of the capital gains run, once it has run
+        self.context: Optional[EngineContext] = None
+
+    def register(self, consumer: ReportConsumer) -> 'ReportPipeline':
+        self.consumers.append(consumer)
+        return self
+
+    @property
+    def needs_lot_states(self) -> bool:
+        return any(consumer.needs_lot_states for consumer in self.consumers)
+
+    def run(
+        self,
+        transactions_df: pd.DataFrame,
+        on_consumer: Optional[Callable[[ReportConsumer], None]] = None
+    ) -> None:
+        """Feed the transactions to every report, calling `on_consumer`
+        as each one starts. The type columns are added to the frame"""
+        self._check_order()
+        self._normalize_types(transactions_df)
+
+        for consumer in self.consumers:
+            if on_consumer is not None:
+                on_consumer(consumer)
+            consumer.consume(transactions_df, self)
+
+    def run_partitions(
+        self,
+        partitions: Iterable[pd.DataFrame],
+        on_consumer: Optional[Callable[[ReportConsumer], None]] = None
+    ) -> None:
+        """Feed transaction partitions, each of whole companies (e.g.
+        TransactionProcessor.iter_partitions), to every report, so only one
+        is in memory at a time. Each partition's types are normalised once,
+        then it goes to every report before the next is read. Reports are
+        finished, in registration order, after the last partition"""
+        self._check_order()
+        with ExitStack() as stack:
+            for consumer in self.consumers:
+                if on_consumer is not None:
+                    on_consumer(consumer)
+                consumer.start_partitions(self, stack)
+
+            for transactions_df in partitions:
+                self._normalize_types(transactions_df)
+                for consumer in self.consumers:
+                    consumer.consume_partition(transactions_df, self)
+
+        for consumer in self.consumers:
+            consumer.finish_partitions(self)
+
+    def _check_order(self) -> None:
+        matching = False
+        for consumer in self.consumers:
+            if consumer.needs_lot_states and not matching:
+                raise ValueError(
+                    f"The {consumer.name} report needs a capital gains report registered before it")
+            matching = matching or isinstance(consumer, CapitalGainsReport)
+
+    def _normalize_types(self, transactions_df: pd.DataFrame) -> None:
+        with self.profile.stage('normalize_types') if self.profile is not None else nullcontext():
+            TransactionProcessor.normalize_types(transactions_df)
@@ -0,0 +1,372 @@
+import csv
+import io
+import math
+import os
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Dict, Final, List, Optional, TextIO, Union
+
+from .base import TransactionProcessor
+from .utils.fiscal_calendar import FiscalCalendar
+from .utils.lot_engine import (
+    LotEngine, TRANSACTION_TYPE_PRIORITY, GRANDFATHERING_CUTOFF
+)
+from .utils.report_writer import CSVReportWriter
+from .utils.run_profile import RunProfile
+
+import logging
+logger = logging.getLogger(__name__)
+
+# Values pandas reads as missing by default (keep_default_na), read the
+# same way here
+NA_VALUES: Final = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan',
+    '1.#IND', '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a',
+    'nan', 'null'
+])
+# Column order of the FMV cross check and dividends files
+FMV_AUDIT_COLUMNS: Final = ['Company', 'ISIN', 'orig_buy_price', 'FMV', 'buying_price']
+DIVIDEND_COLUMNS: Final = [
+    'Company Name', 'Date', 'Amount', 'Quarter', 'Financial Year', 'Source'
+]
+DIVIDEND_SUMMARY_COLUMNS: Final = [
+    'Financial Year', 'Quarter', 'Company Name', 'Source', 'Dividends', 'Amount'
+]
+
+
+class StdlibProcessor(TransactionProcessor):
+    """Capital gains and dividends of a CSV transactions file on the
+    standard library alone, for runs where importing pandas would take
+    longer than the calculation itself.
+
+    Transactions are read with the csv module into one dict per row, and
+    lots are matched by the same LotEngine as the pandas engines, so the
+    CSV reports are identical to theirs. Only CSV input and output are
+    supported, in a single process; tax rates do not appear in the CSV
+    report and are not needed. Unlike the pandas path, a row without a
+    Transaction Date is an error.
+    """
+
+    @staticmethod
+    def read_transactions(
+        transactions_data_file: str,
+        fmv_mapping: dict,
+        profile: Optional[RunProfile] = None
+    ) -> List[dict]:
+        """Rows of a transactions CSV, sorted by (date, company, type) like
+        TransactionProcessor.initialize_data, with FMV, Quarter and FY
+        added. Missing values are None"""
+        profile = profile if profile is not None else RunProfile()
+
+        with profile.stage('read_transactions'):
+            with open(transactions_data_file, 'r', newline='', encoding='utf-8-sig') as f:
+                reader = csv.reader(f)
+                header = [name.strip() for name in next(reader)]
+                transactions = [
+                    dict(zip(header, [
+                        None if value in NA_VALUES else value for value in row
+                    ]))
+                    for row in reader if row
+                ]
+
+            parsed_dates: Dict[str, datetime] = {}
+            for row in transactions:
+                value = row['Transaction Date']
+                if value is None:
+                    raise ValueError("Transactions file has rows without a Transaction Date")
+                date = parsed_dates.get(value)
+                if date is None:
+                    date = parsed_dates[value] = datetime.strptime(value, '%Y-%m-%d')
+                row['Transaction Date'] = date
+        profile.count('rows_ingested', len(transactions))
+
+        # Sort globally by date BEFORE anything else, missing names last
+        with profile.stage('global_sort'):
+            transactions.sort(key=lambda row: (
+                row['Transaction Date'],
+                row['Company Name'] is None, row['Company Name'] or '',
+                row['Transaction Type'] is None, row['Transaction Type'] or ''
+            ))
+
+        with profile.stage('enrich'):
+            for row in transactions:
+                fmv = fmv_mapping.get(row['ISIN'])
+                row['FMV'] = 0.0 if fmv is None or fmv != fmv else fmv
+                row['Quarter'] = FiscalCalendar.fiscal_quarter(row['Transaction Date'])
+                row['FY'] = FiscalCalendar.fiscal_year(row['Transaction Date'])
+
+        return transactions
+
+    @staticmethod
+    def process_all_transactions(
+        transactions: List[dict],
+        output_file: Union[str, TextIO],
+        verbose: bool = False,
+        same_source_only_matching: bool = False,
+        simple_fifo_mode: bool = True,
+        ltcg_threshold_days: int = 365,
+        profile: Optional[RunProfile] = None,
+        fmv_audit_file: Union[str, TextIO] = ""
+    ) -> int:
+        """Match every company's lots and write the capital gains report
+        as CSV, returning its record count. The FMV cross check is saved
+        to `fmv_audit_file` when given"""
+        profiled = profile is not None
+        profile = profile if profiled else RunProfile()
+
+        companies: Dict[str, List[dict]] = {}
+        for row in transactions:
+            if row['Company Name'] is not None:
+                companies.setdefault(row['Company Name'], []).append(row)
+        profile.count('companies', len(companies))
+
+        fmv_chosen_companies: dict = {}
+        record_count = 0
+        with profile.count_log_records() if profiled else nullcontext(), \
+                CSVReportWriter(output_file) as writer:
+            for company, group in companies.items():
+                with profile.stage('company_sort'):
+                    group.sort(key=StdlibProcessor._processing_order)
+
+                matches = []
+                with profile.stage('lot_matching'):
+                    LotEngine.match_company(
+                        company=company,
+                        ctypes=[
+                            row['Transaction Type'].strip().lower()
+                            if row['Transaction Type'] is not None else None
+                            for row in group
+                        ],
+                        dates=[row['Transaction Date'] for row in group],
+                        qtys=[StdlibProcessor._number(row['Shares(Credits/Debits)']) for row in group],
+                        prices=[StdlibProcessor._number(row['Price']) for row in group],
+                        # A missing source equals no other, itself included,
+                        # as pandas' NaN does
+                        sources=[
+                            row['Source'] if row['Source'] is not None else math.nan
+                            for row in group
+                        ],
+                        labels=range(len(group)),
+                        simple_fifo_mode=simple_fifo_mode,
+                        same_source_only_matching=same_source_only_matching,
+                        matches=matches,
+                        verbose=verbose,
+                        profile=profile if profiled else None
+                    )
+                if not matches:
+                    continue
+
+                with profile.stage('report_build'):
+                    encoded = StdlibProcessor._encode_report(
+                        group, matches, ltcg_threshold_days, fmv_chosen_companies)
+                with profile.stage('report_write'):
+                    writer.write(encoded)
+                record_count += len(matches)
+        profile.count('matches', record_count)
+
+        if fmv_audit_file:
+            StdlibProcessor._write_fmv_audit(fmv_chosen_companies, fmv_audit_file)
+
+        if isinstance(output_file, str):
+            logger.info(f"Done! Output saved to {output_file}")
+        logger.info(f"Generated {record_count} transaction records")
+        return record_count
+
+    @staticmethod
+    def process_dividends(
+        transactions: List[dict],
+        output_file: Union[str, TextIO],
+        profile: Optional[RunProfile] = None,
+        summary_file: Union[str, TextIO] = ""
+    ) -> int:
+        """Write the dividends report (and its summary to `summary_file`)
+        like DividendProcessor, returning its record count. Nothing is
+        written without dividends"""
+        with profile.stage('dividends') if profile is not None else nullcontext():
+            dividends = []
+            for row in transactions:
+                ctype = row['Transaction Type']
+                if ctype is None or ctype.lower() != 'dividend':
+                    continue
+                amount = row['Amount(Credits/Debits)']
+                dividends.append([
+                    row['Company Name'],
+                    row['Transaction Date'].strftime('%Y-%m-%d'),
+                    0 if amount == '--' else -float('nan' if amount is None else amount),
+                    row['Quarter'],
+                    row['FY'],
+                    row['Source']
+                ])
+
+            if dividends:
+                summary = StdlibProcessor._summarize_dividends(dividends)
+                # A column with any float is written as floats, like pandas
+                if any(isinstance(dividend[2], float) for dividend in dividends):
+                    for dividend in dividends:
+                        dividend[2] = StdlibProcessor._format_float(dividend[2], '')
+                StdlibProcessor._write_csv(output_file, DIVIDEND_COLUMNS, dividends)
+                if summary_file:
+                    StdlibProcessor._write_csv(
+                        summary_file, DIVIDEND_SUMMARY_COLUMNS, summary)
+        if profile is not None:
+            profile.count('dividends', len(dividends))
+
+        if isinstance(output_file, str):
+            print('Done! Output saved to', output_file)
+        print(f"Generated {len(dividends)} dividend records")
+        return len(dividends)
+
+    @staticmethod
+    def _summarize_dividends(dividends: list) -> list:
+        """Count and total amount per (FY, quarter, company, source) of
+        dividend rows, like DividendProcessor.summarize: sorted by the
+        keys, missing ones last, totals rounded to 2 places"""
+        groups: Dict[tuple, list] = {}
+        for company, _, amount, quarter, fy, source in dividends:
+            groups.setdefault((fy, quarter, company, source), []).append(amount)
+
+        floats = any(isinstance(amount, float) for amounts in groups.values()
+                     for amount in amounts)
+        summary = []
+        for key in sorted(groups, key=lambda key: [
+            (value is None, value or '') for value in key
+        ]):
+            amounts = groups[key]
+            if floats:
+                total = StdlibProcessor._format_float(round(
+                    math.fsum(amount for amount in amounts if amount == amount), 2))
+            else:
+                total = sum(amounts)
+            summary.append(['' if value is None else value for value in key]
+                           + [len(amounts), total])
+        return summary
+
+    @staticmethod
+    def _processing_order(row: dict) -> tuple:
+        """Sort key of a company's transactions: date, then the type's
+        priority (unknown types last)"""
+        ctype = row['Transaction Type']
+        priority = TRANSACTION_TYPE_PRIORITY.get(ctype.lower()) \
+            if ctype is not None else None
+        return row['Transaction Date'], priority is None, priority or 0
+
+    @staticmethod
+    def _number(value: Optional[str]) -> Optional[float]:
+        """Parse a quantity or price like numeric_column_values: '--' is
+        0, a missing value NaN and anything unparseable None"""
+        if value is None:
+            return float('nan')
+        if value == '--':
+            return 0
+        if '_' in value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    @staticmethod
+    def _format_float(value: float, na_rep: str = 'nan') -> str:
+        return na_rep if value != value else repr(float(value))
+
+    @staticmethod
+    def _format_price(value: float) -> str:
+        """A report price: the placeholder int 0 of a '--' price is
+        written as 0, like CGProcessor's report"""
+        return str(value) if type(value) is int \
+            else StdlibProcessor._format_float(value)
+
+    @staticmethod
+    def _encode_report(
+        group: List[dict], matches: list, ltcg_threshold_days: int,
+        fmv_chosen_companies: dict
+    ) -> str:
+        """Report rows of a company's raw matches (see MATCH_FIELDS, the
+        labels being positions in `group`), as CSV text like
+        CSVReportWriter.encode"""
+        text = StdlibProcessor._text
+        number = StdlibProcessor._format_float
+        price = StdlibProcessor._format_price
+        cutoff = GRANDFATHERING_CUTOFF
+
+        output = io.StringIO()
+        writer = csv.writer(output, lineterminator='\n')
+        for sell_label, buy_label, use_qty, buy_shares_available, buy_price, \
+                sell_price, remaining_balance in matches:
+            sell = group[sell_label]
+            buy = group[buy_label]
+            sell_date = sell['Transaction Date']
+            buy_date = buy['Transaction Date']
+            fmv = buy['FMV']
+
+            # Calculate holding period and tax classification
+            holding_days = (sell_date - buy_date).days
+            is_ltcg = holding_days >= ltcg_threshold_days
+
+            # Apply grandfathering logic
+            fmv_used = is_ltcg and buy_date < cutoff and sell_date > cutoff
+            adj_buy_price = fmv if fmv_used and fmv > buy_price else buy_price
+            if fmv_used:
+                fmv_chosen_companies[sell['Company Name']] = [
+                    sell['ISIN'], buy_price, fmv, adj_buy_price]
+
+            writer.writerow([
+                text(sell['Source']),
+                sell['Company Name'],
+                sell_date.strftime('%d-%b-%Y'),
+                'SELL',
+                number(use_qty),
+                price(sell_price),
+                text(buy['Source']),
+                buy['Transaction Type'].strip().upper(),
+                buy_date.strftime('%d-%b-%Y'),
+                number(buy_shares_available),
+                price(buy_price),
+                number(round(sell_price * use_qty, 2)),
+                number(round(adj_buy_price * use_qty, 2)),
+                number(round((sell_price - adj_buy_price) * use_qty, 2)),
+                holding_days,
+                'LTCG' if is_ltcg else 'STCG',
+                sell['Quarter'],
+                sell['FY'],
+                number(remaining_balance),
+                fmv_used,
+                number(fmv),
+                price(buy_price),
+                price(adj_buy_price)
+            ])
+        return output.getvalue()
+
+    @staticmethod
+    def _text(value: Optional[str]) -> str:
+        return 'nan' if value is None else value
+
+    @staticmethod
+    def _write_fmv_audit(
+        fmv_chosen_companies: dict, output_file: Union[str, TextIO]
+    ) -> None:
+        """The FMV cross check, as EngineContext.write_fmv_audit writes it"""
+        if not fmv_chosen_companies:
+            StdlibProcessor._write_csv(output_file, FMV_AUDIT_COLUMNS[:1], [])
+            return
+        StdlibProcessor._write_csv(output_file, FMV_AUDIT_COLUMNS, [
+            [company, isin] + [
+                StdlibProcessor._format_float(value, '')
+                for value in (orig_buy_price, fmv, buying_price)
+            ]
+            for company, (isin, orig_buy_price, fmv, buying_price)
+            in fmv_chosen_companies.items()
+        ])
+
+    @staticmethod
+    def _write_csv(output_file: Union[str, TextIO], header: list, rows: list) -> None:
+        """Write rows like DataFrame.to_csv, to a path or text stream"""
+        f = open(output_file, 'w', newline='') if isinstance(output_file, str) \
+            else output_file
+        try:
+            writer = csv.writer(f, lineterminator=os.linesep)
+            writer.writerow(header)
+            writer.writerows(rows)
+        finally:
+            if isinstance(output_file, str):
+                f.close()
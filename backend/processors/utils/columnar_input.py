@@ -0,0 +1,141 @@
+from typing import TYPE_CHECKING, BinaryIO, Final, Optional, Union
+import os
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+FORMAT_CSV: Final = 'csv'
+FORMAT_PARQUET: Final = 'parquet'
+# Feather (v2) files are Arrow IPC files
+FORMAT_ARROW: Final = 'arrow'
+
+# Leading bytes identifying the columnar formats
+PARQUET_MAGIC: Final = b'PAR1'
+ARROW_MAGIC: Final = b'ARROW1'
+
+# Declared schema of a columnar transactions file: the columns read
+# (everything else is skipped) and the Arrow types they are cast to
+TRANSACTION_SCHEMA: Final = {
+    'Transaction Date': 'date32',
+    'Transaction Type': 'string',
+    'Company Name': 'string',
+    'Shares(Credits/Debits)': 'float64',
+    'Price': 'float64',
+    'Amount(Credits/Debits)': 'float64',
+    'ISIN': 'string',
+    'Source': 'string'
+}
+# Columns a columnar transactions file may leave out
+OPTIONAL_COLUMNS: Final = {'Amount(Credits/Debits)'}
+# Columns whose nulls stand for the CSV '--' placeholder
+PLACEHOLDER_COLUMNS: Final = [
+    name for name, type_alias in TRANSACTION_SCHEMA.items() if type_alias == 'float64'
+]
+
+
+class ColumnarInput:
+    """Parquet and Arrow IPC (Feather) transaction files.
+
+    Only the columns of TRANSACTION_SCHEMA are read, files on disk are
+    memory mapped rather than copied in, and the values come back with
+    the same column names and dtypes the CSV path produces. A null
+    quantity, price or amount is read as the CSV '--' placeholder (a
+    missing value can only be told apart from it in CSV). pyarrow is
+    only needed when such a file is actually read.
+    """
+
+    @staticmethod
+    def detect_format(transactions_data_file: Union[str, BinaryIO]) -> str:
+        """Format of a transactions file (a path or a seekable binary
+        stream, which is rewound), told by its leading bytes"""
+        if hasattr(transactions_data_file, 'read'):
+            position = transactions_data_file.tell()
+            header = transactions_data_file.read(len(ARROW_MAGIC))
+            transactions_data_file.seek(position)
+        else:
+            with open(transactions_data_file, 'rb') as f:
+                header = f.read(len(ARROW_MAGIC))
+
+        if isinstance(header, bytes):
+            if header.startswith(PARQUET_MAGIC):
+                return FORMAT_PARQUET
+            if header.startswith(ARROW_MAGIC):
+                return FORMAT_ARROW
+        return FORMAT_CSV
+
+    @staticmethod
+    def read(
+        transactions_data_file: Union[str, BinaryIO],
+        file_format: Optional[str] = None
+    ) -> 'pd.DataFrame':
+        """Read a Parquet or Arrow IPC transactions file into a DataFrame
+        with a parsed 'Transaction Date' column"""
+        try:
+            import pyarrow as pa
+            import pyarrow.ipc
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError(
+                "Reading Parquet/Arrow transaction files requires pyarrow "
+                "(pip install pyarrow)")
+
+        if file_format is None:
+            file_format = ColumnarInput.detect_format(transactions_data_file)
+
+        if hasattr(transactions_data_file, 'read'):
+            # Uploads are buffered in memory already, nothing to map
+            source = pa.BufferReader(transactions_data_file.read())
+        else:
+            source = pa.memory_map(os.fspath(transactions_data_file))
+
+        if file_format == FORMAT_PARQUET:
+            parquet_file = pq.ParquetFile(source)
+            columns = ColumnarInput._projection(parquet_file.schema_arrow.names)
+            table = parquet_file.read(columns=list(columns))
+        elif file_format == FORMAT_ARROW:
+            names = pa.ipc.open_file(source).schema.names
+            columns = ColumnarInput._projection(names)
+            # Only the projected columns' buffers are read (or decompressed)
+            table = pa.ipc.open_file(source, options=pa.ipc.IpcReadOptions(
+                included_fields=[names.index(name) for name in columns]
+            )).read_all()
+        else:
+            raise ValueError(f"Unsupported transactions file format '{file_format}'")
+
+        try:
+            table = table.rename_columns(list(columns.values())).cast(
+                pa.schema([
+                    (name, pa.type_for_alias(TRANSACTION_SCHEMA[name]))
+                    for name in columns.values()
+                ]))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            raise ValueError(f"Transactions file does not match the schema: {e}")
+
+        if table.column('Transaction Date').null_count:
+            raise ValueError("Transactions file has rows without a Transaction Date")
+
+        transactions_df = table.to_pandas(date_as_object=False)
+        # Same resolution as dates parsed from CSV
+        transactions_df['Transaction Date'] = transactions_df[
+            'Transaction Date'].astype('datetime64[us]')
+        # Columns with placeholders are read from CSV as objects, with
+        # '--' among the values
+        for name in PLACEHOLDER_COLUMNS:
+            if name in transactions_df and transactions_df[name].isna().any():
+                column = transactions_df[name].astype(object)
+                transactions_df[name] = column.where(column.notna(), '--')
+        return transactions_df
+
+    @staticmethod
+    def _projection(names: list) -> dict:
+        """File column -> schema column, for the schema's columns present
+        (names are matched ignoring surrounding whitespace)"""
+        columns = {
+            name: name.strip() for name in names
+            if name.strip() in TRANSACTION_SCHEMA
+        }
+        missing = set(TRANSACTION_SCHEMA) - OPTIONAL_COLUMNS - set(columns.values())
+        if missing:
+            raise ValueError(
+                f"Transactions file is missing columns: {', '.join(sorted(missing))}")
+        return columns
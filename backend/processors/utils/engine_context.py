@@ -0,0 +1,96 @@
+from typing import Optional, TextIO, Union
+
+import pandas as pd
+
+from .report_writer import OUTPUT_CSV
+from .run_profile import RunProfile
+
+
+class EngineContext:
+    """Configuration and state of a single capital gains run.
+
+    Everything a run accumulates (the FMV cross check, the record count,
+    stage timings and counters, resumed lot state) is held here rather
+    than in module, class or default argument state, and nothing is
+    written to a fixed path, so runs in parallel threads of one process
+    stay apart. Worker processes get a fresh context of their own (see
+    `for_worker`), merged back into the run's with `merge`.
+    """
+
+    def __init__(
+        self,
+        engine: str,
+        simple_fifo_mode: bool = True,
+        same_source_only_matching: bool = False,
+        verbose: bool = False,
+        fy_tax_rates: Optional[dict] = None,
+        ltcg_threshold_days: int = 365,
+        output_format: str = OUTPUT_CSV,
+        workers: int = 1,
+        company_states: Optional[dict] = None,
+        profile: Optional[RunProfile] = None
+    ):
+        self.engine = engine
+        self.simple_fifo_mode = simple_fifo_mode
+        self.same_source_only_matching = same_source_only_matching
+        self.verbose = verbose
+        self.fy_tax_rates = fy_tax_rates if fy_tax_rates is not None else {}
+        self.ltcg_threshold_days = ltcg_threshold_days
+        self.output_format = output_format
+        self.workers = workers
+        # Lots and running balance per company, carried across runs
+        self.company_states = company_states
+        # Counted per company only when asked for, stages are timed
+        # regardless (into a profile nobody reads)
+        self.profiled = profile is not None
+        self.profile = profile if profile is not None else RunProfile()
+        # Last grandfathered (FMV) match per company
+        self.fmv_chosen_companies: dict = {}
+        self.record_count = 0
+
+    def company_kwargs(self) -> dict:
+        """Keyword arguments of the company processors"""
+        kwargs = dict(
+            verbose=self.verbose,
+            same_source_only_matching=self.same_source_only_matching,
+            simple_fifo_mode=self.simple_fifo_mode
+        )
+        if self.company_states is not None:
+            kwargs['company_states'] = self.company_states
+        if self.profiled:
+            kwargs['profile'] = self.profile
+        return kwargs
+
+    def report_kwargs(self) -> dict:
+        """Keyword arguments of CGProcessor._build_report"""
+        return dict(ltcg_threshold_days=self.ltcg_threshold_days)
+
+    def for_worker(self) -> 'EngineContext':
+        """Context of a worker process: the same configuration with empty
+        state (workers never get company states)"""
+        return EngineContext(
+            engine=self.engine,
+            simple_fifo_mode=self.simple_fifo_mode,
+            same_source_only_matching=self.same_source_only_matching,
+            verbose=self.verbose,
+            fy_tax_rates=self.fy_tax_rates,
+            ltcg_threshold_days=self.ltcg_threshold_days,
+            output_format=self.output_format,
+            profile=RunProfile() if self.profiled else None
+        )
+
+    def merge(self, other: 'EngineContext') -> None:
+        """Add the FMV usage and profile of a worker's context (its
+        records are counted as they are written)"""
+        self.fmv_chosen_companies.update(other.fmv_chosen_companies)
+        self.profile.merge(other.profile)
+
+    def fmv_audit(self) -> pd.DataFrame:
+        """The FMV cross check: ISIN, original and grandfathered (FMV) buy
+        price and the buy price used, per company"""
+        df_fmv = pd.DataFrame.from_dict(self.fmv_chosen_companies, orient='index')
+        df_fmv.index.name = 'Company'
+        return df_fmv
+
+    def write_fmv_audit(self, output_file: Union[str, TextIO]) -> None:
+        self.fmv_audit().to_csv(output_file)
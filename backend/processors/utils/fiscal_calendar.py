@@ -0,0 +1,70 @@
+from datetime import datetime
+from typing import TYPE_CHECKING, Final
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Indian financial years run April to March
+FY_START_MONTH: Final = 4
+QUARTER_LABELS: Final = ["Q1", "Q2", "Q3", "Q4"]
+
+
+class FiscalCalendar:
+    """Vectorised fiscal year / quarter classification of dates.
+
+    Works on whole date columns with integer arithmetic and returns
+    categoricals, so it can be shared by every report built on the
+    transactions frame. `fiscal_quarter` and `fiscal_year` classify a
+    single date, without pandas.
+    """
+
+    @staticmethod
+    def fiscal_quarter(date: datetime) -> str:
+        return QUARTER_LABELS[((date.month - FY_START_MONTH) % 12) // 3]
+
+    @staticmethod
+    def fiscal_year(date: datetime) -> str:
+        start_year = date.year - (date.month < FY_START_MONTH)
+        return f"FY{start_year}-{start_year + 1}"
+
+    @staticmethod
+    def fiscal_quarters(dates: 'pd.Series') -> 'pd.Series':
+        """Fiscal quarter ('Q1' = Apr-Jun ... 'Q4' = Jan-Mar) of each date"""
+        import numpy as np
+        import pandas as pd
+        month = dates.dt.month
+        missing = month.isna().to_numpy()
+        month = month.fillna(FY_START_MONTH).to_numpy(dtype=np.int64)
+
+        codes = ((month - FY_START_MONTH) % 12) // 3
+        codes[missing] = -1
+        return pd.Series(
+            pd.Categorical.from_codes(
+                codes, categories=QUARTER_LABELS, ordered=True),
+            index=dates.index
+        )
+
+    @staticmethod
+    def fiscal_years(dates: 'pd.Series') -> 'pd.Series':
+        """Fiscal year label ('FY2023-2024') of each date"""
+        import numpy as np
+        import pandas as pd
+        year = dates.dt.year
+        missing = year.isna().to_numpy()
+        start_year = (
+            year.fillna(0).to_numpy(dtype=np.int64)
+            - (dates.dt.month.fillna(FY_START_MONTH).to_numpy(dtype=np.int64)
+               < FY_START_MONTH)
+        )
+
+        start_years, codes = np.unique(start_year[~missing], return_inverse=True)
+        all_codes = np.full(len(start_year), -1, dtype=np.int64)
+        all_codes[~missing] = codes
+        return pd.Series(
+            pd.Categorical.from_codes(
+                all_codes,
+                categories=[f"FY{y}-{y + 1}" for y in start_years],
+                ordered=True
+            ),
+            index=dates.index
+        )
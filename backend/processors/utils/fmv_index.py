@@ -0,0 +1,151 @@
+from collections import OrderedDict
+from typing import BinaryIO, Dict, Final, Optional, Tuple, Union
+import csv
+import hashlib
+import io
+import os
+import pickle
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Parsed uploaded (custom) FMV files kept, least recently used go first
+MAX_CACHED_UPLOADS: Final = 8
+# Suffix of the pre-parsed sidecar written next to an FMV file
+SIDECAR_SUFFIX: Final = '.fmvidx'
+
+
+class FMVIndex:
+    """Process-wide cache of parsed Grandfathered ISIN -> FMV mappings.
+
+    Files on disk (the bundled prices file) are keyed by path, modification
+    time and size, so an edited file is parsed again. Uploaded files are
+    new streams (or temporary files) on every request and are keyed by a
+    hash of their content instead, keeping the most recently used few.
+
+    The mappings handed out are shared, callers must not modify them.
+    """
+
+    _lock = threading.Lock()
+    _by_path: Dict[str, Tuple[Tuple[int, int], dict]] = {}
+    _by_digest: "OrderedDict[str, dict]" = OrderedDict()
+
+    @staticmethod
+    def parse(fmv_data_file: Union[str, BinaryIO]) -> dict:
+        """Parse an FMV file (a path or binary stream) into an
+        ISIN -> Fair market value dict"""
+        import pandas as pd
+        grandfathered_prices_df = pd.read_csv(fmv_data_file)
+
+        grandfathered_prices_df = grandfathered_prices_df.rename(
+            columns=lambda x: x.strip())
+
+        # Create a mapping of ISIN to FMV from df2
+        return grandfathered_prices_df.set_index(
+            "ISIN")["Fair market value"].to_dict()
+
+    @staticmethod
+    def parse_csv(fmv_data_file: str) -> dict:
+        """`parse` on the csv module alone, without pandas (which reads
+        the same values)"""
+        with open(fmv_data_file, 'r', newline='', encoding='utf-8-sig') as f:
+            reader = csv.reader(f)
+            header = [name.strip() for name in next(reader)]
+            isin_col = header.index('ISIN')
+            fmv_col = header.index('Fair market value')
+            return {
+                row[isin_col]: float(row[fmv_col]) if row[fmv_col].strip() else float('nan')
+                for row in reader if row
+            }
+
+    @classmethod
+    def for_file(
+        cls, fmv_data_file: str, sidecar: bool = False, stdlib: bool = False
+    ) -> dict:
+        """Mapping of an FMV file, parsed once per version of the file.
+
+        With `sidecar`, the parsed mapping is also stored next to the file
+        and read back by later processes instead of parsing the CSV. With
+        `stdlib`, the CSV is parsed without pandas.
+        """
+        path = os.path.abspath(fmv_data_file)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        with cls._lock:
+            cached = cls._by_path.get(path)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+        mapping = cls._read_sidecar(path, version) if sidecar else None
+        if mapping is None:
+            mapping = cls.parse_csv(path) if stdlib else cls.parse(path)
+            if sidecar:
+                cls._write_sidecar(path, version, mapping)
+
+        with cls._lock:
+            cls._by_path[path] = (version, mapping)
+        return mapping
+
+    @classmethod
+    def for_upload(cls, fmv_data_file: Union[str, BinaryIO]) -> dict:
+        """Mapping of an uploaded FMV file (a path or binary stream),
+        cached by content"""
+        if hasattr(fmv_data_file, 'read'):
+            content = fmv_data_file.read()
+        else:
+            with open(fmv_data_file, 'rb') as f:
+                content = f.read()
+        digest = hashlib.sha256(content).hexdigest()
+
+        with cls._lock:
+            mapping = cls._by_digest.get(digest)
+            if mapping is not None:
+                cls._by_digest.move_to_end(digest)
+                return mapping
+
+        mapping = cls.parse(io.BytesIO(content))
+
+        with cls._lock:
+            cls._by_digest[digest] = mapping
+            cls._by_digest.move_to_end(digest)
+            while len(cls._by_digest) > MAX_CACHED_UPLOADS:
+                cls._by_digest.popitem(last=False)
+        return mapping
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._by_path.clear()
+            cls._by_digest.clear()
+
+    @staticmethod
+    def _read_sidecar(path: str, version: Tuple[int, int]) -> Optional[dict]:
+        sidecar_path = path + SIDECAR_SUFFIX
+        try:
+            with open(sidecar_path, 'rb') as f:
+                stored_version, mapping = pickle.load(f)
+            # Stale once the FMV file changed after the sidecar was written
+            if tuple(stored_version) != version or not isinstance(mapping, dict):
+                return None
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # Only a cache: anything unreadable is parsed again and rewritten
+            logger.warning(f"Ignoring unreadable FMV sidecar {sidecar_path}: {e}")
+            return None
+        return mapping
+
+    @staticmethod
+    def _write_sidecar(path: str, version: Tuple[int, int], mapping: dict) -> None:
+        sidecar_path = path + SIDECAR_SUFFIX
+        try:
+            # Written under a temporary name so readers never see a partial file
+            temp_path = f"{sidecar_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(temp_path, 'wb') as f:
+                pickle.dump((version, mapping), f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, sidecar_path)
+        except OSError as e:
+            logger.warning(f"Could not write FMV sidecar {sidecar_path}: {e}")
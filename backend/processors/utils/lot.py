@@ -0,0 +1,28 @@
+from typing import Any
+
+
+class Lot:
+    """An open buy lot.
+
+    Only what lot matching needs is kept on the lot itself: the rest of the
+    buy (type, FMV, ...) is looked up from its transaction by `index` when
+    the report is built. Slots keep per-lot memory to a few pointers.
+    """
+
+    __slots__ = ('source', 'shares', 'price', 'date', 'index', 'epoch')
+
+    def __init__(self, source: Any, shares: float, price: float, date: Any, index: Any):
+        self.source = source
+        self.shares = shares
+        self.price = price
+        self.date = date
+        # Index label of the buy transaction
+        self.index = index
+        # Splits of the owning LotBook already applied to shares and price
+        self.epoch = 0
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"Lot({self.to_dict()})"
@@ -0,0 +1,149 @@
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Tuple, Union
+from .lot import Lot
+import heapq
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LotBook:
+    """Open buy lots of a single company, kept in FIFO (insertion) order.
+
+    Depleted lots are dropped as they are consumed, and a per-source index
+    lets same-source matching find the oldest open lot of a source without
+    scanning the lots of every other source.
+
+    For tax-optimal (non-FIFO) matching, max-heaps keyed on price
+    (descending), then date, then insertion order are built on first use.
+    Depleted lots are deleted lazily when they surface at the top.
+
+    Stock splits are recorded in O(1) and applied to a lot's shares and
+    price only when the lot is handed out, one ratio at a time in split
+    order, so the values are exactly those of rescaling every lot eagerly.
+    A split ratio is always positive, so whether a lot is still open can
+    be told from its unadjusted shares.
+
+    The lots appended and examined while picking lots (depleted ones
+    included) are counted, for profiling.
+    """
+
+    def __init__(self):
+        self._lots: Deque[Lot] = deque()
+        self._by_source: Dict[Any, Deque[Lot]] = {}
+        self._open_count = 0
+        self._depleted_count = 0
+        self._appended_count = 0
+        self._scanned_count = 0
+        self._heaps: Dict[Any, List[Tuple]] = {}
+        self._split_ratios: List[float] = []
+
+    def __len__(self) -> int:
+        return self._open_count
+
+    def __iter__(self) -> Iterator[Lot]:
+        return (self._resolve(lot) for lot in self._lots if lot.shares > 0)
+
+    @property
+    def appended_count(self) -> int:
+        return self._appended_count
+
+    @property
+    def scanned_count(self) -> int:
+        return self._scanned_count
+
+    def append(self, lot: Lot) -> None:
+        """Add a newly bought lot at the back of the queue"""
+        lot.epoch = len(self._split_ratios)
+        self._lots.append(lot)
+        self._by_source.setdefault(lot.source, deque()).append(lot)
+        if lot.shares > 0:
+            self._open_count += 1
+
+        entry = self._heap_entry(lot, self._appended_count)
+        self._appended_count += 1
+        for key in (None, lot.source):
+            if key in self._heaps:
+                heapq.heappush(self._heaps[key], entry)
+
+    def first(self, source=None) -> Union[Lot, None]:
+        """Oldest open lot, optionally restricted to a single source"""
+        queue = self._queue(source)
+        while queue and not queue[0].shares > 0:
+            queue.popleft()
+            self._scanned_count += 1
+        if not queue:
+            return None
+        self._scanned_count += 1
+        return self._resolve(queue[0])
+
+    def highest_priced(self, source=None) -> Union[Lot, None]:
+        """Open lot with the highest price (oldest first on ties),
+        optionally restricted to a single source"""
+        heap = self._heaps.get(source)
+        if heap is None:
+            heap = [
+                self._heap_entry(self._resolve(lot), seq)
+                for seq, lot in enumerate(self._queue(source))
+            ]
+            heapq.heapify(heap)
+            self._scanned_count += len(heap)
+            if source == source:
+                self._heaps[source] = heap
+
+        while heap and not heap[0][-1].shares > 0:
+            heapq.heappop(heap)
+            self._scanned_count += 1
+        if not heap:
+            return None
+        self._scanned_count += 1
+        return heap[0][-1]
+
+    def consume(self, lot: Lot, qty: float) -> None:
+        """Deduct `qty` shares from `lot`, dropping it once depleted"""
+        lot.shares -= qty
+        if not lot.shares > 0:
+            self._open_count -= 1
+            self._depleted_count += 1
+            # Compact once depleted lots outnumber open ones, so the
+            # cost of dropping them stays amortised O(1) per lot
+            if self._depleted_count > self._open_count:
+                self._compact()
+
+    def rescale(self, split_ratio: float) -> None:
+        """Apply a stock split ratio to every open lot"""
+        self._split_ratios.append(split_ratio)
+        # Heap keys hold the pre-split prices, rebuild them on next use
+        self._heaps = {}
+
+    def _resolve(self, lot: Lot) -> Lot:
+        """Bring a lot's shares and price up to date with the splits"""
+        split_count = len(self._split_ratios)
+        while lot.epoch < split_count:
+            split_ratio = self._split_ratios[lot.epoch]
+            lot.shares *= split_ratio
+            lot.price /= split_ratio
+            lot.epoch += 1
+        return lot
+
+    @staticmethod
+    def _heap_entry(lot: Lot, seq: int) -> Tuple:
+        price = lot.price
+        # NaN prices do not order, rank such lots after every priced lot
+        return (-price if price == price else math.inf, lot.date, seq, lot)
+
+    def _queue(self, source=None) -> Deque[Lot]:
+        if source is None:
+            return self._lots
+        if source != source:
+            # A missing (NaN) source never equals any lot's source
+            return deque()
+        return self._by_source.get(source, deque())
+
+    def _compact(self) -> None:
+        self._lots = deque(lot for lot in self._lots if lot.shares > 0)
+        self._by_source = {}
+        for lot in self._lots:
+            self._by_source.setdefault(lot.source, deque()).append(lot)
+        self._depleted_count = 0
@@ -0,0 +1,261 @@
+from datetime import datetime
+from typing import Any, Final, Optional, Tuple, Union
+from .lot import Lot
+from .lot_book import LotBook
+from .lot_matcher import LotMatcher
+from .run_profile import RunProfile
+from .sell_transaction_processor import SellTransactionProcessor
+import logging
+
+logger = logging.getLogger(__name__)
+
+BUY_TRANSACTION_TYPES: Final = frozenset([
+    'investment in stock',
+    'investment in fund',
+    'sip investment',
+    'bonus',
+    'demerger investment',
+    'merger investment',
+    'switch investment',
+    'dividend reinvestment'
+])
+
+SELL_TRANSACTION_TYPES: Final = frozenset([
+    'sell/redemption',
+    'merger redemption',
+    'demerger redemption',
+    'switch redemption'
+])
+
+TRANSACTION_TYPE_PRIORITY: Final = {
+    'investment in stock': 1,
+    'investment in fund': 2,
+    'sip investment': 3,
+    'dividend reinvestment': 4,
+    'bonus': 5,
+    'rights': 6,
+    'stock split': 7,
+    'merger investment': 8,
+    'demerger investment': 9,
+
+    'dividend': 10,
+
+    'sell/redemption': 90,
+    'merger redemption': 91,
+    'demerger redemption': 92,
+    'swp redemption': 93
+}
+
+# Lot matching engines accepted by process_all_transactions
+ENGINE_COLUMNAR: Final = 'columnar'
+ENGINE_ROWS: Final = 'rows'
+ENGINES: Final = (ENGINE_COLUMNAR, ENGINE_ROWS)
+# The whole pipeline on the csv module, without pandas (see StdlibProcessor)
+ENGINE_STDLIB: Final = 'stdlib'
+
+# Raw lot match record, turned into report rows by CGProcessor._build_report
+MATCH_FIELDS: Final = [
+    'sell_index', 'buy_index', 'use_qty', 'buy_shares_available',
+    'buy_price', 'sell_price', 'remaining_balance'
+]
+
+# Buys before and sells after this date use the grandfathered FMV
+GRANDFATHERING_CUTOFF: Final = datetime(2018, 10, 31)
+
+
+class LotEngine:
+    """Lot matching state machine over plain Python values.
+
+    Needs neither pandas nor numpy: the DataFrame engines extract a
+    company's columns into lists and run them through `match_company`,
+    as does StdlibProcessor with rows read by the csv module.
+    """
+
+    @staticmethod
+    def initial_state(
+        company_states: Optional[dict], company
+    ) -> Tuple[LotBook, Any]:
+        """Open lots and running balance a company starts from: those of
+        a resumed run if there are any, else none"""
+        if company_states is not None and company in company_states:
+            return company_states[company]
+        return LotBook(), 0
+
+    @staticmethod
+    def match_company(
+            company, ctypes: list, dates: list, qtys: list, prices: list,
+            sources: list, labels: list,
+            simple_fifo_mode=True,
+            same_source_only_matching=False,
+            matches: Optional[list] = None,
+            verbose: bool = False,
+            company_states: Optional[dict] = None,
+            profile: Optional[RunProfile] = None
+    ) -> None:
+        """Match one company's transactions, given as parallel lists in
+        processing order: stripped lower-case types, dates, quantities and
+        prices (None where unparseable), sources and the labels matches
+        refer to them by. Raw matches (see MATCH_FIELDS) are appended to
+        `matches`"""
+        matches = [] if matches is None else matches
+
+        # Initialize processors
+        lot_matcher = LotMatcher(simple_fifo_mode, same_source_only_matching)
+        sell_processor = SellTransactionProcessor(lot_matcher, verbose)
+
+        lots, running_balance = LotEngine.initial_state(
+            company_states, company)
+        matches_before = len(matches)
+        appended_before, scanned_before = lots.appended_count, lots.scanned_count
+
+        logger.info(f"Processing company: {company}")
+
+        for i, ctype in enumerate(ctypes):
+            try:
+                if ctype in BUY_TRANSACTION_TYPES:
+                    if qtys[i] is None or prices[i] is None:
+                        raise ValueError(
+                            f"non-numeric quantity/price ({qtys[i]}, {prices[i]})")
+                    running_balance = LotEngine.apply_buy(
+                        ctype, dates[i], qtys[i], prices[i], sources[i],
+                        labels[i], lots, running_balance, company
+                    )
+                elif ctype in SELL_TRANSACTION_TYPES:
+                    if qtys[i] is None or prices[i] is None:
+                        raise ValueError(
+                            f"non-numeric quantity/price ({qtys[i]}, {prices[i]})")
+                    new_running_balance = LotEngine.apply_sell(
+                        ctype, qtys[i], prices[i], dates[i], company,
+                        sources[i], labels[i], lots, running_balance,
+                        sell_processor, matches
+                    )
+                    if new_running_balance is not None:
+                        running_balance = new_running_balance
+                elif ctype == 'stock split':
+                    if qtys[i] is None:
+                        raise ValueError(f"non-numeric quantity {qtys[i]}")
+                    running_balance = LotEngine.apply_stock_split(
+                        ctype, dates[i], qtys[i], lots, running_balance, company
+                    )
+                else:
+                    logger.debug(
+                        f"{ctype}: Ignoring transaction type '{ctype}' for {company} - not relevant for capital gains")
+
+            except Exception as e:
+                logger.error(
+                    f"Error processing transaction for {company} on {dates[i]}: {e}")
+                continue
+
+        if company_states is not None:
+            company_states[company] = (lots, running_balance)
+        if profile is not None:
+            LotEngine.count_company(
+                profile, lots, appended_before, scanned_before,
+                matches[matches_before:])
+        logger.info(
+            f"Completed processing {company}: {len(matches) - matches_before} transactions")
+
+    @staticmethod
+    def apply_buy(
+        ctype, tdate, qty, price, source, index, lots: LotBook,
+        running_balance, company
+    ):
+        """Add a buy lot and return the updated running balance"""
+        try:
+            # Validate inputs
+            if qty <= 0:
+                logger.warning(
+                    f"{ctype}: Invalid quantity {qty} for {company} buy transaction")
+                return running_balance
+
+            if price < 0:
+                logger.warning(
+                    f"{ctype}: Invalid price {price} for {company} buy transaction")
+                return running_balance
+
+            # Create new lot
+            lots.append(Lot(source, qty, price, tdate, index))
+
+            running_balance += qty
+            logger.debug(
+                f"{ctype}: Added buy lot for {company}: {qty} shares at {price}")
+
+            return running_balance
+        except Exception as e:
+            logger.error(f"{ctype}: Error handling buy transaction: {e}")
+            return running_balance
+
+    @staticmethod
+    def apply_sell(
+        ctype, qty, price, sell_date, company, source, sell_index,
+        lots, running_balance, sell_processor: SellTransactionProcessor,
+        matches: list
+    ) -> Union[float, None]:
+        """Match a sell against open lots, recording the raw matches in
+        `matches` and returning the new running balance"""
+        sell_qty = abs(qty)
+        sell_price = price
+
+        # Validate inputs
+        if sell_qty <= 0:
+            logger.warning(
+                f"{ctype}: Invalid sell quantity {sell_qty} for {company}")
+            return None
+
+        if sell_price <= 0:
+            logger.warning(
+                f"{ctype}: Invalid sell price {sell_price} for {company}")
+            return None
+
+        # Process the sell transaction
+        sell_results, new_running_balance = \
+            sell_processor.process_sell_transaction(
+                ctype, lots, sell_qty, sell_price, sell_date, company, source, running_balance
+            )
+
+        # Record the raw matches (see MATCH_FIELDS), the lot's shares and
+        # price as of this sell
+        for result in sell_results:
+            chosen_lot = result['chosen_lot']
+            use_qty = result['use_qty']
+            matches.append((
+                sell_index, chosen_lot.index, use_qty,
+                chosen_lot.shares + use_qty, chosen_lot.price,
+                sell_price, result['new_running_balance']
+            ))
+
+        return new_running_balance
+
+    @staticmethod
+    def apply_stock_split(ctype, tdate, qty, lots: LotBook, running_balance, company):
+        """Rescale existing lots for a split and return the updated running balance"""
+        pre_split_balance = running_balance
+        if pre_split_balance > 0 and qty > 0:
+            split_ratio = (pre_split_balance + qty) / pre_split_balance
+            # Apply split ratio to existing lots
+            lots.rescale(split_ratio)
+            running_balance += qty
+            logger.info(
+                f"{ctype}: Applied stock split for {company} on {tdate}:"
+                f" ratio={split_ratio:.4f}")
+        else:
+            logger.warning(
+                f"{ctype}: Could not infer split ratio for {company} on {tdate} "
+                f"(pre_split_balance={pre_split_balance}, qty={qty})"
+            )
+            # Don't apply any changes if we can't calculate ratio
+            if pre_split_balance == 0:
+                logger.error(
+                    f"{ctype}: Error: No existing shares for stock split of {company}")
+
+        return running_balance
+
+    @staticmethod
+    def count_company(
+        profile: RunProfile, lots: LotBook, appended_before: int,
+        scanned_before: int, company_matches: list
+    ) -> None:
+        """Add a processed company's lot and match counts to `profile`"""
+        profile.count('lots_created', lots.appended_count - appended_before)
+        profile.count('lots_scanned', lots.scanned_count - scanned_before)
+        profile.count('sells', len({match[0] for match in company_matches}))
@@ -1,4 +1,6 @@
-from typing import List, Union, Any, Dict
+from typing import Union
+from .lot import Lot
+from .lot_book import LotBook
 import logging
 
 logger = logging.getLogger(__name__)
@@ -11,28 +13,17 @@ class LotMatcher:
         self.simple_fifo_mode = simple_fifo_mode
         self.same_source_only = same_source_only
 
-    def find_available_lots(
-            self, lots, source=None
-    ) -> List:
-        """Find available lots for matching"""
-        if self.same_source_only and source:
-            return [l for l in lots if l['shares'] > 0 and l['source'] == source]
-        return [l for l in lots if l['shares'] > 0]
-
-    def select_best_lot(
-        self, available_lots, sell_price
-    ) -> Union[Dict[Any, Any], None]:
-        """Select the best lot based on matching strategy"""
-        if not available_lots:
-            return None
+    def _source_filter(self, source):
+        return source if self.same_source_only and source else None
 
+    def next_lot(
+        self, lots: LotBook, sell_price, source=None
+    ) -> Union[Lot, None]:
+        """Pick the lot the next part of a sell should be matched against"""
         if self.simple_fifo_mode:
-            return available_lots[0]
-
-        # Prefer loss; else, profit minimization
-        loss_lots = [l for l in available_lots if l['price'] > sell_price]
-        if loss_lots:
-            return max(loss_lots, key=lambda b: b['price'] - sell_price)
+            return lots.first(self._source_filter(source))
 
-        # Default: highest price first, oldest if tie
-        return sorted(available_lots, key=lambda b: (-b['price'], b['date']))[0]
+        # Preferring the biggest loss and otherwise the highest price both
+        # come down to the highest priced lot, oldest first on ties, which
+        # the book serves from a heap
+        return lots.highest_priced(self._source_filter(source))
@@ -0,0 +1,87 @@
+from typing import Any, Dict, Final, List, Tuple
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+SNAPSHOT_VERSION: Final = 1
+
+# Transaction columns a snapshot's history digest covers, in this order
+DIGEST_COLUMNS: Final = [
+    'Transaction Date', 'Transaction Type', 'Company Name',
+    'Shares(Credits/Debits)', 'Price', 'Source', 'FMV', 'ISIN'
+]
+
+# Fields of an open lot record: what lot matching needs, plus the buy
+# transaction's fields the report reads
+LOT_FIELDS: Final = [
+    'source', 'shares', 'price', 'Transaction Date', 'Transaction Type', 'FMV'
+]
+
+
+class LotSnapshot:
+    """Lot matching state at the end of a run, to resume from later.
+
+    Holds every company's open lots and running balance, the last
+    transaction date processed (the checkpoint) and a digest of the
+    transactions up to it. A later run over the same history plus newer
+    transactions only needs to process those after the checkpoint; the
+    digest tells whether the history it was given is still the same.
+
+    Saved as JSON, which keeps float values exact.
+    """
+
+    def __init__(
+        self, checkpoint: pd.Timestamp, digest: str, settings: dict,
+        companies: Dict[Any, Tuple[Any, List[list]]]
+    ):
+        self.checkpoint = checkpoint
+        self.digest = digest
+        # Lot matching settings the state was built with
+        self.settings = settings
+        # Company -> (running balance, LOT_FIELDS records in FIFO order)
+        self.companies = companies
+
+    @staticmethod
+    def history_digest(transactions_df: pd.DataFrame) -> str:
+        """Digest of the transactions, in their (sorted) order"""
+        row_hashes = pd.util.hash_pandas_object(
+            transactions_df[DIGEST_COLUMNS], index=False)
+        return hashlib.sha256(row_hashes.to_numpy().tobytes()).hexdigest()
+
+    def save(self, path: str) -> None:
+        data = {
+            'version': SNAPSHOT_VERSION,
+            'checkpoint': self.checkpoint.isoformat(),
+            'digest': self.digest,
+            'settings': self.settings,
+            'lot_fields': LOT_FIELDS,
+            'companies': [
+                [company, running_balance, lots]
+                for company, (running_balance, lots) in self.companies.items()
+            ]
+        }
+        # Written under a temporary name, a snapshot is often replaced by
+        # the run resuming from it
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(data, f, default=str)
+        os.replace(temp_path, path)
+
+    @staticmethod
+    def load(path: str) -> 'LotSnapshot':
+        with open(path) as f:
+            data = json.load(f)
+        if data.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"Unsupported snapshot version {data.get('version')} in '{path}'")
+        return LotSnapshot(
+            checkpoint=pd.Timestamp(data['checkpoint']),
+            digest=data['digest'],
+            settings=data['settings'],
+            companies={
+                company: (running_balance, lots)
+                for company, running_balance, lots in data['companies']
+            }
+        )
@@ -0,0 +1,193 @@
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, BinaryIO, Dict, Final, TextIO, Type, Union
+import csv
+
+# Only encoding a report needs pandas, writing encoded batches does not
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+
+OUTPUT_CSV: Final = 'csv'
+OUTPUT_PARQUET: Final = 'parquet'
+OUTPUT_FEATHER: Final = 'feather'
+OUTPUT_FORMATS: Final = (OUTPUT_CSV, OUTPUT_PARQUET, OUTPUT_FEATHER)
+
+# Buffer size of a CSV report file
+OUTPUT_BUFFER_SIZE: Final = 1 << 20
+
+# Typed schema of the capital gains report, in column order: the Arrow
+# type of each column in Parquet/Feather output. Dates are kept as dates
+# there and formatted as '%d-%b-%Y' in CSV
+REPORT_SCHEMA: Final = {
+    'Sell Source': 'string',
+    'Company Name': 'string',
+    'Sell Date': 'date32',
+    'Transaction Type': 'string',
+    'Sell Quantity': 'float64',
+    'Sell Price': 'float64',
+    'Buy Source': 'string',
+    'Buy Transaction Type': 'string',
+    'Buy Date': 'date32',
+    'Buy Quantity': 'float64',
+    'Buy Price': 'float64',
+    'Sell Value': 'float64',
+    'Buy Value': 'float64',
+    'Profit': 'float64',
+    'Holding Days': 'int64',
+    'LTCG/STCG': 'string',
+    'Quarter': 'string',
+    'Financial Year': 'string',
+    'Remaining Balance': 'float64',
+    'FMV Used?': 'bool',
+    'FMV Value': 'float64',
+    'Original Buy Price': 'float64',
+    ' Adj Buy Price': 'float64'
+}
+REPORT_COLUMNS: Final = list(REPORT_SCHEMA)
+DATE_COLUMNS: Final = [
+    name for name, type_alias in REPORT_SCHEMA.items() if type_alias == 'date32'
+]
+
+
+class ReportWriter(ABC):
+    """Writes the capital gains report to a path or an open stream, one
+    batch of rows at a time.
+
+    Batches are encoded by `encode` wherever the report is built, worker
+    processes included, and the encoded batches written in order. Streams
+    are left open on close.
+    """
+
+    def __init__(self, output_file: Union[str, TextIO, BinaryIO]):
+        self.output_file = output_file
+
+    @staticmethod
+    def create(
+        output_file: Union[str, TextIO, BinaryIO], output_format: str = OUTPUT_CSV
+    ) -> 'ReportWriter':
+        """Writer for `output_format`. CSV is written to a path or text
+        stream, the columnar formats to a path or binary stream"""
+        return ReportWriter.writer_class(output_format)(output_file)
+
+    @staticmethod
+    def writer_class(output_format: str) -> Type['ReportWriter']:
+        writer_class = REPORT_WRITERS.get(output_format)
+        if writer_class is None:
+            raise ValueError(
+                f"Unknown output format '{output_format}', expected one of {OUTPUT_FORMATS}")
+        return writer_class
+
+    @staticmethod
+    @abstractmethod
+    def encode(report: 'pd.DataFrame') -> Any:
+        """A batch of report rows, encoded for `write`"""
+
+    @abstractmethod
+    def write(self, encoded: Any) -> None:
+        """Write a batch encoded by `encode`"""
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> 'ReportWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class CSVReportWriter(ReportWriter):
+    """Report as CSV, quoted where needed"""
+
+    def __init__(self, output_file: Union[str, TextIO]):
+        super().__init__(output_file)
+        self._owned = isinstance(output_file, str)
+        self.f = open(output_file, 'w', newline='', buffering=OUTPUT_BUFFER_SIZE) \
+            if self._owned else output_file
+        csv.writer(self.f, lineterminator='\n').writerow(REPORT_COLUMNS)
+
+    @staticmethod
+    def encode(report: 'pd.DataFrame') -> str:
+        report = report.copy()
+        for name in DATE_COLUMNS:
+            report[name] = CSVReportWriter._format_dates(report[name])
+        return report.to_csv(
+            None, columns=REPORT_COLUMNS, header=False, index=False,
+            na_rep='nan', lineterminator='\n')
+
+    def write(self, encoded: str) -> None:
+        self.f.write(encoded)
+
+    def close(self) -> None:
+        if self._owned:
+            self.f.close()
+
+    @staticmethod
+    def _format_dates(dates: 'pd.Series') -> 'np.ndarray':
+        """Format dates as '%d-%b-%Y', once per distinct date"""
+        import pandas as pd
+        codes, uniques = pd.factorize(dates)
+        return uniques.strftime('%d-%b-%Y').to_numpy(dtype=object)[codes]
+
+
+class ArrowReportWriter(ReportWriter):
+    """Base of the columnar report formats, which need pyarrow"""
+
+    def __init__(self, output_file: Union[str, BinaryIO]):
+        super().__init__(output_file)
+        self.writer = self._open(
+            output_file, ArrowReportWriter.arrow_schema())
+
+    @staticmethod
+    def arrow_schema():
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError(
+                "Parquet/Feather output requires pyarrow (pip install pyarrow)")
+        return pa.schema([
+            (name, pa.type_for_alias(type_alias))
+            for name, type_alias in REPORT_SCHEMA.items()
+        ])
+
+    @staticmethod
+    def encode(report: 'pd.DataFrame'):
+        import pyarrow as pa
+        return pa.Table.from_pandas(
+            report[REPORT_COLUMNS], schema=ArrowReportWriter.arrow_schema(),
+            preserve_index=False)
+
+    def write(self, encoded) -> None:
+        self.writer.write_table(encoded)
+
+    def close(self) -> None:
+        self.writer.close()
+
+    @abstractmethod
+    def _open(self, output_file, schema):
+        """The pyarrow writer of the format"""
+
+
+class ParquetReportWriter(ArrowReportWriter):
+    """Report as Parquet, a row group per batch"""
+
+    def _open(self, output_file, schema):
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(output_file, schema)
+
+
+class FeatherReportWriter(ArrowReportWriter):
+    """Report as Feather (an Arrow IPC file), LZ4 compressed"""
+
+    def _open(self, output_file, schema):
+        import pyarrow as pa
+        return pa.ipc.new_file(
+            output_file, schema,
+            options=pa.ipc.IpcWriteOptions(compression='lz4'))
+
+
+REPORT_WRITERS: Final[Dict[str, Type[ReportWriter]]] = {
+    OUTPUT_CSV: CSVReportWriter,
+    OUTPUT_PARQUET: ParquetReportWriter,
+    OUTPUT_FEATHER: FeatherReportWriter
+}
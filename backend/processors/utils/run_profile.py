@@ -0,0 +1,140 @@
+from contextlib import contextmanager
+from typing import Dict, Final, Iterator
+import logging
+import threading
+import time
+
+# Per-run profilers `RunProfile.profiler` can wrap a run in
+PROFILERS: Final = ('cprofile', 'pyinstrument')
+
+
+class _LogCounter(logging.Handler):
+    """Counts warning and error records logged by the thread it was
+    created in, leaving out runs going on in other threads"""
+
+    def __init__(self, profile: 'RunProfile'):
+        super().__init__(level=logging.WARNING)
+        self.profile = profile
+        self.thread = threading.get_ident()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if record.thread != self.thread:
+            return
+        self.profile.count(
+            'errors' if record.levelno >= logging.ERROR else 'warnings')
+
+
+class RunProfile:
+    """Wall time spent per stage and event counters of a single run.
+
+    Stages are timed with `stage()` and accumulate when entered again,
+    e.g. once per company or batch. Timings merged from worker processes
+    are summed, so with workers they can add up to more than the run's
+    wall time.
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) \
+                + time.perf_counter() - start
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def merge(self, other: 'RunProfile') -> None:
+        """Add the timings and counters of another (worker's) profile"""
+        for name, seconds in other.timings.items():
+            self.timings[name] = self.timings.get(name, 0.0) + seconds
+        for name, n in other.counters.items():
+            self.count(name, n)
+
+    @contextmanager
+    def count_log_records(self, logger_name: str = 'processors') -> Iterator[None]:
+        """Count the warnings and errors logged under `logger_name` by
+        the calling thread"""
+        handler = _LogCounter(self)
+        logger = logging.getLogger(logger_name)
+        logger.addHandler(handler)
+        try:
+            yield
+        finally:
+            logger.removeHandler(handler)
+
+    def to_dict(self) -> dict:
+        counters = dict(self.counters)
+        if counters.get('sells'):
+            counters['lots_scanned_per_sell'] = round(
+                counters.get('lots_scanned', 0) / counters['sells'], 2)
+        return {
+            'wall_seconds': round(time.perf_counter() - self._started, 6),
+            'stages': {
+                name: round(seconds, 6) for name, seconds in self.timings.items()
+            },
+            'counters': counters
+        }
+
+    def format(self) -> str:
+        """Human readable table of the stages and counters"""
+        profile = self.to_dict()
+        lines = [f"{'stage':<24}{'seconds':>12}"]
+        lines += [
+            f"{name:<24}{seconds:>12.3f}"
+            for name, seconds in profile['stages'].items()
+        ]
+        lines.append(f"{'(wall time)':<24}{profile['wall_seconds']:>12.3f}")
+        lines.append(f"{'counter':<24}{'value':>12}")
+        lines += [
+            f"{name:<24}{value:>12,}" if isinstance(value, int)
+            else f"{name:<24}{value:>12,.2f}"
+            for name, value in profile['counters'].items()
+        ]
+        return '\n'.join(lines)
+
+    def server_timing(self) -> str:
+        """The stage timings as a Server-Timing HTTP header value"""
+        return ', '.join(
+            f"{name};dur={seconds * 1000:.1f}"
+            for name, seconds in self.timings.items()
+        )
+
+    @staticmethod
+    @contextmanager
+    def profiler(output_file: str, kind: str = 'cprofile') -> Iterator[None]:
+        """Run the enclosed code under a profiler, saving its report to
+        `output_file`: pstats data for cProfile, HTML for pyinstrument
+        (which has to be installed)"""
+        if kind == 'cprofile':
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                profiler.dump_stats(output_file)
+        elif kind == 'pyinstrument':
+            try:
+                from pyinstrument import Profiler
+            except ImportError:
+                raise ImportError(
+                    "The pyinstrument profiler is not installed (pip install pyinstrument)")
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                with open(output_file, 'w') as f:
+                    f.write(profiler.output_html())
+        else:
+            raise ValueError(
+                f"Unknown profiler '{kind}', expected one of {PROFILERS}")
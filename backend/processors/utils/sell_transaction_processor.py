@@ -1,4 +1,5 @@
 from .lot_matcher import LotMatcher
+from .lot_book import LotBook
 from typing import Tuple, Dict, Any, Union
 import logging
 
@@ -14,7 +15,7 @@ class SellTransactionProcessor:
         self.verbose: bool = verbose
 
     def process_sell_transaction(
-        self, ctype, lots: list, sell_qty, sell_price, sell_date,
+        self, ctype, lots: LotBook, sell_qty, sell_price, sell_date,
             company, source, running_balance
     ) -> Tuple[list, float]:
         """Process a sell transaction with improved error handling"""
@@ -53,24 +54,18 @@ class SellTransactionProcessor:
         return results, running_balance
 
     def _process_single_lot_match(
-        self, lots, sell_qty, sell_price, sell_date,
+        self, lots: LotBook, sell_qty, sell_price, sell_date,
             company, source, running_balance
     ) -> Union[Dict[Any, Any], None]:
         """Process a single lot match"""
-        available_lots = self.lot_matcher.find_available_lots(lots, source)
-
-        if not available_lots:
-            return None
-
-        chosen_buy_lot = self.lot_matcher.select_best_lot(
-            available_lots, sell_price)
+        chosen_buy_lot = self.lot_matcher.next_lot(lots, sell_price, source)
         if not chosen_buy_lot:
             return None
 
-        use_qty = min(chosen_buy_lot['shares'], sell_qty)
+        use_qty = min(chosen_buy_lot.shares, sell_qty)
 
         # Update lot and calculate remaining quantities
-        chosen_buy_lot['shares'] -= use_qty
+        lots.consume(chosen_buy_lot, use_qty)
         new_sell_qty = sell_qty - use_qty
         new_running_balance = running_balance - use_qty
 
@@ -83,7 +78,7 @@ class SellTransactionProcessor:
 
     def _log_insufficient_quantity_warning(
         self, ctype, company, sell_qty, sell_price,
-            sell_date, lots
+            sell_date, lots: LotBook
     ) -> None:
         """Log warning for insufficient quantity with detailed context"""
         sell_data = {
@@ -99,7 +94,7 @@ class SellTransactionProcessor:
 
         if self.verbose and lots:
             import pandas as pd
-            lots_df = pd.DataFrame(lots)
+            lots_df = pd.DataFrame([lot.to_dict() for lot in lots])
             logger.info(
                 f"{ctype}: Available lots for {company}:\n{lots_df.to_string()}")
         elif not lots:
@@ -0,0 +1,81 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Final, Iterator, Optional
+import multiprocessing
+import os
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Worker processes are forked from a forkserver, not from the calling
+# process: the API calculates in threads, and a fork copies the locks
+# other threads hold at that moment. The forkserver is single threaded
+# and has these modules imported already, so a worker starts in
+# milliseconds instead of importing pandas afresh as a spawned one would
+# (which is the fallback where there is no forkserver)
+WORKER_START_METHOD: Final = 'forkserver'
+FALLBACK_START_METHOD: Final = 'spawn'
+WORKER_PRELOAD: Final = ['processors.capital_gains']
+
+
+class WorkerPool:
+    """Process pool shared by every parallel run of the process.
+
+    The pool is created on first use and kept, so worker start-up is paid
+    once per process rather than once per run, and concurrent runs (API
+    requests) share its processes instead of starting a pool each. It is
+    sized to the CPUs, or to the largest worker count asked for; a pool
+    too small for a run is replaced once no run is using it. Processes
+    are only started as runs keep them busy.
+    """
+
+    _lock = threading.Lock()
+    _executor: Optional[ProcessPoolExecutor] = None
+    _size = 0
+    _users = 0
+
+    @classmethod
+    @contextmanager
+    def acquire(cls, workers: int) -> Iterator[ProcessPoolExecutor]:
+        """The shared executor, for a run of `workers` workers"""
+        with cls._lock:
+            if cls._executor is None or (cls._size < workers and cls._users == 0):
+                cls._replace(max(workers, os.cpu_count() or 1))
+            executor = cls._executor
+            cls._users += 1
+        try:
+            yield executor
+        except BrokenProcessPool:
+            # A worker died: start over with a fresh pool on next use
+            with cls._lock:
+                if cls._executor is executor:
+                    cls._executor = None
+            raise
+        finally:
+            with cls._lock:
+                cls._users -= 1
+
+    @classmethod
+    def shutdown(cls) -> None:
+        with cls._lock:
+            cls._replace(0)
+
+    @classmethod
+    def _replace(cls, size: int) -> None:
+        if cls._executor is not None:
+            cls._executor.shutdown(wait=False)
+        cls._executor = ProcessPoolExecutor(
+            max_workers=size, mp_context=cls._mp_context()) if size else None
+        cls._size = size
+        if size:
+            logger.debug(f"Started a worker pool of up to {size} processes")
+
+    @staticmethod
+    def _mp_context() -> multiprocessing.context.BaseContext:
+        if WORKER_START_METHOD not in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context(FALLBACK_START_METHOD)
+        context = multiprocessing.get_context(WORKER_START_METHOD)
+        context.set_forkserver_preload(WORKER_PRELOAD)
+        return context
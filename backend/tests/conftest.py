@@ -0,0 +1,77 @@
+import os
+import shutil
+import sys
+import time
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+from benchmarks.synthetic import write_transactions_csv  # noqa: E402
+
+FMV_DATA_FILE = os.path.join(BACKEND_DIR, 'Grandfathered_ISIN_Prices.csv')
+# Jobs the API test app runs at once
+API_JOB_WORKERS = 4
+JOB_TIMEOUT_SECONDS = 120
+
+
+@pytest.fixture(scope='session')
+def fmv_data_file() -> str:
+    return FMV_DATA_FILE
+
+
+@pytest.fixture(scope='session')
+def ledger(tmp_path_factory) -> str:
+    """A synthetic transactions CSV spanning the grandfathering cutoff,
+    with splits, bonuses, mergers and dividends"""
+    path = str(tmp_path_factory.mktemp('ledger') / 'transactions.csv')
+    write_transactions_csv(
+        path, companies=30, transactions_per_company=80, sources=3,
+        split_ratio=0.02, bonus_ratio=0.02, merger_ratio=0.005,
+        start_date='2014-06-01', days=3650, fmv_data_file=FMV_DATA_FILE, seed=7)
+    return path
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    """The API app, with the result cache off and a job queue of its own"""
+    # The API reads the default FMV file from the working directory (and
+    # writes its sidecar next to it), so it runs from a copy
+    shutil.copy(FMV_DATA_FILE, tmp_path)
+    monkeypatch.chdir(tmp_path)
+    from app import app
+    import api.routes
+    from api.jobs import JobQueue
+    from api.result_cache import ResultCache
+
+    monkeypatch.setattr(api.routes, 'result_cache', ResultCache(max_bytes=0))
+    monkeypatch.setattr(api.routes, 'job_queue', JobQueue(workers=API_JOB_WORKERS))
+    return app
+
+
+def submit_job(client, path: str, form: dict) -> bytes:
+    """Submit a transactions file as an API job, wait for it to finish and
+    return its result"""
+    with open(path, 'rb') as f:
+        response = client.post(
+            '/api/jobs',
+            data=dict(form, transactions_file=(f, 'transactions.csv')),
+            content_type='multipart/form-data'
+        )
+    assert response.status_code == 202, response.get_data(as_text=True)
+    job_url = response.headers['Location']
+
+    deadline = time.monotonic() + JOB_TIMEOUT_SECONDS
+    while True:
+        job = client.get(job_url).get_json()
+        if job['status'] not in ('queued', 'running'):
+            break
+        assert time.monotonic() < deadline, f"Job {job['job_id']} timed out"
+        time.sleep(0.05)
+    assert job['status'] == 'done', job['error']
+
+    response = client.get(f"{job_url}/result")
+    assert response.status_code == 200
+    return response.data
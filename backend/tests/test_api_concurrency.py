@@ -0,0 +1,115 @@
+import io
+import json
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from conftest import API_JOB_WORKERS, FMV_DATA_FILE, submit_job
+from benchmarks.synthetic import write_transactions_csv
+from processors.base import TransactionProcessor
+from processors.pipeline import ReportPipeline, CapitalGainsReport, DividendsReport
+from processors.utils.fmv_index import SIDECAR_SUFFIX
+from processors.utils.run_profile import RunProfile
+
+# Portfolios sent at once, each to /calculate and as a job
+PORTFOLIOS = API_JOB_WORKERS
+
+
+@pytest.fixture(scope='module')
+def portfolios(tmp_path_factory) -> list:
+    """(ledger path, form) of portfolios that differ in size and settings"""
+    temp_dir = tmp_path_factory.mktemp('portfolios')
+    portfolios = []
+    for i in range(PORTFOLIOS):
+        path = str(temp_dir / f'portfolio_{i}.csv')
+        write_transactions_csv(
+            path, companies=10 + 5 * i, transactions_per_company=60,
+            fmv_data_file=FMV_DATA_FILE, seed=i)
+        portfolios.append((path, dict(
+            includeDividends='true',
+            profile='true',
+            sameSourceOnly='true' if i % 2 else 'false',
+            simpleFifoMode='false' if i % 3 == 2 else 'true',
+            ltcgThresholdDays=str(365 + 100 * (i // 2))
+        )))
+    return portfolios
+
+
+def expected_result(path: str, form: dict) -> dict:
+    """The reports and profile counters of a portfolio, calculated on its own
+    without the API"""
+    profile = RunProfile()
+    outputs = {name: io.StringIO() for name in (
+        'capital_gains.csv', 'dividends.csv', 'dividends_summary.csv')}
+    transactions_df = TransactionProcessor.initialize_data(
+        path, FMV_DATA_FILE, profile=profile)
+    pipeline = ReportPipeline(profile)
+    pipeline.register(CapitalGainsReport(
+        output_file=outputs['capital_gains.csv'],
+        same_source_only_matching=form['sameSourceOnly'] == 'true',
+        simple_fifo_mode=form['simpleFifoMode'] == 'true',
+        ltcg_threshold_days=int(form['ltcgThresholdDays'])
+    ))
+    pipeline.register(DividendsReport(
+        output_file=outputs['dividends.csv'],
+        summary_file=outputs['dividends_summary.csv']
+    ))
+    pipeline.run(transactions_df)
+    result = {name: output.getvalue() for name, output in outputs.items()}
+    result['counters'] = profile.to_dict()['counters']
+    return result
+
+
+def result_of(zip_data: bytes) -> dict:
+    with zipfile.ZipFile(io.BytesIO(zip_data)) as zip_file:
+        result = {
+            name: zip_file.read(name).decode('utf-8')
+            for name in zip_file.namelist() if name.endswith('.csv')
+        }
+        result['counters'] = json.loads(zip_file.read('profile.json'))['counters']
+    return result
+
+
+def calculate(client, path: str, form: dict) -> dict:
+    with open(path, 'rb') as f:
+        response = client.post(
+            '/api/calculate',
+            data=dict(form, transactions_file=(f, 'transactions.csv')),
+            content_type='multipart/form-data'
+        )
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return result_of(response.data)
+
+
+def run_job(client, path: str, form: dict) -> dict:
+    return result_of(submit_job(client, path, form))
+
+
+def test_concurrent_requests_and_jobs_are_isolated(app, portfolios):
+    expected = [expected_result(path, form) for path, form in portfolios]
+    files_before = set(os.listdir('.'))
+
+    requests = [(calculate, i) for i in range(PORTFOLIOS)] + \
+        [(run_job, i) for i in range(PORTFOLIOS)]
+    barrier = threading.Barrier(len(requests))
+
+    def send(request) -> dict:
+        send_request, i = request
+        client = app.test_client()
+        barrier.wait()
+        return send_request(client, *portfolios[i])
+
+    with ThreadPoolExecutor(max_workers=len(requests)) as executor:
+        results = list(executor.map(send, requests))
+
+    for (send_request, i), result in zip(requests, results):
+        assert result == expected[i], f"{send_request.__name__} of portfolio {i}"
+
+    # Nothing is written to the working directory but the shared FMV sidecar
+    stray = sorted(
+        name for name in set(os.listdir('.')) - files_before
+        if not name.endswith(SIDECAR_SUFFIX))
+    assert stray == []
@@ -0,0 +1,58 @@
+import csv
+import os
+import shutil
+import subprocess
+import sys
+
+from conftest import BACKEND_DIR
+
+CLI = os.path.join(BACKEND_DIR, 'capital_gains_calc_cli.py')
+
+
+def run_batch(input_dir, output_dir, fmv_data_file: str, *options: str):
+    return subprocess.run(
+        [sys.executable, CLI, '--batch', str(input_dir), '-o', str(output_dir), '-f',
+         '-d', fmv_data_file, *options],
+        cwd=str(output_dir.parent), capture_output=True, text=True)
+
+
+def statuses(output_dir) -> dict:
+    with open(output_dir / 'batch_summary.csv', newline='') as f:
+        return {row['Portfolio']: row['Status'] for row in csv.DictReader(f)}
+
+
+def test_batch_exits_with_status_1_when_a_portfolio_fails(ledger, fmv_data_file, tmp_path):
+    input_dir = tmp_path / 'portfolios'
+    input_dir.mkdir()
+    shutil.copy(ledger, input_dir / 'a.csv')
+    with open(ledger) as f:
+        header, *rows = f.readlines()[:50]
+    with open(input_dir / 'c.csv', 'w') as f:
+        f.writelines([header.replace('Transaction Date', 'Date')] + rows)
+    output_dir = tmp_path / 'out'
+
+    for options in ((), ('-w', '2')):
+        completed = run_batch(input_dir, output_dir, fmv_data_file, *options)
+        assert statuses(output_dir) == {'a': 'ok', 'c': 'failed'}
+        assert completed.returncode == 1, completed.stdout + completed.stderr
+        assert "1 failed" in completed.stdout
+
+
+def test_batch_exits_with_status_0_when_every_portfolio_succeeds(ledger, fmv_data_file, tmp_path):
+    input_dir = tmp_path / 'portfolios'
+    input_dir.mkdir()
+    shutil.copy(ledger, input_dir / 'a.csv')
+    shutil.copy(ledger, input_dir / 'b.csv')
+    output_dir = tmp_path / 'out'
+
+    completed = run_batch(input_dir, output_dir, fmv_data_file)
+    assert statuses(output_dir) == {'a': 'ok', 'b': 'ok'}
+    assert completed.returncode == 0, completed.stdout + completed.stderr
+
+
+def test_batch_without_portfolios_exits_with_status_1(fmv_data_file, tmp_path):
+    input_dir = tmp_path / 'empty'
+    input_dir.mkdir()
+    completed = run_batch(input_dir, tmp_path / 'out', fmv_data_file)
+    assert completed.returncode == 1
+    assert "No transaction files found" in completed.stdout
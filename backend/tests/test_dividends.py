@@ -0,0 +1,65 @@
+import io
+
+import pandas as pd
+
+from processors.base import TransactionProcessor
+from processors.dividends import DividendProcessor, SUMMARY_COLUMNS
+from processors.stdlib_processor import StdlibProcessor
+
+
+def _pandas_reports(ledger: str, fmv_data_file: str):
+    transactions_df = TransactionProcessor.initialize_data(ledger, fmv_data_file)
+    dividends, summary = io.StringIO(), io.StringIO()
+    DividendProcessor.process_all_transactions(
+        transactions_df, dividends, overwrite=True, summary_file=summary)
+    return dividends.getvalue(), summary.getvalue()
+
+
+def _stdlib_reports(ledger: str, fmv_data_file: str):
+    transactions = StdlibProcessor.read_transactions(
+        ledger, StdlibProcessor.load_fmv_mapping(fmv_data_file, stdlib=True))
+    dividends, summary = io.StringIO(), io.StringIO()
+    StdlibProcessor.process_dividends(transactions, dividends, summary_file=summary)
+    return dividends.getvalue(), summary.getvalue()
+
+
+def test_engines_write_identical_dividend_reports(ledger, fmv_data_file):
+    pandas_dividends, pandas_summary = _pandas_reports(ledger, fmv_data_file)
+    stdlib_dividends, stdlib_summary = _stdlib_reports(ledger, fmv_data_file)
+
+    assert pandas_summary.count('\n') > 1
+    assert pandas_dividends == stdlib_dividends
+    assert pandas_summary == stdlib_summary
+
+
+def test_summary_has_observed_groups_only(ledger, fmv_data_file):
+    transactions_df = TransactionProcessor.initialize_data(ledger, fmv_data_file)
+    dividend_df = DividendProcessor.dividends(transactions_df)
+    summary_df = DividendProcessor.summarize(dividend_df)
+
+    assert list(summary_df.columns) == SUMMARY_COLUMNS
+    # One row per (FY, quarter, company, source) with dividends, not one
+    # per combination of the categorical FY and Quarter
+    observed = dividend_df.astype({'Quarter': str, 'Financial Year': str}).groupby(
+        ['Financial Year', 'Quarter', 'Company Name', 'Source'], dropna=False).ngroups
+    assert len(summary_df) == observed
+    assert (summary_df['Dividends'] > 0).all()
+    assert summary_df['Dividends'].sum() == len(dividend_df)
+    assert round(summary_df['Amount'].sum(), 2) == round(dividend_df['Amount'].sum(), 2)
+
+
+def test_summary_of_categorical_keys():
+    quarters = pd.Categorical(['Q1', 'Q3'], categories=['Q1', 'Q2', 'Q3', 'Q4'], ordered=True)
+    years = pd.Categorical(['FY 2020-21', 'FY 2021-22'], ordered=True)
+    dividend_df = pd.DataFrame({
+        'Company Name': ['A', 'B'], 'Date': ['2020-05-01', '2021-11-01'],
+        'Amount': [10.005, 20.0], 'Quarter': quarters, 'Financial Year': years,
+        'Source': ['s1', 's2']
+    })
+    summary_df = DividendProcessor.summarize(dividend_df)
+
+    assert summary_df[['Financial Year', 'Quarter', 'Company Name', 'Source', 'Dividends']] \
+        .astype(str).values.tolist() == [
+            ['FY 2020-21', 'Q1', 'A', 's1', '1'],
+            ['FY 2021-22', 'Q3', 'B', 's2', '1'],
+        ]
@@ -0,0 +1,101 @@
+import io
+
+import pytest
+
+from processors.base import TransactionProcessor
+from processors import capital_gains
+from processors.capital_gains import CGProcessor
+from processors.stdlib_processor import StdlibProcessor
+from processors.utils.lot_engine import ENGINES
+from processors.utils.worker_pool import WorkerPool
+
+# (same_source_only_matching, simple_fifo_mode, ltcg_threshold_days)
+SETTINGS = [
+    (False, True, 365),
+    (True, True, 365),
+    (False, False, 365),
+    (True, False, 730),
+]
+
+
+def _pandas_reports(ledger, fmv_data_file, engine, settings):
+    same_source_only_matching, simple_fifo_mode, ltcg_threshold_days = settings
+    transactions_df = TransactionProcessor.initialize_data(ledger, fmv_data_file)
+    report, fmv_audit = io.StringIO(), io.StringIO()
+    CGProcessor.process_all_transactions(
+        transactions_df=transactions_df,
+        output_file=report,
+        overwrite=True,
+        fmv_data_file=fmv_data_file,
+        same_source_only_matching=same_source_only_matching,
+        simple_fifo_mode=simple_fifo_mode,
+        ltcg_threshold_days=ltcg_threshold_days,
+        engine=engine,
+        fmv_audit_file=fmv_audit
+    )
+    return report.getvalue(), fmv_audit.getvalue()
+
+
+def _stdlib_reports(ledger, fmv_data_file, settings):
+    same_source_only_matching, simple_fifo_mode, ltcg_threshold_days = settings
+    transactions = StdlibProcessor.read_transactions(
+        ledger, StdlibProcessor.load_fmv_mapping(fmv_data_file, stdlib=True))
+    report, fmv_audit = io.StringIO(), io.StringIO()
+    StdlibProcessor.process_all_transactions(
+        transactions=transactions,
+        output_file=report,
+        same_source_only_matching=same_source_only_matching,
+        simple_fifo_mode=simple_fifo_mode,
+        ltcg_threshold_days=ltcg_threshold_days,
+        fmv_audit_file=fmv_audit
+    )
+    return report.getvalue(), fmv_audit.getvalue()
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('settings', SETTINGS)
+def test_stdlib_engine_matches_pandas_engines(ledger, fmv_data_file, engine, settings):
+    """The stdlib engine encodes the report rows (holding period, LTCG or
+    STCG, grandfathering and rounding) on its own, so it is checked
+    against the pandas report builder"""
+    pandas_report, pandas_fmv_audit = _pandas_reports(ledger, fmv_data_file, engine, settings)
+    stdlib_report, stdlib_fmv_audit = _stdlib_reports(ledger, fmv_data_file, settings)
+
+    assert pandas_report.count('\n') > 100
+    assert 'LTCG' in pandas_report and 'STCG' in pandas_report
+    assert pandas_report == stdlib_report
+    assert pandas_fmv_audit.count('\n') > 1
+    assert pandas_fmv_audit == stdlib_fmv_audit
+
+
+def test_worker_processes_match_a_single_process(ledger, fmv_data_file, monkeypatch):
+    # The ledger is below the size matched in-process
+    monkeypatch.setattr(capital_gains, 'MIN_PARALLEL_ROWS', 0)
+    settings = SETTINGS[0]
+    single = _pandas_reports(ledger, fmv_data_file, ENGINES[0], settings)
+
+    executors = []
+    for _ in range(2):
+        transactions_df = TransactionProcessor.initialize_data(ledger, fmv_data_file)
+        report, fmv_audit = io.StringIO(), io.StringIO()
+        CGProcessor.process_all_transactions(
+            transactions_df=transactions_df, output_file=report, overwrite=True,
+            fmv_data_file=fmv_data_file, workers=2, fmv_audit_file=fmv_audit)
+        assert (report.getvalue(), fmv_audit.getvalue()) == single
+        executors.append(WorkerPool._executor)
+
+    # Runs share one pool
+    assert executors[0] is not None and executors[1] is executors[0]
+
+
+def test_small_ledgers_are_matched_in_process(ledger, fmv_data_file):
+    WorkerPool.shutdown()
+    single = _pandas_reports(ledger, fmv_data_file, ENGINES[0], SETTINGS[0])
+    transactions_df = TransactionProcessor.initialize_data(ledger, fmv_data_file)
+    report = io.StringIO()
+    CGProcessor.process_all_transactions(
+        transactions_df=transactions_df, output_file=report, overwrite=True,
+        fmv_data_file=fmv_data_file, workers=2, fmv_audit_file=io.StringIO())
+
+    assert report.getvalue() == single[0]
+    assert WorkerPool._executor is None
@@ -0,0 +1,32 @@
+import pickle
+import shutil
+
+import pytest
+
+from processors.utils.fmv_index import FMVIndex, SIDECAR_SUFFIX
+
+
+@pytest.fixture
+def fmv_copy(fmv_data_file, tmp_path) -> str:
+    path = str(tmp_path / 'prices.csv')
+    shutil.copy(fmv_data_file, path)
+    yield path
+    FMVIndex.clear()
+
+
+@pytest.mark.parametrize('sidecar', [
+    b'not a pickle',
+    # Unpickles to a class that no longer exists
+    b'cbuiltins\nno_such_attribute\n.',
+    pickle.dumps('no version'),
+    pickle.dumps(((1,), {})),
+])
+def test_unreadable_sidecar_is_rebuilt(fmv_copy, sidecar):
+    expected = FMVIndex.parse(fmv_copy)
+    with open(fmv_copy + SIDECAR_SUFFIX, 'wb') as f:
+        f.write(sidecar)
+
+    assert FMVIndex.for_file(fmv_copy, sidecar=True) == expected
+    # Rewritten from the CSV
+    with open(fmv_copy + SIDECAR_SUFFIX, 'rb') as f:
+        assert pickle.load(f)[1] == expected
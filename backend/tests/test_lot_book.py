@@ -0,0 +1,144 @@
+from datetime import datetime
+
+from processors.utils.lot import Lot
+from processors.utils.lot_book import LotBook
+from processors.utils.lot_engine import LotEngine
+
+NAN = float('nan')
+
+
+def book_of(*lots: Lot) -> LotBook:
+    book = LotBook()
+    for lot in lots:
+        book.append(lot)
+    return book
+
+
+def match(ledger: list, **settings) -> list:
+    """Raw matches (see MATCH_FIELDS) of a one company ledger of
+    (type, date, quantity, price, source) rows, labelled by position"""
+    ctypes, dates, qtys, prices, sources = (list(column) for column in zip(*ledger))
+    matches = []
+    LotEngine.match_company(
+        'COMPANY', ctypes, dates, qtys, prices, sources,
+        labels=list(range(len(ledger))), matches=matches, **settings)
+    return matches
+
+
+def test_non_fifo_sells_the_highest_price_oldest_first():
+    ledger = [
+        ('investment in stock', datetime(2020, 1, 1), 10, 100.0, 's1'),
+        ('investment in stock', datetime(2020, 1, 3), 10, 120.0, 's1'),
+        ('investment in stock', datetime(2020, 1, 2), 10, 120.0, 's2'),
+        ('investment in stock', datetime(2020, 1, 2), 10, 120.0, 's1'),
+        ('sell/redemption', datetime(2020, 2, 1), -25, 110.0, 's1'),
+    ]
+
+    # 120 before 100; on 120, the 2 Jan lots (in the order bought) before 3 Jan
+    assert match(ledger, simple_fifo_mode=False) == [
+        (4, 2, 10, 10, 120.0, 110.0, 30),
+        (4, 3, 10, 10, 120.0, 110.0, 20),
+        (4, 1, 5, 10, 120.0, 110.0, 15),
+    ]
+    # Same source only: the s2 lot is skipped
+    assert match(ledger, simple_fifo_mode=False, same_source_only_matching=True) == [
+        (4, 3, 10, 10, 120.0, 110.0, 30),
+        (4, 1, 10, 10, 120.0, 110.0, 20),
+        (4, 0, 5, 10, 100.0, 110.0, 15),
+    ]
+    assert match(ledger) == [
+        (4, 0, 10, 10, 100.0, 110.0, 30),
+        (4, 1, 10, 10, 120.0, 110.0, 20),
+        (4, 2, 5, 10, 120.0, 110.0, 15),
+    ]
+
+
+def test_nan_prices_rank_after_every_priced_lot():
+    unpriced = Lot('s1', 10, NAN, datetime(2020, 1, 1), 0)
+    cheap = Lot('s1', 10, 5.0, datetime(2020, 1, 2), 1)
+    book = book_of(unpriced, cheap)
+
+    assert book.highest_priced() is cheap
+    book.consume(cheap, 10)
+    assert book.highest_priced() is unpriced
+
+
+def test_nan_source_matches_no_lot():
+    unsourced = Lot(NAN, 10, 5.0, datetime(2020, 1, 1), 0)
+    book = book_of(unsourced, Lot('s1', 10, 4.0, datetime(2020, 1, 2), 1))
+
+    assert book.highest_priced(NAN) is None
+    assert book.highest_priced(unsourced.source) is None
+    assert book.first(NAN) is None
+    # A missing source is never given a heap of its own
+    assert book.highest_priced() is unsourced
+    assert len(book._heaps) == 1
+
+
+def test_partial_consumption_keeps_the_lot_open():
+    lot = Lot('s1', 10, 5.0, datetime(2020, 1, 1), 0)
+    book = book_of(lot)
+
+    book.consume(lot, 4)
+    assert len(book) == 1
+    assert book.first() is lot and book.highest_priced() is lot
+    assert lot.shares == 6
+
+    book.consume(lot, 6)
+    assert len(book) == 0
+    assert book.first() is None and book.highest_priced() is None
+    assert list(book) == []
+
+
+def test_heap_entries_of_compacted_lots_are_skipped():
+    a = Lot('s1', 10, 10.0, datetime(2020, 1, 1), 0)
+    b = Lot('s1', 10, 30.0, datetime(2020, 1, 2), 1)
+    c = Lot('s2', 10, 20.0, datetime(2020, 1, 3), 2)
+    book = book_of(a, b, c)
+    assert book.highest_priced('s2') is c
+
+    assert book.highest_priced() is b
+    book.consume(b, 10)
+    assert book.highest_priced() is c
+    # Depleted lots now outnumber open ones: the queues are compacted, the
+    # heaps still hold an entry for c
+    book.consume(c, 10)
+    assert list(book._lots) == [a]
+    assert any(entry[-1] is c for entry in book._heaps[None])
+
+    assert book.highest_priced() is a
+    assert book.highest_priced('s2') is None
+
+    # Lots bought after compaction join the heaps built before it
+    d = Lot('s2', 10, 25.0, datetime(2020, 1, 4), 3)
+    book.append(d)
+    assert book.highest_priced() is d
+    assert book.highest_priced('s2') is d
+    assert book.first() is a
+    assert list(book) == [a, d]
+    assert len(book) == 2
+
+
+def test_splits_apply_in_order_to_partly_sold_lots():
+    ledger = [
+        ('investment in stock', datetime(2020, 1, 1), 10, 100.0, 's1'),
+        # 2 for 1: the lot is 20 at 50
+        ('stock split', datetime(2020, 2, 1), 10, 0, 's1'),
+        ('sell/redemption', datetime(2020, 3, 1), -5, 60.0, 's1'),
+        # 3 for 1 on the 15 left: the lot is 45 at 50 / 3
+        ('stock split', datetime(2020, 4, 1), 30, 0, 's1'),
+        # Bought after both splits, not rescaled
+        ('investment in stock', datetime(2020, 5, 1), 10, 40.0, 's1'),
+        ('sell/redemption', datetime(2020, 6, 1), -50, 30.0, 's1'),
+    ]
+
+    assert match(ledger) == [
+        (2, 0, 5, 20, 50.0, 60.0, 15),
+        (5, 0, 45, 45, 100.0 / 2 / 3, 30.0, 10),
+        (5, 4, 5, 10, 40.0, 30.0, 5),
+    ]
+    assert match(ledger, simple_fifo_mode=False) == [
+        (2, 0, 5, 20, 50.0, 60.0, 15),
+        (5, 4, 10, 10, 40.0, 30.0, 45),
+        (5, 0, 40, 45, 100.0 / 2 / 3, 30.0, 5),
+    ]
@@ -0,0 +1,143 @@
+import csv
+import io
+import logging
+from datetime import datetime
+
+import pytest
+
+from processors.base import TransactionProcessor
+from processors.capital_gains import CGProcessor
+from processors.pipeline import (
+    ReportPipeline, CapitalGainsReport, DividendsReport, HoldingsReport
+)
+
+
+def _reports(fmv_data_file: str):
+    files = {name: io.StringIO() for name in ('cg', 'fmv', 'dividends', 'summary')}
+    pipeline = ReportPipeline()
+    pipeline.register(CapitalGainsReport(
+        output_file=files['cg'], fmv_data_file=fmv_data_file,
+        fmv_audit_file=files['fmv']))
+    pipeline.register(DividendsReport(
+        output_file=files['dividends'], summary_file=files['summary']))
+    return pipeline, files
+
+
+def test_partitions_give_the_in_memory_reports(ledger, fmv_data_file, tmp_path):
+    pipeline, in_memory = _reports(fmv_data_file)
+    pipeline.run(TransactionProcessor.initialize_data(ledger, fmv_data_file))
+
+    partition_files = TransactionProcessor.partition_transactions(
+        transactions_data_file=ledger, spill_dir=str(tmp_path),
+        chunk_size=250, partition_rows=400)
+    assert len(partition_files) > 1
+    pipeline, partitioned = _reports(fmv_data_file)
+    started = []
+    pipeline.run_partitions(
+        TransactionProcessor.iter_partitions(partition_files, fmv_data_file),
+        lambda consumer: started.append(consumer.name))
+
+    assert started == ['capital gains', 'dividends']
+    assert pipeline.context.record_count > 0
+    for name, output in in_memory.items():
+        assert output.getvalue().count('\n') > 1
+        assert partitioned[name].getvalue() == output.getvalue(), name
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'feather'])
+def test_columnar_input_gives_the_csv_reports(ledger, fmv_data_file, tmp_path, file_format):
+    import pandas as pd
+    pytest.importorskip('pyarrow')
+    # '--' placeholders are nulls in a columnar file
+    transactions = pd.read_csv(ledger, na_values=['--'], keep_default_na=False)
+    transactions['Transaction Date'] = pd.to_datetime(
+        transactions['Transaction Date']).dt.date
+    path = str(tmp_path / f'transactions.{file_format}')
+    getattr(transactions, f'to_{file_format}')(path)
+
+    pipeline, from_csv = _reports(fmv_data_file)
+    pipeline.run(TransactionProcessor.initialize_data(ledger, fmv_data_file))
+    pipeline, columnar = _reports(fmv_data_file)
+    pipeline.run(TransactionProcessor.initialize_data(path, fmv_data_file))
+
+    for name, output in from_csv.items():
+        assert output.getvalue().count('\n') > 1
+        assert columnar[name].getvalue() == output.getvalue(), name
+
+
+def test_holdings_need_the_whole_transactions(fmv_data_file):
+    pipeline, _ = _reports(fmv_data_file)
+    pipeline.register(HoldingsReport(output_file=io.StringIO()))
+    with pytest.raises(ValueError, match='holdings'):
+        pipeline.run_partitions([])
+
+
+def test_holdings_need_a_capital_gains_report(ledger, fmv_data_file):
+    pipeline = ReportPipeline().register(HoldingsReport(output_file=io.StringIO()))
+    with pytest.raises(ValueError, match='capital gains'):
+        pipeline.run(TransactionProcessor.initialize_data(ledger, fmv_data_file))
+
+
+# Last day of the history a snapshot is taken of, in the ledger's date format
+CHECKPOINT = '2020-06-30'
+
+
+def _write_ledger(path: str, rows: list) -> str:
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+    return str(path)
+
+
+def _ledger_rows(ledger: str) -> list:
+    with open(ledger, newline='') as f:
+        return list(csv.reader(f))
+
+
+def _capital_gains(ledger: str, fmv_data_file: str, **kwargs) -> list:
+    """Report rows of a ledger, without the header"""
+    report = io.StringIO()
+    CGProcessor.process_all_transactions(
+        transactions_df=TransactionProcessor.initialize_data(ledger, fmv_data_file),
+        output_file=report, overwrite=True, fmv_data_file=fmv_data_file,
+        fmv_audit_file=io.StringIO(), **kwargs)
+    return report.getvalue().splitlines()[1:]
+
+
+@pytest.mark.parametrize('simple_fifo_mode', [True, False])
+def test_resume_reports_the_rows_after_the_checkpoint(
+        ledger, fmv_data_file, tmp_path, simple_fifo_mode):
+    header, *rows = _ledger_rows(ledger)
+    history = _write_ledger(
+        tmp_path / 'history.csv', [header] + [row for row in rows if row[0] <= CHECKPOINT])
+    snapshot_file = str(tmp_path / 'lots.snapshot')
+    _capital_gains(history, fmv_data_file, snapshot_file=snapshot_file,
+                   simple_fifo_mode=simple_fifo_mode)
+
+    resumed = _capital_gains(ledger, fmv_data_file, resume_from=snapshot_file,
+                             simple_fifo_mode=simple_fifo_mode)
+    checkpoint = datetime.strptime(CHECKPOINT, '%Y-%m-%d')
+    replayed = [
+        line for line in _capital_gains(ledger, fmv_data_file, simple_fifo_mode=simple_fifo_mode)
+        if datetime.strptime(next(csv.reader([line]))[2], '%d-%b-%Y') > checkpoint
+    ]
+    assert len(replayed) > 100
+    assert resumed == replayed
+
+
+def test_resume_replays_an_edited_history(ledger, fmv_data_file, tmp_path, caplog):
+    header, *rows = _ledger_rows(ledger)
+    history = _write_ledger(
+        tmp_path / 'history.csv', [header] + [row for row in rows if row[0] <= CHECKPOINT])
+    snapshot_file = str(tmp_path / 'lots.snapshot')
+    _capital_gains(history, fmv_data_file, snapshot_file=snapshot_file)
+
+    # A transaction before the checkpoint at another price
+    edited = next(
+        i for i, row in enumerate(rows) if row[0] <= CHECKPOINT and row[4] != '--')
+    rows[edited][4] = str(float(rows[edited][4]) + 1)
+    edited_ledger = _write_ledger(tmp_path / 'edited.csv', [header] + rows)
+
+    with caplog.at_level(logging.WARNING):
+        resumed = _capital_gains(edited_ledger, fmv_data_file, resume_from=snapshot_file)
+    assert 'replaying the full history' in caplog.text
+    assert resumed == _capital_gains(edited_ledger, fmv_data_file)
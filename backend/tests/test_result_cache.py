@@ -0,0 +1,67 @@
+import io
+import os
+import time
+
+from api.result_cache import ResultCache
+from conftest import submit_job
+
+
+def cache_files(directory) -> list:
+    return sorted(os.path.splitext(name)[1] for name in os.listdir(directory))
+
+
+def test_put_then_get(tmp_path):
+    cache = ResultCache(directory=str(tmp_path))
+    cache.put('key', io.BytesIO(b'result'))
+
+    dest = io.BytesIO()
+    assert cache.get('key', dest)
+    assert dest.getvalue() == b'result'
+    assert not cache.get('other', io.BytesIO())
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+
+def test_failed_put_leaves_no_temporary_file(tmp_path):
+    cache = ResultCache(directory=str(tmp_path / 'cache'))
+    # A result that cannot be read back
+    with open(tmp_path / 'result.zip', 'wb') as result:
+        result.write(b'result')
+        cache.put('key', result)
+
+    assert cache_files(cache.directory) == []
+    assert not cache.get('key', io.BytesIO())
+
+
+def test_eviction_keeps_the_most_recent_results(tmp_path):
+    cache = ResultCache(directory=str(tmp_path), max_bytes=10)
+    for key in ('a', 'b', 'c'):
+        cache.put(key, io.BytesIO(b'12345'))
+        # Distinct modification times
+        time.sleep(0.01)
+
+    assert not cache.get('a', io.BytesIO())
+    assert cache.get('b', io.BytesIO()) and cache.get('c', io.BytesIO())
+    assert cache.stats()['evictions'] == 1
+
+
+def test_job_results_are_cached(app, ledger, monkeypatch, tmp_path):
+    import api.routes
+    cache = ResultCache(directory=str(tmp_path / 'cache'))
+    monkeypatch.setattr(api.routes, 'result_cache', cache)
+    client = app.test_client()
+
+    calculated = submit_job(client, ledger, dict(includeDividends='true'))
+    assert cache_files(cache.directory) == ['.zip']
+    assert submit_job(client, ledger, dict(includeDividends='true')) == calculated
+    assert cache.stats()['hits'] == 1
+
+    # Shared with /calculate
+    with open(ledger, 'rb') as f:
+        response = client.post(
+            '/api/calculate',
+            data=dict(includeDividends='true', transactions_file=(f, 'transactions.csv')),
+            content_type='multipart/form-data'
+        )
+    assert response.data == calculated
+    assert cache.stats()['hits'] == 2
+    assert cache_files(cache.directory) == ['.zip']
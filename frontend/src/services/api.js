@@ -23,3 +23,67 @@ export async function calculateCapitalGains(formData) {
     throw new Error(error.message || "Error Invoking Calculate API");
   }
 }
+
+// Interval between job status polls, in milliseconds
+const JOB_POLL_INTERVAL_MS = 500;
+
+async function errorMessage(response, fallback) {
+  try {
+    const error = await response.json();
+    return error.error || error.message || fallback;
+  } catch {
+    return fallback;
+  }
+}
+
+export async function submitJob(formData) {
+  const response = await fetch(`${API_BASE_URL}/jobs`, {
+    method: "POST",
+    body: formData,
+  });
+
+  if (response.status === 429) {
+    throw new Error(
+      await errorMessage(response, "Server is busy, please retry shortly")
+    );
+  }
+  if (!response.ok) {
+    throw new Error(await errorMessage(response, "Job submission failed"));
+  }
+
+  return response.json(); // { job_id, status, progress, step }
+}
+
+export async function getJobStatus(jobId) {
+  const response = await fetch(`${API_BASE_URL}/jobs/${jobId}`);
+  if (!response.ok) {
+    throw new Error(await errorMessage(response, "Job status unavailable"));
+  }
+  return response.json();
+}
+
+export async function getJobResult(jobId) {
+  const response = await fetch(`${API_BASE_URL}/jobs/${jobId}/result`);
+  if (!response.ok) {
+    throw new Error(await errorMessage(response, "Job result unavailable"));
+  }
+  return response.blob(); // Returns zip file
+}
+
+// Submits a calculation job and polls it to completion, reporting each
+// status ({ status, progress (0-100), step }) to onProgress
+export async function calculateCapitalGainsJob(formData, onProgress) {
+  let job = await submitJob(formData);
+  onProgress?.(job);
+
+  while (job.status === "queued" || job.status === "running") {
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    job = await getJobStatus(job.job_id);
+    onProgress?.(job);
+  }
+
+  if (job.status !== "done") {
+    throw new Error(job.error || "Calculation failed");
+  }
+  return getJobResult(job.job_id);
+}